@@ -1,10 +1,39 @@
 import os
+import queue
+import re
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from pathlib import Path
-from datetime import datetime
+
+from file_scanner import DirectoryScanner, ScanOptions, compile_globs
+from folder_watcher import make_watcher
+from name_index import NameFilter, NameIndex
+from scan_cache import ScanCache
+from virtual_list import VirtualList
+from file_table import FileTable, read_stats
+from file_metadata import MetadataCache, MetadataStore
+from selection import SelectionModel
+from rename_engine import RenameParams, RenamePipeline, NUMBER_FORMATS, PatternError, validate_params
+from rename_presets import PRESET_DIR, PRESET_SUFFIX, load_preset, save_preset
+from phase_timer import PhaseTimer, ProfileCapture
+from preview_worker import PreviewWorker, ROW_CONFLICT, ROW_UNCHANGED, compute_preview
+from rename_planner import list_names
+from rename_executor import DEFAULT_WORKERS, RenameExecutor
+from rename_journal import (RenameJournal, STATUS_CANCELLED, STATUS_COMPLETED, append_marker,
+                            build_resume_plan, build_undo_plan, find_resume_candidate,
+                            find_undo_candidate)
+
+PREVIEW_DELAY_MS = 250  # Пауза в наборе перед пересчетом предпросмотра
+FILTER_DELAY_MS = 100  # Пауза в наборе перед применением фильтра списка
+SORT_HEADINGS = {'name': 'Имя файла', 'size': 'Размер', 'modified': 'Изменен'}  # Столбцы с сортировкой
 
 class FileRenamerApp:
+    REGEX_SCOPE_NAMES = (('name', 'всему имени'),
+                         ('stem', 'имени без расширения'),
+                         ('ext', 'расширению'))
+    
     def __init__(self, root):
         self.root = root
         self.root.title("File Renamer")
@@ -19,8 +48,60 @@ class FileRenamerApp:
         
         # Переменные
         self.folder_path = tk.StringVar()
-        self.files = []
-        self.tree_items = {}  # Словарь для связи id дерева с индексами файлов
+        self.files = FileTable()
+        self.selection = SelectionModel()  # Выбор файлов (индексы как в self.files)
+        
+        # Фоновое сканирование папки
+        self.scanner = DirectoryScanner()
+        self.scan_poll_id = None
+        self.scan_cache = ScanCache.open_default()  # None - кэш недоступен
+        self.scan_finished = False
+        self.scan_root = ''
+        self.scan_options = ScanOptions()
+        self.dir_labels = {}  # папка -> путь относительно scan_root
+        
+        # Фильтр списка: view_rows - номера показанных файлов (None - все);
+        # индекс имен строится при первом запросе и сбрасывается при
+        # переименовании и переупорядочивании файлов
+        self.name_index = None
+        self.name_filter = None
+        self.view_rows = None
+        self.filter_delay_id = None
+        
+        # Сортировка списка (щелчок по заголовку столбца); ключи имен
+        # считаются при добавлении файлов, пересортировка - перестановка строк
+        self.sort_column = 'name'
+        self.sort_reverse = False
+        self.sort_stats_id = None  # Таймер ожидания размеров и дат для сортировки
+        
+        # Слежение за папкой (None - выключено)
+        self.watcher = None
+        self.watch_poll_id = None
+        self.watch_backlog = []  # События, отложенные, пока заняты номера строк (rows_busy)
+        self.own_renames = set()  # (папка, старое, новое) - собственные переименования
+        
+        # Фоновое переименование (None - задание не выполняется)
+        self.rename_cancel_event = None
+        # План построен по номерам строк и ждет подтверждения или запуска
+        self.plan_pending = False
+        
+        # Метаданные для шаблона имени: извлекаются один раз для
+        # предпросмотра, переименование берет их из того же кэша
+        self.metadata_store = MetadataStore(MetadataCache.open_default())
+        
+        # Живой предпросмотр: расчет в фоне, с задержкой после ввода
+        self.preview_worker = PreviewWorker(self.metadata_store)
+        self.preview_result = None
+        self.preview_delay_id = None
+        self.preview_poll_id = None
+        
+        # Замеры этапов (окно «Статистика») и профилирование по запросу;
+        # *_phase - начатый, но еще не завершенный этап
+        self.timings = PhaseTimer()
+        self.profile_capture = ProfileCapture()
+        self.scan_phase = None
+        self.preview_phase = None
+        self.rename_phase = None
         
         # Стили
         self.setup_styles()
@@ -30,6 +111,10 @@ class FileRenamerApp:
         
         # Биндим прокрутку колесиком мыши
         self.bind_mouse_scroll()
+        
+        # Напоминание о прерванном переименовании
+        if find_resume_candidate() is not None:
+            self.update_status("Найдено прерванное переименование. Нажмите «Возобновить», чтобы завершить его.")
     
     def setup_styles(self):
         """Настройка стилей"""
@@ -127,6 +212,53 @@ class FileRenamerApp:
                                       width=15)
         self.deselect_btn.pack(side=tk.LEFT, padx=10)
         
+        self.cancel_scan_btn = ttk.Button(buttons_frame,
+                                         text="Отменить сканирование",
+                                         command=self.cancel_scan,
+                                         width=22,
+                                         state=tk.DISABLED)
+        self.cancel_scan_btn.pack(side=tk.LEFT, padx=10)
+        
+        # Рекурсивный режим: подпапки, глубина, фильтры по именам
+        scan_options_frame = ttk.Frame(folder_frame)
+        scan_options_frame.pack(fill=tk.X, pady=(10, 0))
+        
+        self.recursive_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(scan_options_frame,
+                       text="Включая подпапки",
+                       variable=self.recursive_var).pack(side=tk.LEFT, padx=(0, 10))
+        
+        ttk.Label(scan_options_frame, text="Глубина:").pack(side=tk.LEFT, padx=(0, 5))
+        self.depth_var = tk.IntVar(value=0)
+        ttk.Spinbox(scan_options_frame,
+                   from_=0,
+                   to=99,
+                   textvariable=self.depth_var,
+                   width=5).pack(side=tk.LEFT)
+        ttk.Label(scan_options_frame, text="(0 — без ограничения)").pack(side=tk.LEFT, padx=(5, 20))
+        
+        ttk.Label(scan_options_frame, text="Включить:").pack(side=tk.LEFT, padx=(0, 5))
+        self.include_var = tk.StringVar(value="")
+        ttk.Entry(scan_options_frame, textvariable=self.include_var, width=18).pack(side=tk.LEFT)
+        
+        ttk.Label(scan_options_frame, text="Исключить:").pack(side=tk.LEFT, padx=(10, 5))
+        self.exclude_var = tk.StringVar(value="")
+        ttk.Entry(scan_options_frame, textvariable=self.exclude_var, width=18).pack(side=tk.LEFT)
+        
+        ttk.Label(scan_options_frame, text="(шаблоны через «;», например *.jpg;*.png)").pack(side=tk.LEFT,
+                                                                                         padx=(5, 0))
+        
+        self.lazy_stat_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(scan_options_frame,
+                       text="Быстрый список (размеры в фоне)",
+                       variable=self.lazy_stat_var).pack(side=tk.RIGHT, padx=(10, 0))
+        
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(scan_options_frame,
+                       text="Следить за папкой",
+                       variable=self.watch_var,
+                       command=self.toggle_watch).pack(side=tk.RIGHT)
+        
         # Информация о файлах
         info_frame = ttk.Frame(folder_frame)
         info_frame.pack(fill=tk.X, pady=(10, 0))
@@ -141,45 +273,60 @@ class FileRenamerApp:
         list_frame = ttk.LabelFrame(top_frame, text="Список файлов", padding="5")
         list_frame.pack(fill=tk.BOTH, expand=True, padx=5)
         
-        # Внутренний фрейм для Treeview и скроллбара
-        tree_container = ttk.Frame(list_frame)
-        tree_container.pack(fill=tk.BOTH, expand=True)
-        
-        # Создаем Treeview для отображения файлов
+        # ФИЛЬТР СПИСКА (по индексу имен; Treeview не перестраивается)
+        filter_frame = ttk.Frame(list_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        
+        ttk.Label(filter_frame, text="Фильтр:").pack(side=tk.LEFT, padx=(0, 5))
+        self.filter_var = tk.StringVar(value="")
+        filter_entry = ttk.Entry(filter_frame, textvariable=self.filter_var, width=40)
+        filter_entry.pack(side=tk.LEFT)
+        filter_entry.bind('<Escape>', lambda e: self.filter_var.set(""))
+        
+        self.filter_mode_var = tk.StringVar(value='substring')
+        for text, mode in (("подстрока", 'substring'), ("шаблон", 'glob'), ("рег. выражение", 'regex')):
+            ttk.Radiobutton(filter_frame,
+                           text=text,
+                           variable=self.filter_mode_var,
+                           value=mode).pack(side=tk.LEFT, padx=(10, 0))
+        
+        self.select_matches_btn = ttk.Button(filter_frame,
+                                            text="Выбрать найденные",
+                                            command=self.select_matches,
+                                            width=18,
+                                            state=tk.DISABLED)
+        self.select_matches_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
+        self.filter_label = ttk.Label(filter_frame, text="", font=('Arial', 9))
+        self.filter_label.pack(side=tk.LEFT, padx=(10, 0))
+        
+        self.filter_var.trace_add('write', self.schedule_filter)
+        self.filter_mode_var.trace_add('write', self.schedule_filter)
+        
+        # Виртуальный список: в Treeview только видимые строки, скроллбары внутри
         columns = ('name', 'size', 'modified', 'selected')
-        self.file_tree = ttk.Treeview(tree_container, columns=columns, show='tree headings', selectmode='extended')
+        self.file_tree = VirtualList(list_frame, columns, self.get_file_row)
+        self.file_tree.pack(fill=tk.BOTH, expand=True)
         
         # Настраиваем колонки
         self.file_tree.heading('#0', text='№')
         self.file_tree.column('#0', width=50, stretch=False, anchor='center')
         
-        self.file_tree.heading('name', text='Имя файла')
         self.file_tree.column('name', width=450, anchor='w')
-        
-        self.file_tree.heading('size', text='Размер')
         self.file_tree.column('size', width=100, anchor='center', stretch=False)
-        
-        self.file_tree.heading('modified', text='Изменен')
         self.file_tree.column('modified', width=150, anchor='center', stretch=False)
+        for column in SORT_HEADINGS:
+            self.file_tree.heading(column, command=lambda c=column: self.sort_by(c))
+        self.update_sort_headings()
         
         self.file_tree.heading('selected', text='✓')
         self.file_tree.column('selected', width=50, anchor='center', stretch=False)
         
-        # Полосы прокрутки
-        v_scrollbar = ttk.Scrollbar(tree_container, orient="vertical", command=self.file_tree.yview)
-        h_scrollbar = ttk.Scrollbar(tree_container, orient="horizontal", command=self.file_tree.xview)
-        self.file_tree.configure(yscrollcommand=v_scrollbar.set, xscrollcommand=h_scrollbar.set)
-        
-        # Размещаем Treeview и скроллбары
-        self.file_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
-        h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
-        
-        tree_container.columnconfigure(0, weight=1)
-        tree_container.rowconfigure(0, weight=1)
+        # Цвет для выбранных файлов
+        self.file_tree.tag_configure('selected', background='#e0f7fa')
         
         # Привязываем обработчик выделения
-        self.file_tree.bind('<<TreeviewSelect>>', self.on_tree_select)
+        self.file_tree.bind('<<VirtualListSelect>>', self.on_tree_select)
         
         # Кнопка инвертирования выделения
         list_buttons_frame = ttk.Frame(list_frame)
@@ -214,7 +361,9 @@ class FileRenamerApp:
             ("Добавить суффикс", "suffix"),
             ("Удалить с начала", "remove_start"),
             ("Удалить с конца", "remove_end"),
-            ("Нумерация", "numbering")
+            ("Нумерация", "numbering"),
+            ("Регулярное выражение", "regex"),
+            ("Шаблон", "template")
         ]
         
         for i, (text, mode) in enumerate(modes):
@@ -249,12 +398,150 @@ class FileRenamerApp:
         # Создаем виджеты параметров (изначально для режима replace)
         self.create_param_widgets()
         
+        # ЦЕПОЧКА ПРАВИЛ (несколько режимов за один проход по файлам)
+        self.create_pipeline_widgets(middle_frame)
+        
         # Устанавливаем фиксированную высоту для средней секции
         middle_frame.configure(height=150)
         
         # Добавляем среднюю секцию в панель
         self.main_paned.add(middle_frame, weight=0)  # weight=0 для фиксированной высоты
     
+    def create_pipeline_widgets(self, parent):
+        """Создание панели цепочки правил"""
+        pipeline_frame = ttk.LabelFrame(parent, text="Цепочка правил", padding="8")
+        pipeline_frame.pack(fill=tk.X, padx=5, pady=(10, 0))
+        
+        self.pipeline_rules = []  # RenameParams в порядке применения
+        
+        self.pipeline_listbox = tk.Listbox(pipeline_frame,
+                                           height=4,
+                                           font=('Arial', 9),
+                                           activestyle='none',
+                                           exportselection=False)
+        self.pipeline_listbox.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        buttons = ttk.Frame(pipeline_frame)
+        buttons.pack(side=tk.LEFT, padx=(10, 0))
+        
+        for row, row_buttons in enumerate([
+            [("Добавить режим", self.add_pipeline_rule), ("Удалить", self.remove_pipeline_rule),
+             ("Очистить", self.clear_pipeline)],
+            [("Вверх", lambda: self.move_pipeline_rule(-1)), ("Вниз", lambda: self.move_pipeline_rule(1))],
+            [("Сохранить...", self.save_pipeline_preset), ("Загрузить...", self.load_pipeline_preset)],
+        ]):
+            for column, (text, command) in enumerate(row_buttons):
+                ttk.Button(buttons, text=text, command=command, width=15).grid(row=row, column=column,
+                                                                               padx=2, pady=1)
+        
+        ttk.Label(pipeline_frame,
+                  text="Пока цепочка не пуста,\nпереименование идет по ней",
+                  font=('Arial', 8)).pack(side=tk.LEFT, padx=(10, 0))
+    
+    def describe_rule(self, params):
+        """Краткое описание правила для списка цепочки"""
+        mode = params.mode
+        if mode == "replace":
+            details = f"«{params.old_text}» → «{params.new_text}»"
+        elif mode == "prefix":
+            details = f"«{params.prefix}»"
+        elif mode == "suffix":
+            details = f"«{params.suffix}»"
+        elif mode in ("remove_start", "remove_end"):
+            details = f"{params.remove_count} симв."
+        elif mode == "numbering":
+            details = f"с {params.start}, шаг {params.step}, формат {params.fmt}, «{params.separator}»"
+        elif mode == "regex":
+            scope = dict(self.REGEX_SCOPE_NAMES)[params.regex_scope]
+            details = f"/{params.old_text}/ → «{params.new_text}» ({scope})"
+        elif mode == "template":
+            details = f"«{params.template}», с {params.start}, формат {params.fmt}"
+        else:
+            details = ""
+        return f"{self.get_mode_name(mode)}: {details}"
+    
+    def refresh_pipeline(self, select=None):
+        """Перерисовка списка правил и пересчет предпросмотра"""
+        self.pipeline_listbox.delete(0, tk.END)
+        for number, rule in enumerate(self.pipeline_rules, 1):
+            self.pipeline_listbox.insert(tk.END, f"{number}. {self.describe_rule(rule)}")
+        if select is not None and 0 <= select < len(self.pipeline_rules):
+            self.pipeline_listbox.selection_set(select)
+            self.pipeline_listbox.see(select)
+        self.update_preview()
+    
+    def selected_pipeline_rule(self):
+        selection = self.pipeline_listbox.curselection()
+        return selection[0] if selection else None
+    
+    def add_pipeline_rule(self):
+        """Добавление текущего режима с его параметрами в конец цепочки"""
+        params = self.get_mode_params()
+        if params is None:
+            messagebox.showerror("Ошибка", "Некорректные параметры режима!")
+            return
+        error = validate_params(params)
+        if error:
+            messagebox.showerror("Ошибка", error)
+            return
+        self.pipeline_rules.append(params)
+        self.refresh_pipeline(select=len(self.pipeline_rules) - 1)
+    
+    def remove_pipeline_rule(self):
+        index = self.selected_pipeline_rule()
+        if index is None:
+            return
+        del self.pipeline_rules[index]
+        self.refresh_pipeline(select=min(index, len(self.pipeline_rules) - 1))
+    
+    def move_pipeline_rule(self, offset):
+        """Перемещение выбранного правила вверх или вниз"""
+        index = self.selected_pipeline_rule()
+        if index is None or not 0 <= index + offset < len(self.pipeline_rules):
+            return
+        rules = self.pipeline_rules
+        rules[index], rules[index + offset] = rules[index + offset], rules[index]
+        self.refresh_pipeline(select=index + offset)
+    
+    def clear_pipeline(self):
+        self.pipeline_rules = []
+        self.refresh_pipeline()
+    
+    def save_pipeline_preset(self):
+        """Сохранение цепочки в файл пресета (JSON)"""
+        if not self.pipeline_rules:
+            messagebox.showwarning("Внимание", "Цепочка правил пуста!")
+            return
+        os.makedirs(PRESET_DIR, exist_ok=True)
+        path = filedialog.asksaveasfilename(title="Сохранить пресет",
+                                            initialdir=PRESET_DIR,
+                                            defaultextension=PRESET_SUFFIX,
+                                            filetypes=[("Пресет", f"*{PRESET_SUFFIX}")])
+        if not path:
+            return
+        try:
+            save_preset(RenamePipeline(tuple(self.pipeline_rules)), path)
+        except OSError as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить пресет:\n{e}")
+            return
+        self.update_status(f"Пресет сохранен: {path}")
+    
+    def load_pipeline_preset(self):
+        """Загрузка цепочки из файла пресета"""
+        path = filedialog.askopenfilename(title="Загрузить пресет",
+                                          initialdir=PRESET_DIR if os.path.isdir(PRESET_DIR) else None,
+                                          filetypes=[("Пресет", f"*{PRESET_SUFFIX}")])
+        if not path:
+            return
+        try:
+            pipeline = load_preset(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Ошибка", f"Не удалось загрузить пресет:\n{e}")
+            return
+        self.pipeline_rules = list(pipeline.rules)
+        self.refresh_pipeline()
+        self.update_status(f"Пресет загружен: {path} (правил: {len(self.pipeline_rules)})")
+    
     def create_param_widgets(self):
         """Создание виджетов параметров для разных режимов"""
         # Очищаем контейнер параметров
@@ -269,14 +556,14 @@ class FileRenamerApp:
             row1.pack(fill=tk.X, pady=(0, 5))
             
             ttk.Label(row1, text="Заменить:").pack(side=tk.LEFT, padx=(0, 5))
-            self.old_text = ttk.Entry(row1, width=20)
+            self.old_text_var = tk.StringVar(value="старое")
+            self.old_text = ttk.Entry(row1, textvariable=self.old_text_var, width=20)
             self.old_text.pack(side=tk.LEFT, padx=5)
-            self.old_text.insert(0, "старое")
             
             ttk.Label(row1, text="На:").pack(side=tk.LEFT, padx=(10, 5))
-            self.new_text = ttk.Entry(row1, width=20)
+            self.new_text_var = tk.StringVar(value="новое")
+            self.new_text = ttk.Entry(row1, textvariable=self.new_text_var, width=20)
             self.new_text.pack(side=tk.LEFT, padx=5)
-            self.new_text.insert(0, "новое")
             
             # Вторая строка: чекбокс "Учитывать регистр"
             row2 = ttk.Frame(self.params_container)
@@ -287,17 +574,21 @@ class FileRenamerApp:
                            text="Учитывать регистр",
                            variable=self.case_sensitive).pack(side=tk.LEFT, padx=(0, 0))
             
+            self.watch_params(self.old_text_var, self.new_text_var, self.case_sensitive)
+            
         elif mode == "prefix":
             ttk.Label(self.params_container, text="Префикс:").pack(side=tk.LEFT, padx=(0, 5))
-            self.prefix_text = ttk.Entry(self.params_container, width=30)
+            self.prefix_text_var = tk.StringVar(value="префикс_")
+            self.prefix_text = ttk.Entry(self.params_container, textvariable=self.prefix_text_var, width=30)
             self.prefix_text.pack(side=tk.LEFT, padx=5)
-            self.prefix_text.insert(0, "префикс_")
+            self.watch_params(self.prefix_text_var)
             
         elif mode == "suffix":
             ttk.Label(self.params_container, text="Суффикс:").pack(side=tk.LEFT, padx=(0, 5))
-            self.suffix_text = ttk.Entry(self.params_container, width=30)
+            self.suffix_text_var = tk.StringVar(value="_суффикс")
+            self.suffix_text = ttk.Entry(self.params_container, textvariable=self.suffix_text_var, width=30)
             self.suffix_text.pack(side=tk.LEFT, padx=5)
-            self.suffix_text.insert(0, "_суффикс")
+            self.watch_params(self.suffix_text_var)
             
             ttk.Label(self.params_container, text="(перед расширением)").pack(side=tk.LEFT, padx=(10, 5))
             
@@ -309,6 +600,7 @@ class FileRenamerApp:
                        to=100, 
                        textvariable=self.remove_start_var,
                        width=8).pack(side=tk.LEFT, padx=5)
+            self.watch_params(self.remove_start_var)
             
         elif mode == "remove_end":
             ttk.Label(self.params_container, text="Удалить символов с конца:").pack(side=tk.LEFT, padx=(0, 5))
@@ -318,6 +610,7 @@ class FileRenamerApp:
                        to=100, 
                        textvariable=self.remove_end_var,
                        width=8).pack(side=tk.LEFT, padx=5)
+            self.watch_params(self.remove_end_var)
             
             ttk.Label(self.params_container, text="(перед расширением)").pack(side=tk.LEFT, padx=(10, 5))
             
@@ -350,7 +643,7 @@ class FileRenamerApp:
             self.format_var = tk.StringVar(value="01")
             format_combo = ttk.Combobox(row2,
                                        textvariable=self.format_var,
-                                       values=["1", "01", "001", "0001"],
+                                       values=list(NUMBER_FORMATS),
                                        width=8,
                                        state="readonly")
             format_combo.pack(side=tk.LEFT, padx=5)
@@ -360,6 +653,81 @@ class FileRenamerApp:
             ttk.Entry(row2,
                      textvariable=self.separator_var,
                      width=8).pack(side=tk.LEFT, padx=5)
+            
+            self.watch_params(self.start_num_var, self.step_var, self.format_var, self.separator_var)
+            
+        elif mode == "regex":
+            # Первая строка: выражение и шаблон замены
+            row1 = ttk.Frame(self.params_container)
+            row1.pack(fill=tk.X, pady=(0, 5))
+            
+            ttk.Label(row1, text="Выражение:").pack(side=tk.LEFT, padx=(0, 5))
+            self.regex_pattern_var = tk.StringVar(value=r"(\d+)")
+            ttk.Entry(row1, textvariable=self.regex_pattern_var, width=25).pack(side=tk.LEFT, padx=5)
+            
+            ttk.Label(row1, text="Замена:").pack(side=tk.LEFT, padx=(10, 5))
+            self.regex_template_var = tk.StringVar(value=r"\1")
+            ttk.Entry(row1, textvariable=self.regex_template_var, width=25).pack(side=tk.LEFT, padx=5)
+            
+            ttk.Label(row1, text=r"(группы: \1, \g<имя>)").pack(side=tk.LEFT, padx=(10, 5))
+            
+            # Вторая строка: регистр и часть имени
+            row2 = ttk.Frame(self.params_container)
+            row2.pack(fill=tk.X)
+            
+            self.case_sensitive = tk.BooleanVar(value=True)
+            ttk.Checkbutton(row2,
+                           text="Учитывать регистр",
+                           variable=self.case_sensitive).pack(side=tk.LEFT, padx=(0, 0))
+            
+            ttk.Label(row2, text="Применять к:").pack(side=tk.LEFT, padx=(20, 5))
+            self.regex_scope_var = tk.StringVar(value=self.REGEX_SCOPE_NAMES[0][1])
+            ttk.Combobox(row2,
+                        textvariable=self.regex_scope_var,
+                        values=[title for _, title in self.REGEX_SCOPE_NAMES],
+                        width=28,
+                        state="readonly").pack(side=tk.LEFT, padx=5)
+            
+            self.watch_params(self.regex_pattern_var, self.regex_template_var,
+                              self.case_sensitive, self.regex_scope_var)
+            
+        elif mode == "template":
+            # Первая строка: шаблон имени
+            row1 = ttk.Frame(self.params_container)
+            row1.pack(fill=tk.X, pady=(0, 5))
+            
+            ttk.Label(row1, text="Шаблон:").pack(side=tk.LEFT, padx=(0, 5))
+            self.name_template_var = tk.StringVar(value="{taken:%Y-%m-%d}_{n}{ext}")
+            ttk.Entry(row1, textvariable=self.name_template_var, width=40).pack(side=tk.LEFT, padx=5)
+            
+            ttk.Label(row1, text="Номер с:").pack(side=tk.LEFT, padx=(10, 5))
+            self.template_start_var = tk.IntVar(value=1)
+            ttk.Spinbox(row1,
+                       from_=0,
+                       to=9999,
+                       textvariable=self.template_start_var,
+                       width=6).pack(side=tk.LEFT, padx=5)
+            
+            ttk.Label(row1, text="Формат:").pack(side=tk.LEFT, padx=(10, 5))
+            self.template_format_var = tk.StringVar(value="01")
+            ttk.Combobox(row1,
+                        textvariable=self.template_format_var,
+                        values=list(NUMBER_FORMATS),
+                        width=6,
+                        state="readonly").pack(side=tk.LEFT, padx=5)
+            
+            # Вторая строка: подсказка по полям
+            ttk.Label(self.params_container,
+                      text="{name} {ext} {n}  {mtime:%Y%m%d} {ctime} {size}  {taken:%Y-%m-%d} {camera}  "
+                           "{artist} {title} {album} {track:2}  {hash:8}",
+                      font=('Arial', 8)).pack(fill=tk.X)
+            
+            self.watch_params(self.name_template_var, self.template_start_var, self.template_format_var)
+    
+    def watch_params(self, *variables):
+        """Пересчет предпросмотра при изменении параметров"""
+        for variable in variables:
+            variable.trace_add('write', self.schedule_preview)
     
     def create_bottom_section(self):
         """Создание нижней секции с предпросмотром и кнопкой переименования"""
@@ -369,16 +737,45 @@ class FileRenamerApp:
         preview_frame = ttk.LabelFrame(bottom_frame, text="Предпросмотр изменений", padding="8")
         preview_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=(0, 10))
         
-        self.preview_text = scrolledtext.ScrolledText(preview_frame, 
-                                                     font=('Courier New', 9),
-                                                     wrap=tk.WORD,
-                                                     height=6)  # Маленькая высота по умолчанию
-        self.preview_text.pack(fill=tk.BOTH, expand=True)
+        self.preview_summary = ttk.Label(preview_frame, text="", font=('Arial', 9), justify=tk.LEFT)
+        self.preview_summary.pack(fill=tk.X, pady=(0, 5))
+        
+        # Таблица "старое -> новое" по всему выбору (тоже виртуальная)
+        self.preview_list = VirtualList(preview_frame, ('old', 'new', 'note'), self.get_preview_row)
+        self.preview_list.tree.configure(height=6)  # Маленькая высота по умолчанию
+        self.preview_list.pack(fill=tk.BOTH, expand=True)
+        
+        self.preview_list.heading('#0', text='№')
+        self.preview_list.column('#0', width=50, stretch=False, anchor='center')
+        self.preview_list.heading('old', text='Старое имя')
+        self.preview_list.column('old', width=350, anchor='w')
+        self.preview_list.heading('new', text='Новое имя')
+        self.preview_list.column('new', width=350, anchor='w')
+        self.preview_list.heading('note', text='Примечание')
+        self.preview_list.column('note', width=200, anchor='w')
+        
+        # Неизменяемые имена - серым, конфликты - красным
+        self.preview_list.tag_configure('unchanged', foreground='#888888')
+        self.preview_list.tag_configure('conflict', background='#ffd6d6')
         
         # КНОПКА ПЕРЕИМЕНОВАНИЯ (под предпросмотром, больше ничего нет)
         rename_frame = ttk.Frame(bottom_frame)
         rename_frame.pack(fill=tk.X, padx=5, pady=(0, 5))
         
+        # Прогресс фонового переименования
+        self.progress_bar = ttk.Progressbar(rename_frame, mode='determinate', length=250)
+        self.progress_bar.pack(side=tk.LEFT)
+        
+        self.cancel_rename_btn = ttk.Button(rename_frame,
+                                           text="Отмена",
+                                           command=self.cancel_rename_job,
+                                           width=10,
+                                           state=tk.DISABLED)
+        self.cancel_rename_btn.pack(side=tk.LEFT, padx=(10, 0))
+        
+        self.progress_label = ttk.Label(rename_frame, text="", font=('Arial', 9))
+        self.progress_label.pack(side=tk.LEFT, padx=(10, 0))
+        
         # Пустое пространство слева для выравнивания кнопки вправо
         ttk.Label(rename_frame, text="").pack(side=tk.LEFT, fill=tk.X, expand=True)
         
@@ -390,6 +787,15 @@ class FileRenamerApp:
                                     state=tk.DISABLED)
         self.rename_btn.pack(side=tk.RIGHT)
         
+        # Количество параллельных переименований (важно для сетевых папок)
+        self.workers_var = tk.IntVar(value=DEFAULT_WORKERS)
+        ttk.Spinbox(rename_frame,
+                   from_=1,
+                   to=64,
+                   textvariable=self.workers_var,
+                   width=5).pack(side=tk.RIGHT, padx=(0, 10))
+        ttk.Label(rename_frame, text="Потоков:").pack(side=tk.RIGHT, padx=(0, 5))
+        
         # СТАТУС БАР
         status_frame = ttk.Frame(bottom_frame)
         status_frame.pack(fill=tk.X, padx=5, pady=(5, 0))
@@ -406,6 +812,16 @@ class FileRenamerApp:
                   command=self.show_stats,
                   width=12).pack(side=tk.RIGHT)
         
+        # Откат и возобновление по журналу переименований
+        ttk.Button(status_frame,
+                  text="Возобновить",
+                  command=self.resume_interrupted,
+                  width=12).pack(side=tk.RIGHT, padx=(0, 10))
+        ttk.Button(status_frame,
+                  text="Откатить",
+                  command=self.undo_last,
+                  width=12).pack(side=tk.RIGHT, padx=(0, 10))
+        
         # Добавляем нижнюю секцию в панель
         self.main_paned.add(bottom_frame, weight=1)
     
@@ -417,89 +833,469 @@ class FileRenamerApp:
             self.load_files()
     
     def load_files(self):
-        """Загрузка списка файлов из папки"""
+        """Загрузка списка файлов из папки (сканирование в фоне)"""
         folder = self.folder_path.get()
         if not folder or not os.path.isdir(folder):
             messagebox.showerror("Ошибка", "Укажите существующую папку!")
             return
         
+        if self.rows_busy():
+            messagebox.showwarning("Внимание", "Дождитесь окончания переименования!")
+            return
+        
         try:
-            self.files = []
-            self.tree_items = {}
-            
-            # Получаем все файлы из папки
-            for item in sorted(os.listdir(folder)):
-                item_path = os.path.join(folder, item)
-                if os.path.isfile(item_path):
-                    # Получаем информацию о файле
-                    stat = os.stat(item_path)
-                    size = self.format_size(stat.st_size)
-                    modified = datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M")
-                    
-                    self.files.append({
-                        'name': item,
-                        'path': item_path,
-                        'size': size,
-                        'modified': modified,
-                        'selected': False,
-                        'tree_id': None
-                    })
-            
-            self.update_file_list()
+            options = self.get_scan_options()
+        except tk.TclError:
+            messagebox.showerror("Ошибка", "Некорректная глубина сканирования!")
+            return
+        
+        # Новое сканирование отменяет предыдущее
+        self.stop_watch()
+        self.scan_options = options
+        self.files = FileTable()
+        self.files.add_dir(folder)
+        self.name_index = None
+        self.cancel_sort_stats()
+        self.scan_root = folder
+        self.dir_labels = {}
+        self.scan_finished = False
+        self.selection.reset()
+        self.update_file_list()
+        self.scan_phase = self.timings.begin('load_files')
+        self.scanner.start(folder, options, self.scan_cache)
+        self.cancel_scan_btn.config(state=tk.NORMAL)
+        self.update_status("Сканирование папки...")
+        
+        if self.scan_poll_id is None:
+            self.scan_poll_id = self.root.after(50, self.poll_scan)
+    
+    def get_scan_options(self):
+        """Параметры сканирования из виджетов"""
+        def globs(text):
+            return tuple(p.strip() for p in text.split(';') if p.strip())
+        
+        return ScanOptions(recursive=self.recursive_var.get(),
+                           max_depth=max(0, self.depth_var.get()),
+                           include=globs(self.include_var.get()),
+                           exclude=globs(self.exclude_var.get()),
+                           lazy_stat=self.lazy_stat_var.get())
+    
+    def poll_scan(self):
+        """Прием пачек от фонового сканирования (по таймеру after)"""
+        self.scan_poll_id = None
+        
+        # Во время переименования номера строк заняты заданием: пачки и
+        # завершение (сортировка) ждут в очереди сканера
+        if self.rows_busy():
+            self.scan_poll_id = self.root.after(100, self.poll_scan)
+            return
+        
+        # Пачки принимаются, пока не исчерпан бюджет времени такта
+        deadline = time.perf_counter() + 0.03
+        while time.perf_counter() < deadline:
+            messages = self.scanner.poll(max_messages=1)
+            if not messages:
+                break
+            kind, scan_id, payload = messages[0]
+            if kind == 'batch':
+                self.add_scanned_files(payload)
+                self.update_status(f"Сканирование папки... найдено файлов: {len(self.files)}")
+            elif kind == 'done':
+                self.finish_scan()
+            elif kind == 'update':
+                self.apply_stat_updates(payload)
+            elif kind == 'revalidated':
+                if payload:
+                    self.update_status(f"Список обновлен по диску: изменилось файлов: {payload}")
+            elif kind == 'error':
+                self.finish_scan()
+                messagebox.showerror("Ошибка", f"Не удалось загрузить файлы:\n{payload}")
+                return
+        
+        if self.scanner.is_running() or not self.scanner.messages.empty():
+            self.scan_poll_id = self.root.after(50, self.poll_scan)
+    
+    def add_scanned_files(self, groups):
+        """Добавление пачки найденных файлов в список"""
+        # Сырые размеры и даты; строки для показа форматируются лениво
+        start = len(self.files)
+        for directory, entries in groups:
+            self.files.extend(entries, self.files.add_dir(directory))
+        self.selection.resize(len(self.files))
+        self.extend_view(start)
+        
+        # Строки материализуются только при попадании в область видимости
+        self.file_tree.set_count(self.view_count())
+        self.file_count_label.config(text=f"Файлов: {len(self.files)}")
+    
+    def apply_stat_updates(self, groups):
+        """Новые размеры и даты файлов после фоновой перепроверки кэша"""
+        for directory, entries in groups:
+            for entry in entries:
+                index = self.files.find(directory, entry.name)
+                if index is not None:
+                    self.files.update_stat(index, entry.size, entry.mtime)
+        self.file_tree.refresh()
+    
+    def finish_scan(self):
+        """Завершение сканирования: сортировка и окончательный список"""
+        self.scan_finished = True
+        self.cancel_scan_btn.config(state=tk.DISABLED)
+        # Сортировка по выбранному столбцу (по умолчанию - по папке, затем
+        # по имени); выбор, сделанный во время сканирования, сохраняется
+        self.apply_sort()
+        self.update_selection_state()
+        dirs = self.files.dirs
+        if len(dirs) > 1:
+            self.update_status(f"Загружено файлов: {len(self.files)} в папках: {len(dirs)}")
+        else:
             self.update_status(f"Загружено файлов: {len(self.files)}")
+        if self.scan_phase is not None:
+            # От нажатия «Загрузить» до отсортированного списка
+            self.timings.end(self.scan_phase, len(self.files))
+            self.scan_phase = None
+        if self.watch_var.get():
+            self.start_watch()
+    
+    def cancel_scan(self):
+        """Отмена фонового сканирования"""
+        self.scanner.cancel()
+        self.scan_phase = None
+        self.scan_finished = True  # Новых пачек не будет - частичный список можно переименовать
+        self.cancel_scan_btn.config(state=tk.DISABLED)
+        self.update_selection_state()
+        if self.scan_poll_id is not None:
+            self.root.after_cancel(self.scan_poll_id)
+            self.scan_poll_id = None
+        self.update_status(f"Сканирование отменено. Загружено файлов: {len(self.files)}")
+    
+    def sort_by(self, column):
+        """Щелчок по заголовку: сортировка по столбцу, повторный щелчок - обратный порядок"""
+        if not self.scan_finished or self.rows_busy():
+            return  # Номера строк заняты сканированием или переименованием
+        if column == self.sort_column:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column, self.sort_reverse = column, False
+        self.update_sort_headings()
+        self.apply_sort()
+    
+    def update_sort_headings(self):
+        """Стрелка направления у заголовка текущей сортировки"""
+        for column, text in SORT_HEADINGS.items():
+            if column == self.sort_column:
+                text += " ▼" if self.sort_reverse else " ▲"
+            self.file_tree.heading(column, text=text)
+    
+    def apply_sort(self):
+        """Переупорядочивание таблицы по текущей сортировке
+        
+        Строки и выбор переставляются одной перестановкой, поэтому
+        выбранные файлы остаются выбранными, а нумерация идет в новом
+        порядке списка. Для сортировки по размеру или дате в ленивом
+        режиме недостающие значения сначала читаются в фоне.
+        """
+        self.cancel_sort_stats()
+        if self.sort_column != 'name':
+            missing = self.files.missing_stats()
+            if missing:
+                self.fetch_sort_stats(missing)
+                return
+        with self.timings.measure('sort', len(self.files)):
+            order = self.files.sort_order(self.sort_column, self.sort_reverse)
+            self.files.permute(order)
+            self.selection.permute(order)
+            self.name_index = None
+            self.update_file_list()
+        if self.selection.count:
+            self.update_preview()
+    
+    def fetch_sort_stats(self, missing):
+        """Чтение размеров и дат для сортировки в фоновом потоке"""
+        files = self.files
+        keys = [(files.dir_of(i), files.names[i]) for i in missing]
+        results = queue.Queue()
+        threading.Thread(target=lambda: results.put(read_stats(os.path.join(d, n) for d, n in keys)),
+                         daemon=True).start()
+        self.update_status(f"Чтение размеров и дат для сортировки: {len(keys)} файл(ов)...")
+        self.sort_stats_id = self.root.after(100, self.poll_sort_stats, files, keys, results)
+    
+    def poll_sort_stats(self, files, keys, results):
+        self.sort_stats_id = None
+        try:
+            stats = results.get_nowait()
+        except queue.Empty:
+            self.sort_stats_id = self.root.after(100, self.poll_sort_stats, files, keys, results)
+            return
+        if files is not self.files or self.rows_busy():
+            return  # Список перечитан или занят переименованием
+        # Строки могли сдвинуться (слежение за папкой) - поиск по имени
+        for (directory, name), st in zip(keys, stats):
+            index = files.find(directory, name)
+            if index is not None:
+                files.store_stat(index, st)
+        self.apply_sort()
+        self.update_status(f"Файлов: {len(files)}, сортировка: {SORT_HEADINGS[self.sort_column].lower()}")
+    
+    def cancel_sort_stats(self):
+        if self.sort_stats_id is not None:
+            self.root.after_cancel(self.sort_stats_id)
+            self.sort_stats_id = None
+    
+    def toggle_watch(self):
+        """Включение и выключение слежения за папкой"""
+        if not self.watch_var.get():
+            self.stop_watch()
+            self.update_status("Слежение за папкой выключено")
+        elif self.files.dirs and self.scan_finished:
+            self.start_watch()
+    
+    def start_watch(self):
+        """Слежение за папками списка: изменения применяются без пересканирования"""
+        self.stop_watch()
+        include = compile_globs(self.scan_options.include)
+        exclude = compile_globs(self.scan_options.exclude)
+        
+        def accept(name):
+            name = os.path.normcase(name)
+            return ((include is None or include.match(name) is not None)
+                    and (exclude is None or exclude.match(name) is None))
+        
+        self.watcher = make_watcher(self.files.dirs, accept)
+        self.watcher.start()
+        self.watch_poll_id = self.root.after(300, self.poll_watch)
+        self.update_status(f"Слежение за папкой ({self.watcher.kind}), файлов: {len(self.files)}")
+    
+    def stop_watch(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        if self.watch_poll_id is not None:
+            self.root.after_cancel(self.watch_poll_id)
+            self.watch_poll_id = None
+        self.watch_backlog = []
+    
+    def poll_watch(self):
+        """Прием событий слежения (по таймеру after)"""
+        self.watch_poll_id = None
+        if self.watcher is None:
+            return
+        self.watch_backlog.extend(self.watcher.poll())
+        # Пока номера строк заняты планом или заданием - события ждут
+        if not self.rows_busy() and self.watch_backlog:
+            events, self.watch_backlog = self.watch_backlog, []
+            self.apply_watch_events(events)
+        if self.watcher is not None:
+            self.watch_poll_id = self.root.after(300, self.poll_watch)
+    
+    def apply_watch_events(self, events):
+        """Точечное обновление списка по событиям; выбор сохраняется"""
+        files = self.files
+        to_remove = set()
+        added = 0
+        renamed = False
+        
+        for kind, directory, name, entry in events:
+            if kind == 'rescan':
+                # Очередь событий ядра переполнена - только полное перечитывание
+                self.load_files()
+                return
+            if kind == 'gone':
+                self.stop_watch()
+                self.watch_var.set(False)
+                self.update_status(f"Папка удалена или перемещена: {directory}")
+                return
+            if kind == 'renamed' and (directory, name, entry.name) in self.own_renames:
+                self.own_renames.discard((directory, name, entry.name))
+                continue
             
-        except Exception as e:
-            messagebox.showerror("Ошибка", f"Не удалось загрузить файлы:\n{str(e)}")
+            index = files.find(directory, name)
+            if kind == 'removed':
+                if index is not None:
+                    to_remove.add(index)
+                continue
+            
+            if kind == 'renamed':
+                target = files.find(directory, entry.name)
+                if index is None:
+                    # Файл пришел из-под фильтра или из другой папки
+                    index = target
+                elif target is not None and target != index:
+                    to_remove.add(target)  # Переименован поверх другого файла
+                    files.rename(index, entry.name)
+                    renamed = True
+                else:
+                    files.rename(index, entry.name)
+                    renamed = True
+            
+            if index is None:
+                files.append(entry.name, entry.size, entry.mtime, files.add_dir(directory))
+                added += 1
+            else:
+                files.update_stat(index, entry.size, entry.mtime)
+                to_remove.discard(index)
+        
+        if added:
+            self.selection.resize(len(files))
+        if to_remove:
+            self.selection.permute(files.remove(to_remove))
+            self.file_tree.selection_clear()
+        
+        # Новые файлы дописываются в индекс фильтра, иначе он строится заново
+        if to_remove or renamed:
+            self.name_index = None
+            self.refresh_view()
+        else:
+            self.extend_view(len(files) - added)
+            # Видимые строки перерисовываются целиком - их немного
+            self.file_tree.set_count(self.view_count())
+        self.selection.take_changes()
+        self.file_count_label.config(text=f"Файлов: {len(files)}")
+        self.update_selection_state()
+        if self.selection.count:
+            self.schedule_preview()
+        self.update_status(f"Слежение за папкой: +{added} / -{len(to_remove)} файл(ов), всего {len(files)}")
     
     def update_file_list(self):
-        """Обновление списка файлов в Treeview"""
-        # Очищаем Treeview
-        for item in self.file_tree.get_children():
-            self.file_tree.delete(item)
-        
-        self.tree_items = {}
-        
-        # Добавляем файлы
-        for i, file_info in enumerate(self.files):
-            values = (
-                file_info['name'],
-                file_info['size'],
-                file_info['modified'],
-                '✓' if file_info['selected'] else ''
-            )
-            
-            item_id = self.file_tree.insert('', 'end', 
-                                          text=str(i+1),
-                                          values=values)
-            
-            # Сохраняем связь
-            self.tree_items[item_id] = i
-            file_info['tree_id'] = item_id
-            
-            # Настраиваем цвет для выбранных
-            if file_info['selected']:
-                self.file_tree.item(item_id, tags=('selected',))
-            else:
-                self.file_tree.item(item_id, tags=())
-        
-        # Настраиваем теги для выделения
-        self.file_tree.tag_configure('selected', background='#e0f7fa')
-        
-        # Обновляем счетчики
-        self.file_count_label.config(text=f"Файлов: {len(self.files)}")
-        selected_count = sum(1 for f in self.files if f['selected'])
+        """Обновление списка файлов (перерисовываются только видимые строки)"""
+        with self.timings.measure('update_file_list', len(self.files)):
+            self.file_tree.selection_clear()
+            self.refresh_view()
+            self.selection.take_changes()
+            
+            self.file_count_label.config(text=f"Файлов: {len(self.files)}")
+            self.update_selection_state()
+    
+    def apply_selection_changes(self):
+        """Перерисовка только изменившихся строк и обновление счетчиков"""
+        self.refresh_file_rows(self.selection.take_changes())
+        self.update_selection_state()
+        self.update_preview()
+    
+    def schedule_filter(self, *args):
+        """Отложенное применение фильтра (нажатия клавиш объединяются)"""
+        if self.filter_delay_id is not None:
+            self.root.after_cancel(self.filter_delay_id)
+        self.filter_delay_id = self.root.after(FILTER_DELAY_MS, self.apply_filter)
+    
+    def apply_filter(self):
+        """Новый запрос фильтра: в списке остаются только совпадения"""
+        self.filter_delay_id = None
+        text = self.filter_var.get()
+        if not text:
+            self.name_filter = None
+        else:
+            try:
+                self.name_filter = NameFilter(text, self.filter_mode_var.get())
+            except re.error as e:
+                # Ошибка видна сразу, без диалогов во время набора; список не меняется
+                self.filter_label.config(text=f"Ошибка в выражении: {e}")
+                return
+        self.file_tree.selection_clear()
+        self.file_tree.scroll_to(0)
+        self.refresh_view()
+    
+    def refresh_view(self):
+        """Пересчет показанных строк по фильтру; Treeview получает только новое количество"""
+        if self.name_filter is None:
+            self.view_rows = None
+        else:
+            with self.timings.measure('filter', len(self.files)):
+                if self.name_index is None:
+                    self.name_index = NameIndex(self.files.names)
+                self.view_rows = self.name_index.search(self.name_filter)
+        self.file_tree.set_count(self.view_count())
+        self.update_filter_label()
+    
+    def extend_view(self, start):
+        """Файлы, добавленные в конец таблицы с номера start: в индекс и, если подходят, в список"""
+        if self.name_index is None:
+            return  # Индекс еще не нужен - будет построен при первом запросе
+        self.name_index.extend(self.files.names[start:])
+        if self.name_filter is not None:
+            self.view_rows.extend(self.name_index.search(self.name_filter, start))
+            self.update_filter_label()
+    
+    def update_filter_label(self):
+        if self.view_rows is None:
+            self.filter_label.config(text="")
+            self.select_matches_btn.config(state=tk.DISABLED)
+        else:
+            self.filter_label.config(text=f"Найдено: {len(self.view_rows)}")
+            self.select_matches_btn.config(state=tk.NORMAL if self.view_rows else tk.DISABLED)
+    
+    def view_count(self):
+        """Количество строк в списке (с учетом фильтра)"""
+        return len(self.files) if self.view_rows is None else len(self.view_rows)
+    
+    def file_index(self, row):
+        """Номер файла в таблице для строки списка"""
+        return row if self.view_rows is None else self.view_rows[row]
+    
+    def refresh_file_rows(self, changed):
+        """Перерисовка видимых строк изменившихся файлов (changed - номера файлов, None - все)"""
+        if changed is not None and self.view_rows is not None:
+            view_rows = self.view_rows
+            changed = {row for row in self.file_tree.visible_range() if view_rows[row] in changed}
+        self.file_tree.refresh_rows(changed)
+    
+    def select_matches(self):
+        """Выбрать ровно файлы, подходящие под фильтр"""
+        if not self.view_rows:
+            return
+        mask = bytearray(len(self.files))
+        for index in self.view_rows:
+            mask[index] = 1
+        self.selection.apply_mask(mask, 'set')
+        self.apply_selection_changes()
+        self.update_status(f"Выбрано найденных файлов: {self.selection.count}")
+    
+    def rows_busy(self):
+        """Номера строк заняты планом или заданием: список нельзя сдвигать"""
+        return self.rename_cancel_event is not None or self.plan_pending
+    
+    def update_selection_state(self):
+        """Обновление счетчика выбранных и кнопок за O(1)"""
+        selected_count = self.selection.count
         self.selected_count_label.config(text=f"Выбрано: {selected_count}")
         
-        # Обновляем состояние кнопок
+        # Обновляем состояние кнопок (во время сканирования и переименования запуск недоступен)
         if selected_count > 0:
             self.confirm_selection_btn.config(state=tk.NORMAL)
-            self.rename_btn.config(state=tk.NORMAL)
+            self.rename_btn.config(state=tk.NORMAL if not self.rows_busy() and self.scan_finished
+                                   else tk.DISABLED)
             self.rename_btn.config(text=f"ПЕРЕИМЕНОВАТЬ ({selected_count})")
         else:
             self.confirm_selection_btn.config(state=tk.DISABLED)
             self.rename_btn.config(state=tk.DISABLED)
             self.rename_btn.config(text="ПЕРЕИМЕНОВАТЬ")
     
+    def get_file_row(self, row):
+        """Данные строки row виртуального списка (с фильтром - не номер файла)"""
+        i = self.file_index(row)
+        # Размер и дата читаются (в ленивом режиме) и форматируются только для видимых строк
+        self.files.fetch_stat(i)
+        is_selected = self.selection.is_selected(i)
+        values = (
+            self.display_name(self.files.dir_of(i), self.files.names[i]),
+            self.files.display_size(i),
+            self.files.display_mtime(i),
+            '✓' if is_selected else ''
+        )
+        
+        # Настраиваем цвет для выбранных
+        tags = ('selected',) if is_selected else ()
+        return str(i+1), values, tags
+    
+    def display_name(self, directory, name):
+        """Имя файла с путем папки относительно выбранной (общий список дерева)"""
+        label = self.dir_labels.get(directory)
+        if label is None:
+            label = os.path.relpath(directory, self.scan_root) if self.scan_root else directory
+            label = '' if label == os.curdir else label
+            self.dir_labels[directory] = label
+        return os.path.join(label, name) if label else name
+    
     def on_tree_select(self, event):
         """Обработчик выделения в Treeview"""
         selected_items = self.file_tree.selection()
@@ -510,229 +1306,525 @@ class FileRenamerApp:
     
     def confirm_selection(self):
         """Подтвердить выделение (после выбора через Ctrl/Shift)"""
-        selected_items = self.file_tree.selection()
-        
-        # Сначала снимаем выделение со всех
-        for file_info in self.files:
-            file_info['selected'] = False
-        
-        # Затем отмечаем выбранные
-        for item_id in selected_items:
-            if item_id in self.tree_items:
-                index = self.tree_items[item_id]
-                self.files[index]['selected'] = True
-        
-        self.update_file_list()
-        self.update_preview()
-        self.update_status(f"Выбрано файлов: {sum(1 for f in self.files if f['selected'])}")
-    
-    def format_size(self, size_bytes):
-        """Форматирование размера файла"""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size_bytes < 1024.0:
-                return f"{size_bytes:.1f} {unit}"
-            size_bytes /= 1024.0
-        return f"{size_bytes:.1f} TB"
+        # Выбранными становятся ровно выделенные строки
+        self.selection.set_only(map(self.file_index, self.file_tree.selection()))
+        self.apply_selection_changes()
+        self.update_status(f"Выбрано файлов: {self.selection.count}")
     
     def select_all(self):
         """Выбрать все файлы"""
-        for file_info in self.files:
-            file_info['selected'] = True
-        self.update_file_list()
-        self.update_preview()
+        self.selection.select_all()
+        self.apply_selection_changes()
     
     def deselect_all(self):
         """Снять выделение со всех файлов"""
-        for file_info in self.files:
-            file_info['selected'] = False
-        self.update_file_list()
-        self.update_preview()
+        self.selection.deselect_all()
+        self.apply_selection_changes()
     
     def invert_selection(self):
         """Инвертировать выделение"""
-        for file_info in self.files:
-            file_info['selected'] = not file_info['selected']
-        self.update_file_list()
-        self.update_preview()
+        self.selection.invert()
+        self.apply_selection_changes()
     
     def on_mode_change(self):
         """Обработчик изменения режима"""
         self.create_param_widgets()
         self.update_preview()
     
-    def generate_new_name(self, filename, index=None):
-        """Генерация нового имени файла"""
-        name, ext = os.path.splitext(filename)
+    def get_rename_params(self):
+        """Параметры переименования: цепочка правил или текущий режим"""
+        if self.pipeline_rules:
+            return RenamePipeline(tuple(self.pipeline_rules))
+        return self.get_mode_params()
+    
+    def get_mode_params(self):
+        """Однократное чтение параметров режима из виджетов"""
         mode = self.rename_mode.get()
         
         try:
             if mode == "replace":
-                old = self.old_text.get()
-                new = self.new_text.get()
-                if old:
-                    if self.case_sensitive.get():
-                        return filename.replace(old, new)
-                    else:
-                        # Без учета регистра
-                        import re
-                        return re.sub(re.escape(old), new, filename, flags=re.IGNORECASE)
-                    
+                return RenameParams(mode=mode,
+                                    old_text=self.old_text.get(),
+                                    new_text=self.new_text.get(),
+                                    case_sensitive=self.case_sensitive.get())
             elif mode == "prefix":
-                prefix = self.prefix_text.get()
-                return prefix + filename
-                
+                return RenameParams(mode=mode, prefix=self.prefix_text.get())
             elif mode == "suffix":
-                suffix = self.suffix_text.get()
-                return name + suffix + ext
-                
+                return RenameParams(mode=mode, suffix=self.suffix_text.get())
             elif mode == "remove_start":
-                count = self.remove_start_var.get()
-                if count < len(filename):
-                    return filename[count:]
-                else:
-                    return ext if ext else filename
-                
+                return RenameParams(mode=mode, remove_count=self.remove_start_var.get())
             elif mode == "remove_end":
-                count = self.remove_end_var.get()
-                if count < len(name):
-                    return name[:-count] + ext
-                else:
-                    return ext
-                    
-            elif mode == "numbering" and index is not None:
-                # Нумерация только для выбранных файлов
-                selected_files = [f for f in self.files if f['selected']]
-                if filename in [f['name'] for f in selected_files]:
-                    file_index = [f['name'] for f in selected_files].index(filename)
-                    start = self.start_num_var.get()
-                    step = self.step_var.get()
-                    fmt = self.format_var.get()
-                    sep = self.separator_var.get()
-                    
-                    num = start + (file_index * step)
-                    num_str = f"{num:{fmt}}"
-                    return f"{num_str}{sep}{filename}"
-                
-        except Exception as e:
-            print(f"Error generating new name: {e}")
-            
-        return filename
+                return RenameParams(mode=mode, remove_count=self.remove_end_var.get())
+            elif mode == "numbering":
+                return RenameParams(mode=mode,
+                                    start=self.start_num_var.get(),
+                                    step=self.step_var.get(),
+                                    fmt=self.format_var.get(),
+                                    separator=self.separator_var.get())
+            elif mode == "regex":
+                scope_title = self.regex_scope_var.get()
+                scope = next(key for key, title in self.REGEX_SCOPE_NAMES if title == scope_title)
+                return RenameParams(mode=mode,
+                                    old_text=self.regex_pattern_var.get(),
+                                    new_text=self.regex_template_var.get(),
+                                    case_sensitive=self.case_sensitive.get(),
+                                    regex_scope=scope)
+            elif mode == "template":
+                return RenameParams(mode=mode,
+                                    template=self.name_template_var.get(),
+                                    start=self.template_start_var.get(),
+                                    fmt=self.template_format_var.get())
+        except tk.TclError as e:
+            # Например, пустое или нечисловое поле счетчика; вызывающий код показывает свое сообщение
+            self.update_status(f"Некорректные параметры режима: {e}")
+        
+        return None
+    
+    def schedule_preview(self, *args):
+        """Отложенный пересчет предпросмотра (нажатия клавиш объединяются)"""
+        if self.preview_delay_id is not None:
+            self.root.after_cancel(self.preview_delay_id)
+        self.preview_delay_id = self.root.after(PREVIEW_DELAY_MS, self.update_preview)
     
     def update_preview(self):
-        """Обновление предпросмотра изменений"""
-        self.preview_text.delete(1.0, tk.END)
-        
-        selected_files = [f for f in self.files if f['selected']]
-        if not selected_files:
-            self.preview_text.insert(tk.END, "Нет выбранных файлов для предпросмотра\n")
-            self.preview_text.insert(tk.END, "Выделите файлы в списке и нажмите 'Подтвердить выделение'")
+        """Обновление предпросмотра изменений (расчет в фоновом потоке)"""
+        if self.preview_delay_id is not None:
+            self.root.after_cancel(self.preview_delay_id)
+            self.preview_delay_id = None
+        
+        selected_count = self.selection.count
+        if not selected_count:
+            self.show_preview_message("Нет выбранных файлов для предпросмотра\n"
+                                      "Выделите файлы в списке и нажмите 'Подтвердить выделение'")
             return
         
-        self.preview_text.insert(tk.END, f"БУДЕТ ПЕРЕИМЕНОВАНО: {len(selected_files)} файл(ов)\n")
-        self.preview_text.insert(tk.END, "="*70 + "\n\n")
+        params = self.get_rename_params()
+        if params is None:
+            self.show_preview_message("Некорректные параметры режима")
+            return
         
-        for i, file_info in enumerate(selected_files[:10]):
-            old_name = file_info['name']
-            new_name = self.generate_new_name(old_name, i)
-            
-            self.preview_text.insert(tk.END, f"{i+1:3}. {old_name}\n")
-            self.preview_text.insert(tk.END, f"     -> {new_name}\n")
-            
-            if old_name == new_name:
-                self.preview_text.insert(tk.END, f"     (имя не изменится)\n")
-            
-            self.preview_text.insert(tk.END, "\n")
+        # План строится по всему выбору, чтобы показать коллизии до запуска;
+        # поток получает снимок таблицы, а устаревший расчет прерывается
+        self.preview_worker.submit(params, list(self.selection.iter_selected()), self.files.snapshot())
+        self.preview_phase = self.timings.begin('update_preview', selected_count)
+        self.preview_summary.config(text=f"Расчет предпросмотра для {selected_count} файл(ов)...")
+        if self.preview_poll_id is None:
+            self.preview_poll_id = self.root.after(50, self.poll_preview)
+    
+    def poll_preview(self):
+        """Прием готового предпросмотра (по таймеру after)"""
+        self.preview_poll_id = None
+        result = self.preview_worker.poll()
+        if result is None:
+            progress = self.preview_worker.progress
+            if progress is not None:
+                self.preview_summary.config(text=f"Чтение метаданных файлов: {progress[0]} из {progress[1]}...")
+            self.preview_poll_id = self.root.after(50, self.poll_preview)
+            return
         
-        if len(selected_files) > 10:
-            self.preview_text.insert(tk.END, f"\n... и еще {len(selected_files) - 10} файлов\n")
+        if isinstance(result, PatternError):
+            # Ошибка в выражении видна сразу, без диалогов во время набора
+            self.show_preview_message(str(result))
+            return
+        if isinstance(result, Exception):
+            self.show_preview_message(f"Ошибка предпросмотра: {result}")
+            return
         
-        self.update_status(f"Предпросмотр для {len(selected_files)} выбранных файлов")
+        if self.preview_phase is not None:
+            # От отправки запроса до готовой таблицы
+            self.timings.end(self.preview_phase, len(result))
+            self.preview_phase = None
+        
+        plan = result.plan
+        self.preview_result = result
+        self.preview_list.selection_clear()
+        self.preview_list.set_count(len(result))
+        self.preview_summary.config(
+            text=f"БУДЕТ ПЕРЕИМЕНОВАНО: {plan.renames} из {len(result)} файл(ов)\n"
+                 + "\n".join(plan.summary_lines(limit=3)))
+        self.update_status(f"Предпросмотр для {len(result)} выбранных файлов")
+    
+    def show_preview_message(self, text):
+        """Сообщение вместо таблицы предпросмотра"""
+        # Расчет, который еще идет, больше не нужен
+        self.preview_worker.cancel()
+        self.preview_phase = None
+        if self.preview_poll_id is not None:
+            self.root.after_cancel(self.preview_poll_id)
+            self.preview_poll_id = None
+        self.preview_result = None
+        self.preview_list.set_count(0)
+        self.preview_summary.config(text=text)
+    
+    def get_preview_row(self, i):
+        """Строка i таблицы предпросмотра"""
+        result = self.preview_result
+        state = result.states[i]
+        if state == ROW_CONFLICT:
+            note, tags = f"конфликт: {result.reasons[i]}", ('conflict',)
+        elif state == ROW_UNCHANGED:
+            note, tags = "имя не изменится", ('unchanged',)
+        else:
+            note, tags = "", ()
+        directory = result.directories[i]
+        return (str(i+1),
+                (self.display_name(directory, result.old_names[i]), result.new_names[i], note),
+                tags)
     
     def perform_rename(self):
         """Выполнение переименования"""
-        selected_files = [f for f in self.files if f['selected']]
-        if not selected_files:
+        if self.rows_busy():
+            return
+        if not self.scan_finished:
+            # После сканирования строки пересортировываются - номера в плане устарели бы
+            messagebox.showwarning("Внимание", "Дождитесь окончания сканирования папки!")
+            return
+        
+        selected_indices = list(self.selection.iter_selected())
+        if not selected_indices:
             messagebox.showwarning("Внимание", "Не выбраны файлы для переименования!")
             return
         
-        # Проверяем параметры
-        mode = self.rename_mode.get()
-        if mode == "replace" and not self.old_text.get():
+        # Проверяем параметры (читаются из виджетов один раз)
+        params = self.get_rename_params()
+        if params is None:
+            messagebox.showerror("Ошибка", "Некорректные параметры режима!")
+            return
+        
+        mode = params.mode
+        if mode == "replace" and not params.old_text:
             messagebox.showwarning("Внимание", "Не указана строка для замены!")
             return
-        elif mode == "prefix" and not self.prefix_text.get():
+        elif mode == "prefix" and not params.prefix:
             messagebox.showwarning("Внимание", "Не указан префикс!")
             return
-        elif mode == "suffix" and not self.suffix_text.get():
+        elif mode == "suffix" and not params.suffix:
             messagebox.showwarning("Внимание", "Не указан суффикс!")
             return
         
+        error = validate_params(params)
+        if error:
+            messagebox.showerror("Ошибка", error)
+            return
+        
+        # План по свежему листингу папки: коллизии видны до первого rename
+        self.start_planning(selected_indices, params)
+    
+    def start_planning(self, selected_indices, params):
+        """Построение плана в фоновом потоке
+        
+        Для шаблона с метаданными это чтение файлов (значения, уже
+        извлеченные предпросмотром, берутся из кэша). На время расчета
+        номера строк заняты, как при переименовании: сортировка,
+        сканирование и слежение ждут, «Отмена» прерывает расчет.
+        plan_pending держит номера строк и после расчета - до ответа на
+        подтверждение и запуска задания.
+        """
+        cancel_event = threading.Event()
+        self.rename_cancel_event = cancel_event
+        self.plan_pending = True
+        self.cancel_rename_btn.config(state=tk.NORMAL)
+        self.rename_btn.config(state=tk.DISABLED)
+        existing_by_dir = self.list_existing_names()
+        table = self.files.snapshot()
+        results = queue.Queue()
+        progress = []  # Последнее (готово, всего) извлечения метаданных
+        
+        def worker():
+            try:
+                result = compute_preview(params, selected_indices, table, cancel_event.is_set,
+                                         existing_by_dir, self.metadata_store, lambda *p: progress.append(p))
+            except Exception as e:
+                result = e
+            results.put(result)
+        
+        threading.Thread(target=worker, daemon=True).start()
+        phase = self.timings.begin('plan', len(selected_indices))
+        self.update_status(f"Построение плана для {len(selected_indices)} файл(ов)...")
+        self.root.after(50, self.poll_planning, params, results, progress, phase)
+    
+    def poll_planning(self, params, results, progress, phase):
+        """Прием готового плана: подтверждение и запуск переименования"""
+        try:
+            result = results.get_nowait()
+        except queue.Empty:
+            if progress:
+                done, total = progress[-1]
+                self.progress_label.config(text=f"Метаданные: {done} / {total}")
+            self.root.after(100, self.poll_planning, params, results, progress, phase)
+            return
+        
+        self.rename_cancel_event = None
+        self.cancel_rename_btn.config(state=tk.DISABLED)
+        self.progress_label.config(text="")
+        # Диалоги модальные, но таймеры after (слежение, сканирование)
+        # продолжают работать: строки держит plan_pending до запуска задания
+        try:
+            self.confirm_and_start(params, result, phase)
+        finally:
+            self.plan_pending = False
+            self.update_selection_state()
+    
+    def confirm_and_start(self, params, result, phase):
+        """Подтверждение готового плана и запуск задания"""
+        if result is None:
+            self.update_status("Построение плана отменено")
+            return
+        if isinstance(result, Exception):
+            messagebox.showerror("Ошибка", f"Не удалось построить план:\n{result}")
+            return
+        self.timings.end(phase)
+        
+        plan = result.plan
+        if not plan.chains:
+            messagebox.showwarning("Внимание", "Нечего переименовывать!\n\n" + "\n".join(plan.summary_lines(3)))
+            return
+        
         # Подтверждение
         confirm = messagebox.askyesno("Подтверждение", 
-                                     f"Вы уверены, что хотите переименовать {len(selected_files)} файлов?\n\n"
-                                     f"Режим: {self.get_mode_name(mode)}\n"
-                                     f"Операция необратима!")
+                                     f"Вы уверены, что хотите переименовать {plan.renames} файлов?\n\n"
+                                     f"Режим: {self.get_mode_name(params.mode)}\n"
+                                     + "\n".join(plan.summary_lines(3)) + "\n\n"
+                                     f"Операцию можно откатить кнопкой «Откатить».")
         if not confirm:
             return
         
-        success_count = 0
-        error_count = 0
-        errors = []
-        renamed_files = []
+        description = f"{self.get_mode_name(params.mode)}: {self.folder_path.get()}"
+        self.start_rename_job(plan, 'rename', description)
+    
+    def list_existing_names(self):
+        """Текущие имена в папках списка (один листинг на папку)"""
+        existing = self.files.names_by_dir()
+        for directory in existing:
+            try:
+                existing[directory] = list_names(directory)
+            except OSError:
+                pass  # Остаются имена из последнего сканирования
+        return existing
+    
+    def start_rename_job(self, plan, kind, description, parent=None):
+        """Запуск выполнения плана в фоновом потоке
+
+        План целиком записывается в журнал до первого переименования.
+        Для отката и возобновления parent - журнал исходного задания.
+        """
+        try:
+            workers = self.workers_var.get()
+        except tk.TclError:
+            workers = DEFAULT_WORKERS
         
-        if mode == "numbering":
-            success_count, error_count, errors, renamed_files = self.perform_numbering(selected_files)
-        else:
-            for i, file_info in enumerate(selected_files):
-                old_path = file_info['path']
-                old_name = file_info['name']
-                new_name = self.generate_new_name(old_name, i)
-                
-                if old_name != new_name:
-                    new_path = os.path.join(os.path.dirname(old_path), new_name)
-                    
-                    if os.path.exists(new_path) and old_path != new_path:
-                        error_count += 1
-                        errors.append(f"{old_name}: Файл '{new_name}' уже существует")
-                        continue
-                    
-                    try:
-                        os.rename(old_path, new_path)
-                        success_count += 1
-                        
-                        renamed_files.append({
-                            'old_name': old_name,
-                            'new_name': new_name,
-                            'index': self.files.index(file_info)
-                        })
-                        
-                    except Exception as e:
-                        error_count += 1
-                        errors.append(f"{old_name}: {str(e)}")
-        
-        # Обновляем информацию о файлах
-        for rename_info in renamed_files:
-            idx = rename_info['index']
-            self.files[idx]['name'] = rename_info['new_name']
-            self.files[idx]['path'] = os.path.join(os.path.dirname(self.files[idx]['path']), 
-                                                  rename_info['new_name'])
-        
-        # Обновляем список
-        self.update_file_list()
+        try:
+            journal = RenameJournal.create(plan, kind, description)
+        except OSError as e:
+            if not messagebox.askyesno("Журнал",
+                                       f"Не удалось создать журнал переименования:\n{str(e)}\n\n"
+                                       f"Продолжить без возможности отката?"):
+                return
+            journal = None
+        
+        if parent is not None and journal is not None:
+            append_marker(parent, 'undone' if kind == 'undo' else 'resumed', journal.path)
+        
+        # После отката и возобновления индексы файлов неизвестны - список перечитывается
+        self.rename_reload = kind != 'rename'
+        self.rename_queue = queue.Queue()
+        self.rename_cancel_event = threading.Event()
+        self.rename_total = sum(len(chain) for chain in plan.chains)
+        self.rename_done = 0
+        self.rename_success = 0
+        self.rename_errors = [str(conflict) for conflict in plan.conflicts]
+        self.rename_started = time.perf_counter()
+        self.rename_phase = self.timings.begin(f'execute ({kind})', self.rename_total)
+        # Слежение не должно принимать собственные переименования за чужие
+        self.own_renames = {(op.directory, op.src, op.dst) for chain in plan.chains for op in chain}
+        self.rename_dirs = {directory for directory, _, _ in self.own_renames}
+        
+        self.progress_bar.config(maximum=self.rename_total, value=0)
+        self.progress_label.config(text=f"0 / {self.rename_total}")
+        self.cancel_rename_btn.config(state=tk.NORMAL)
+        self.rename_btn.config(state=tk.DISABLED)
+        self.refresh_btn.config(state=tk.DISABLED)
+        self.update_status(f"Переименование: {plan.renames} файлов...")
+        
+        executor = RenameExecutor(workers)
+        cancel_event = self.rename_cancel_event
+        results_queue = self.rename_queue
+        
+        def on_result(result):
+            if journal is not None:
+                journal.record(result)
+            results_queue.put(('result', result))
+        
+        def worker():
+            _, stats = executor.run(plan, on_result=on_result, cancel_event=cancel_event)
+            if journal is not None:
+                journal.close(STATUS_CANCELLED if stats.cancelled else STATUS_COMPLETED)
+            results_queue.put(('done', stats))
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, self.poll_rename_job)
+    
+    def poll_rename_job(self):
+        """Прием результатов переименования: таблица обновляется по мере готовности"""
+        changed = set()
+        stats = None
         
-        # Показываем результат
-        if error_count == 0:
-            messagebox.showinfo("Успешно", f"Успешно переименовано: {success_count} файлов")
-            self.update_status(f"Успешно переименовано: {success_count} файлов")
-        else:
-            error_msg = f"Результат:\nУспешно: {success_count}\nОшибок: {error_count}"
-            if errors:
-                error_msg += f"\n\nПервые ошибки:\n" + "\n".join(errors[:3])
-                if len(errors) > 3:
-                    error_msg += f"\n... и еще {len(errors) - 3} ошибок"
+        for _ in range(5000):
+            try:
+                kind, payload = self.rename_queue.get_nowait()
+            except queue.Empty:
+                break
             
-            messagebox.showerror("Результат", error_msg)
-            self.update_status(f"Переименовано: {success_count}, Ошибок: {error_count}")
+            if kind == 'done':
+                stats = payload
+                break
+            
+            result = payload
+            self.rename_done += 1
+            if result.ok:
+                # Таблица отражает фактическое имя, в том числе временное
+                if result.op.index is not None:
+                    self.files.rename(result.op.index, result.op.dst)
+                    changed.add(result.op.index)
+                if not result.op.is_temp:
+                    self.rename_success += 1
+            elif not (result.skipped and result.op.is_temp):
+                self.rename_errors.append(str(result))
+        
+        if changed:
+            self.refresh_file_rows(changed)
+        
+        # Прогресс и оценка оставшегося времени
+        self.progress_bar.config(value=self.rename_done)
+        elapsed = time.perf_counter() - self.rename_started
+        text = f"{self.rename_done} / {self.rename_total}"
+        if 0 < self.rename_done < self.rename_total:
+            eta = elapsed / self.rename_done * (self.rename_total - self.rename_done)
+            text += f", осталось ~{eta:.0f} с"
+        self.progress_label.config(text=text)
+        
+        if stats is None:
+            self.root.after(100, self.poll_rename_job)
+        else:
+            self.finish_rename_job(stats)
+    
+    def cancel_rename_job(self):
+        """Остановка переименования между операциями"""
+        if self.rename_cancel_event is not None:
+            self.rename_cancel_event.set()
+            self.cancel_rename_btn.config(state=tk.DISABLED)
+            self.update_status("Отмена переименования...")
+    
+    def finish_rename_job(self, stats):
+        """Завершение фонового переименования и отчет"""
+        self.rename_cancel_event = None
+        self.timings.end(self.rename_phase, stats.total)
+        self.rename_phase = None
+        # Листинги переименованных папок в кэше сканирования больше не верны
+        if self.scan_cache is not None:
+            self.scan_cache.invalidate(self.rename_dirs)
+        self.cancel_rename_btn.config(state=tk.DISABLED)
+        self.refresh_btn.config(state=tk.NORMAL)
+        self.progress_label.config(text="Отменено" if stats.cancelled else "Готово")
+        self.update_selection_state()
+        if self.rename_reload and self.folder_path.get():
+            self.load_files()
+        else:
+            # Имена изменились - фильтр пересчитывается по новому индексу
+            self.name_index = None
+            if self.name_filter is not None:
+                self.refresh_view()
+            self.update_preview()
+        
+        success_count = self.rename_success
+        errors = self.rename_errors
+        summary = f"Успешно: {success_count}, ошибок: {len(errors)}"
+        if stats.cancelled:
+            summary = f"Переименование отменено. {summary}"
+        
+        if errors:
+            self.show_error_report(errors, f"{summary}\n{stats.summary()}")
+            self.update_status(summary)
+        else:
+            messagebox.showinfo("Успешно", f"{summary}\n\n{stats.summary()}")
+            self.update_status(f"{summary} ({stats.summary()})")
+    
+    def undo_last(self):
+        """Откат последнего задания по журналу"""
+        if self.rows_busy():
+            return
+        
+        state = find_undo_candidate()
+        if state is None:
+            messagebox.showinfo("Откат", "Нет операций для отката")
+            return
+        
+        plan = build_undo_plan(state)
+        if not plan.chains:
+            append_marker(state.path, 'undone', None)
+            messagebox.showinfo("Откат", f"Откатывать нечего:\n{state.description}")
+            return
+        
+        if not messagebox.askyesno("Откат",
+                                   f"Вернуть исходные имена {plan.renames} файлов?\n\n"
+                                   f"{state.description}\n"
+                                   + "\n".join(plan.summary_lines(3))):
+            return
+        
+        self.start_rename_job(plan, 'undo', f"Откат: {state.description}", parent=state.path)
+    
+    def resume_interrupted(self):
+        """Завершение прерванного задания без повторного сканирования"""
+        if self.rows_busy():
+            return
+        
+        state = find_resume_candidate()
+        if state is None:
+            messagebox.showinfo("Возобновление", "Нет прерванных операций")
+            return
+        
+        plan = build_resume_plan(state)
+        if not plan.chains:
+            append_marker(state.path, 'resumed', None)
+            messagebox.showinfo("Возобновление", f"Задание уже выполнено:\n{state.description}")
+            return
+        
+        if not messagebox.askyesno("Возобновление",
+                                   f"Завершить прерванное задание ({plan.renames} файлов)?\n\n"
+                                   f"{state.description}"):
+            return
+        
+        self.start_rename_job(plan, 'resume', f"Продолжение: {state.description}", parent=state.path)
+    
+    def show_error_report(self, errors, summary):
+        """Окно с прокручиваемым списком ошибок и экспортом в файл"""
+        window = tk.Toplevel(self.root)
+        window.title("Результат переименования")
+        window.geometry("700x450")
+        
+        ttk.Label(window, text=summary, padding="8").pack(fill=tk.X)
+        
+        report = scrolledtext.ScrolledText(window, font=('Courier New', 9), wrap=tk.NONE)
+        report.pack(fill=tk.BOTH, expand=True, padx=8)
+        report.insert(tk.END, "\n".join(errors))
+        report.config(state=tk.DISABLED)
+        
+        def export():
+            path = filedialog.asksaveasfilename(parent=window,
+                                                title="Сохранить отчет об ошибках",
+                                                defaultextension=".txt",
+                                                filetypes=[("Текстовые файлы", "*.txt"), ("Все файлы", "*.*")])
+            if path:
+                try:
+                    with open(path, 'w', encoding='utf-8') as f:
+                        f.write(summary + "\n\n" + "\n".join(errors) + "\n")
+                except OSError as e:
+                    messagebox.showerror("Ошибка", f"Не удалось сохранить отчет:\n{str(e)}", parent=window)
+        
+        buttons = ttk.Frame(window, padding="8")
+        buttons.pack(fill=tk.X)
+        ttk.Button(buttons, text="Закрыть", command=window.destroy, width=12).pack(side=tk.RIGHT)
+        ttk.Button(buttons, text="Экспорт...", command=export, width=12).pack(side=tk.RIGHT, padx=(0, 10))
     
     def get_mode_name(self, mode):
         """Получение читаемого имени режима"""
@@ -742,93 +1834,92 @@ class FileRenamerApp:
             'suffix': 'Добавление суффикса',
             'remove_start': 'Удаление с начала',
             'remove_end': 'Удаление с конца',
-            'numbering': 'Нумерация'
+            'numbering': 'Нумерация',
+            'regex': 'Регулярное выражение',
+            'template': 'Шаблон имени',
+            'pipeline': 'Цепочка правил'
         }
         return names.get(mode, mode)
     
-    def perform_numbering(self, selected_files):
-        """Выполнение нумерации файлов"""
-        start = self.start_num_var.get()
-        step = self.step_var.get()
-        fmt = self.format_var.get()
-        sep = self.separator_var.get()
-        
-        success_count = 0
-        error_count = 0
-        errors = []
-        renamed_files = []
-        
-        # Проверяем уникальность имен
-        planned_renames = []
-        used_names = set()
-        
-        for i, file_info in enumerate(selected_files):
-            old_name = file_info['name']
-            num = start + (i * step)
-            num_str = f"{num:{fmt}}"
-            new_name = f"{num_str}{sep}{old_name}"
-            
-            if new_name in used_names:
-                error_count += 1
-                errors.append(f"{old_name}: Имя '{new_name}' будет дублироваться")
-            else:
-                used_names.add(new_name)
-                planned_renames.append((file_info, old_name, new_name, i))
-        
-        if error_count > 0:
-            return 0, error_count, errors, []
-        
-        # Выполняем переименование
-        for file_info, old_name, new_name, order_idx in planned_renames:
-            old_path = file_info['path']
-            new_path = os.path.join(os.path.dirname(old_path), new_name)
-            
-            if os.path.exists(new_path) and old_path != new_path:
-                error_count += 1
-                errors.append(f"{old_name}: Файл '{new_name}' уже существует")
-                continue
-            
-            try:
-                os.rename(old_path, new_path)
-                success_count += 1
-                
-                renamed_files.append({
-                    'old_name': old_name,
-                    'new_name': new_name,
-                    'index': self.files.index(file_info)
-                })
-                
-            except Exception as e:
-                error_count += 1
-                errors.append(f"{old_name}: {str(e)}")
-        
-        return success_count, error_count, errors, renamed_files
-    
     def show_stats(self):
-        """Показать статистику"""
+        """Показать статистику, замеры этапов и управление профилированием"""
         total = len(self.files)
-        selected = sum(1 for f in self.files if f['selected'])
-        
-        stats = f"""
-        Статистика:
-        
-        Всего файлов в папке: {total}
-        Выбрано для переименования: {selected}
-        
-        Папка: {self.folder_path.get() or 'Не выбрана'}
-        
-        Текущий режим: {self.get_mode_name(self.rename_mode.get())}
+        selected = self.selection.count
         
-        Инструкция:
-        1. Выберите папку
-        2. Выделите файлы (Ctrl/Shift + клик)
-        3. Нажмите "Подтвердить выделение"
-        4. Выберите режим и параметры
-        5. Нажмите "Обновить предпросмотр"
-        6. Нажмите "ПЕРЕИМЕНОВАТЬ"
-        """
-        
-        messagebox.showinfo("Статистика и инструкция", stats)
+        stats = f"""Статистика:
+
+Всего файлов в папке: {total}
+Выбрано для переименования: {selected}
+
+Папка: {self.folder_path.get() or 'Не выбрана'}
+
+Текущий режим: {self.get_mode_name(self.rename_mode.get())}
+
+Инструкция:
+1. Выберите папку
+2. Выделите файлы (Ctrl/Shift + клик)
+3. Нажмите "Подтвердить выделение"
+4. Выберите режим и параметры
+5. Нажмите "Обновить предпросмотр"
+6. Нажмите "ПЕРЕИМЕНОВАТЬ"
+"""
+        
+        # Замеры этапов: сводка и последние записи буфера
+        timing_lines = self.timings.summary_lines() or ["Замеров пока нет"]
+        recent = [f"{time.strftime('%H:%M:%S', time.localtime(r.started))}  {r.name}: "
+                  f"{r.seconds:.3f} с, {r.items} эл."
+                  + (f", {r.syscalls} выз. read/write" if r.syscalls is not None else "")
+                  + f" [{r.thread}]"
+                  for r in self.timings.snapshot()[-15:]]
+        text = (stats + "\nЗамеры этапов:\n" + "\n".join(timing_lines)
+                + ("\n\nПоследние этапы:\n" + "\n".join(recent) if recent else ""))
+        
+        window = tk.Toplevel(self.root)
+        window.title("Статистика и инструкция")
+        window.geometry("750x550")
+        
+        report = scrolledtext.ScrolledText(window, font=('Courier New', 9), wrap=tk.NONE)
+        report.pack(fill=tk.BOTH, expand=True, padx=8, pady=(8, 0))
+        report.insert(tk.END, text)
+        report.config(state=tk.DISABLED)
+        
+        profile_var = tk.BooleanVar(value=self.profile_capture.running)
+        
+        def toggle_profile():
+            if profile_var.get():
+                self.profile_capture.start()
+                self.update_status("Профилирование включено")
+            else:
+                self.profile_capture.stop()
+                self.update_status("Профилирование остановлено")
+        
+        def export():
+            path = filedialog.asksaveasfilename(parent=window,
+                                                title="Сохранить профиль и замеры",
+                                                defaultextension=".prof",
+                                                filetypes=[("Профиль cProfile", "*.prof"), ("Все файлы", "*.*")])
+            if not path:
+                return
+            # Рядом с профилем - временная шкала этапов всех потоков
+            trace_path = os.path.splitext(path)[0] + ".trace.json"
+            try:
+                self.timings.export_trace(trace_path)
+                saved = [trace_path]
+                if self.profile_capture.profile is not None:
+                    self.profile_capture.export(path)
+                    profile_var.set(False)
+                    saved.insert(0, path)
+            except OSError as e:
+                messagebox.showerror("Ошибка", f"Не удалось сохранить:\n{str(e)}", parent=window)
+                return
+            messagebox.showinfo("Экспорт", "Сохранено:\n" + "\n".join(saved), parent=window)
+        
+        buttons = ttk.Frame(window, padding="8")
+        buttons.pack(fill=tk.X)
+        ttk.Checkbutton(buttons, text="Профилирование (cProfile)", variable=profile_var,
+                        command=toggle_profile).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Закрыть", command=window.destroy, width=12).pack(side=tk.RIGHT)
+        ttk.Button(buttons, text="Экспорт...", command=export, width=12).pack(side=tk.RIGHT, padx=(0, 10))
     
     def update_status(self, message):
         """Обновление статус-бара"""
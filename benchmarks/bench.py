@@ -0,0 +1,443 @@
+"""Нагрузочные замеры: сканирование, список, предпросмотр, переименование
+
+Для каждого размера создается синтетическая папка (по умолчанию на
+tmpfs /dev/shm) с реалистичными именами: латиница, кириллица, длинные
+имена, пробелы и повторяющиеся основы. Этапы выполняются без окна -
+через движок напрямую, - каждый размер в отдельном процессе, чтобы
+пиковая память (RSS) одного размера не смешивалась с другим.
+
+Примеры:
+  python benchmarks/bench.py --sizes 10000,100000 --output results.json
+  python benchmarks/bench.py --output new.json --compare baseline.json
+  xvfb-run python benchmarks/bench.py --tk   # с отрисовкой VirtualList
+
+Результат - JSON: {"meta": {...}, "results": {"10000": {"scan": {"wall": с,
+"peak_rss_kb": КБ, "rss_growth_kb": КБ, "items": n}, ...}}}. peak_rss_kb -
+максимум RSS процесса к концу этапа, rss_growth_kb - насколько этап
+поднял этот максимум. В режиме --compare код выхода 1, если какой-либо
+этап стал медленнее (или тяжелее) базового в --threshold раз.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_scanner import DirectoryScanner, ScanOptions  # noqa: E402
+from file_metadata import MetadataCache, MetadataStore  # noqa: E402
+from file_table import FileTable  # noqa: E402
+from preview_worker import compute_preview  # noqa: E402
+from rename_engine import RenameParams, rename_names  # noqa: E402
+from rename_executor import RenameExecutor  # noqa: E402
+from rename_journal import STATUS_COMPLETED, RenameJournal, build_undo_plan, load_journal  # noqa: E402
+from rename_planner import build_rename_plan  # noqa: E402
+from scan_cache import ScanCache  # noqa: E402
+from selection import SelectionModel  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+DEFAULT_THRESHOLD = 1.25
+MIN_DELTA = 0.05      # с: меньшие разницы времени считаются шумом
+FILES_PER_DIR = 1000  # для --layout tree
+VIEWPORT_ROWS = 40
+VIEWPORTS = 200       # сколько "экранов" списка отрисовывается
+
+LATIN_WORDS = ('report', 'final', 'draft', 'photo', 'invoice', 'backup', 'scan', 'notes',
+               'summary', 'budget', 'meeting', 'holiday', 'project', 'data', 'export')
+CYRILLIC_WORDS = ('отчёт', 'продажи', 'фото', 'счёт', 'договор', 'черновик', 'Москва',
+                  'встреча', 'отпуск', 'проект', 'данные', 'итоги', 'Ёлка', 'смета', 'архив')
+EXTENSIONS = ('.jpg', '.JPG', '.png', '.pdf', '.docx', '.xlsx', '.txt', '.mp3', '.log', '.tar.gz', '')
+
+
+def synthetic_names(count, seed=0):
+    """Уникальные имена с распределением, похожим на реальные папки"""
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < count:
+        kind = rng.random()
+        ext = rng.choice(EXTENSIONS)
+        if kind < 0.35:
+            # Имена камер и сканеров: IMG_20240101_123456
+            stem = f"{rng.choice(('IMG', 'DSC', 'PXL', 'Scan'))}_{rng.randint(2015, 2025)}" \
+                   f"{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}_{rng.randint(0, 999999):06d}"
+        elif kind < 0.6:
+            stem = ' '.join(rng.choice(LATIN_WORDS) for _ in range(rng.randint(1, 4)))
+            stem += f" v{rng.randint(1, 30)}" if rng.random() < 0.5 else f" ({rng.randint(1, 999)})"
+        elif kind < 0.9:
+            stem = '_'.join(rng.choice(CYRILLIC_WORDS) for _ in range(rng.randint(1, 4)))
+            stem += f"_{rng.randint(1, 9999)}"
+        else:
+            # Длинные имена: до ~240 байт UTF-8 при пределе ФС в 255
+            words = LATIN_WORDS if rng.random() < 0.5 else CYRILLIC_WORDS
+            stem = rng.choice(words)
+            while True:
+                longer = f"{stem}-{rng.choice(words)}"
+                if len(longer.encode('utf-8')) > 230:
+                    break
+                stem = longer
+        name = stem + ext
+        if name in seen:
+            name = f"{stem}_{len(names)}{ext}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def default_root():
+    """tmpfs, если есть (замеряется код, а не диск), иначе временная папка"""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def peak_rss_kb():
+    """Максимум RSS процесса в КБ (None, если недоступен)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # macOS - в байтах
+
+
+class Stages:
+    """Замеры этапов одного размера: время и пиковая память"""
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, func, *args):
+        """Выполнение этапа; func возвращает число обработанных элементов"""
+        before = peak_rss_kb()
+        started = time.perf_counter()
+        items = func(*args)
+        wall = time.perf_counter() - started
+        after = peak_rss_kb()
+        self.results[name] = {'wall': round(wall, 6), 'items': items, 'peak_rss_kb': after,
+                              'rss_growth_kb': None if after is None else after - before}
+        print(f"  {name:<22} {wall:9.3f} с  {items or 0:>9} эл.", file=sys.stderr)
+
+    def skip(self, name, reason):
+        self.results[name] = {'skipped': reason}
+        print(f"  {name:<22} пропущено: {reason}", file=sys.stderr)
+
+
+def create_files(folder, names, layout):
+    """Пустые файлы на диске; для tree - по FILES_PER_DIR в подпапке"""
+    if layout == 'tree':
+        groups = [(os.path.join(folder, f"папка {number:04d}"), names[start:start + FILES_PER_DIR])
+                  for number, start in enumerate(range(0, len(names), FILES_PER_DIR))]
+    else:
+        groups = [(folder, names)]
+    for directory, group in groups:
+        os.makedirs(directory, exist_ok=True)
+        for name in group:
+            # os.open без буфера Python: создание файла - одна пара open/close
+            os.close(os.open(os.path.join(directory, name), os.O_WRONLY | os.O_CREAT, 0o644))
+    return len(names)
+
+
+def scan_into_table(folder, options):
+    """Сканирование в FileTable и сортировка по папке и имени, как в программе"""
+    files = FileTable()
+    for directory, entries in DirectoryScanner().scan(folder, options):
+        files.extend(entries, files.add_dir(directory))
+    sort_table(files)
+    return files
+
+
+def sort_table(files, column='name', reverse=False):
+    order = files.sort_order(column, reverse)
+    files.permute(order)
+    return len(order)
+
+
+def scan_with_cache(folder, options, cache):
+    """Сканирование через ScanCache до сообщения 'done'"""
+    scanner = DirectoryScanner()
+    scan_id = scanner.start(folder, options, cache)
+    count = 0
+    while True:
+        kind, message_id, payload = scanner.messages.get()
+        if message_id != scan_id:
+            continue
+        if kind == 'batch':
+            count += sum(len(entries) for _, entries in payload)
+        elif kind == 'done':
+            scanner.cancel()
+            cache.flush()
+            return count
+        elif kind == 'error':
+            raise OSError(payload)
+
+
+def render_rows(files, selection, root):
+    """Форматирование строк списка для VIEWPORTS экранов по всей длине
+
+    Повторяет get_file_row: имя с папкой, размер, дата, отметка выбора.
+    """
+    total = len(files)
+    if not total:
+        return 0
+    rendered = 0
+    labels = {}
+    step = max(1, total // VIEWPORTS)
+    for top in range(0, total, step):
+        viewport = []
+        for i in range(top, min(top + VIEWPORT_ROWS, total)):
+            files.fetch_stat(i)
+            directory = files.dir_of(i)
+            label = labels.get(directory)
+            if label is None:
+                label = labels[directory] = os.path.relpath(directory, root)
+            viewport.append((str(i + 1), (os.path.join(label, files.names[i]), files.display_size(i),
+                                          files.display_mtime(i), '✓' if selection.is_selected(i) else '')))
+        rendered += len(viewport)
+    return rendered
+
+
+def render_tk(files, selection):
+    """Отрисовка VirtualList в настоящем Treeview (нужен дисплей, например Xvfb)"""
+    import tkinter as tk
+    from virtual_list import VirtualList
+
+    root = tk.Tk()
+    try:
+        root.geometry('900x700')
+
+        def row_getter(i):
+            files.fetch_stat(i)
+            return str(i + 1), (files.names[i], files.display_size(i), files.display_mtime(i),
+                                '✓' if selection.is_selected(i) else ''), ()
+
+        view = VirtualList(root, ('name', 'size', 'date', 'sel'), row_getter)
+        view.pack(fill='both', expand=True)
+        root.update()
+        view.set_count(len(files))
+        root.update()
+        step = max(1, len(files) // VIEWPORTS)
+        for top in range(0, len(files), step):
+            view.scroll_to(top)
+            root.update_idletasks()
+        return len(files) // step * view.visible
+    finally:
+        root.destroy()
+
+
+def select_ops(selection):
+    selection.select_all()
+    selection.invert()
+    selection.select_range(0, len(selection) // 2)
+    selection.invert()
+    return sum(1 for _ in selection.iter_selected())
+
+
+def engine_names(params, names):
+    return len(rename_names(params, names))
+
+
+def preview(params, selected, files):
+    result = compute_preview(params, selected, files)
+    return len(result)
+
+
+def preview_metadata(params, selected, files, store):
+    """Предпросмотр шаблона с метаданными: холодный кэш - извлечение в пуле процессов"""
+    result = compute_preview(params, selected, files, metadata_store=store)
+    return len(result)
+
+
+def plan_only(params, selected, files):
+    old = [files.names[i] for i in selected]
+    new = rename_names(params, old)
+    items = [(i, files.dir_of(i), o, n) for i, o, n in zip(selected, old, new)]
+    plan = build_rename_plan(items, files.names_by_dir())
+    return plan.renames
+
+
+def execute(params, files, journal_dir, holder):
+    """Переименование по плану с журналом, как в программе"""
+    selected = list(range(len(files)))
+    plan = compute_preview(params, selected, files).plan
+    journal = RenameJournal.create(plan, 'rename', 'benchmark', journal_dir=journal_dir)
+    _, stats = RenameExecutor().run(plan, journal.record, threading.Event())
+    journal.close(STATUS_COMPLETED)
+    holder['journal'] = journal.path
+    return stats.succeeded
+
+
+def undo(holder):
+    plan = build_undo_plan(load_journal(holder['journal']))
+    _, stats = RenameExecutor().run(plan)
+    return stats.succeeded
+
+
+def run_size(size, root, layout, with_tk):
+    """Все этапы для одного размера (выполняется в отдельном процессе)"""
+    stages = Stages()
+    workdir = tempfile.mkdtemp(prefix='frp-bench-', dir=root)
+    try:
+        folder = os.path.join(workdir, 'files')
+        os.mkdir(folder)
+        names = synthetic_names(size)
+        stages.run('generate', create_files, folder, names, layout)
+        del names
+
+        recursive = layout == 'tree'
+        holder = {}
+
+        def scan(options):
+            holder['files'] = scan_into_table(folder, options)
+            return len(holder['files'])
+
+        stages.run('scan', scan, ScanOptions(recursive=recursive))
+        stages.run('scan_lazy', scan, ScanOptions(recursive=recursive, lazy_stat=True))
+        stages.run('scan_lazy_fetch_stats', lambda: holder['files'].fetch_stats())
+        cache = ScanCache(os.path.join(workdir, 'cache.sqlite3'))
+        try:
+            stages.run('scan_cache_cold', scan_with_cache, folder, ScanOptions(recursive=recursive), cache)
+            stages.run('scan_cache_warm', scan_with_cache, folder, ScanOptions(recursive=recursive), cache)
+        finally:
+            cache.close()
+        files = holder['files']
+        # Пересортировка готовой таблицы, как щелчок по заголовку столбца
+        stages.run('sort_size', sort_table, files, 'size', True)
+        stages.run('sort', sort_table, files)
+
+        selection = SelectionModel(len(files))
+        stages.run('select', select_ops, selection)
+        stages.run('list_rows', render_rows, files, selection, folder)
+        if with_tk:
+            try:
+                stages.run('list_tk', render_tk, files, selection)
+            except Exception as e:  # нет tkinter или дисплея
+                stages.skip('list_tk', str(e) or type(e).__name__)
+
+        names = files.names
+        replace = RenameParams(mode='replace', old_text='о', new_text='0', case_sensitive=False)
+        numbering = RenameParams(mode='numbering', fmt='auto')
+        regex = RenameParams(mode='regex', old_text=r'(\d+)', new_text=r'n\1', regex_scope='stem')
+        for mode, params in (('replace', replace), ('numbering', numbering), ('regex', regex),
+                             ('prefix', RenameParams(mode='prefix', prefix='new_'))):
+            stages.run(f'engine_{mode}', engine_names, params, names)
+
+        selected = list(range(len(files)))
+        stages.run('preview_numbering', preview, numbering, selected, files)
+        stages.run('preview_regex', preview, regex, selected, files)
+        stages.run('plan_numbering', plan_only, numbering, selected, files)
+
+        # Файлы пустые: замеряются стат, кэш и пул процессов, а не скорость хэша
+        template = RenameParams(mode='template', template='{mtime:%Y%m%d}_{taken}{hash}_{n}{ext}')
+        store = MetadataStore(MetadataCache(os.path.join(workdir, 'metadata.sqlite3')))
+        try:
+            stages.run('preview_template_cold', preview_metadata, template, selected, files, store)
+            stages.run('preview_template_warm', preview_metadata, template, selected, files, store)
+        finally:
+            store.close()
+
+        journal_dir = os.path.join(workdir, 'journal')
+        stages.run('rename', execute, numbering, files, journal_dir, holder)
+        stages.run('undo', undo, holder)
+    finally:
+        started = time.perf_counter()
+        shutil.rmtree(workdir, ignore_errors=True)
+        print(f"  {'(удаление папки)':<22} {time.perf_counter() - started:9.3f} с", file=sys.stderr)
+    return stages.results
+
+
+def run_all(args):
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    report = {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                       'cpus': os.cpu_count(), 'root': args.root, 'layout': args.layout,
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+              'results': {}}
+    for size in sizes:
+        print(f"{size} файлов ({args.layout}):", file=sys.stderr)
+        command = [sys.executable, os.path.abspath(__file__), '--worker', str(size),
+                   '--root', args.root, '--layout', args.layout]
+        if args.tk:
+            command.append('--tk')
+        completed = subprocess.run(command, stdout=subprocess.PIPE, check=False)
+        if completed.returncode != 0:
+            print(f"  ошибка: код выхода {completed.returncode}", file=sys.stderr)
+            report['results'][str(size)] = {'error': f"код выхода {completed.returncode}"}
+            continue
+        report['results'][str(size)] = json.loads(completed.stdout)
+    return report
+
+
+def compare(report, baseline, threshold):
+    """Сравнение с базовым отчетом; возвращает список регрессий"""
+    regressions = []
+    print(f"{'размер':>8} {'этап':<22} {'база, с':>9} {'сейчас, с':>10} {'x':>6}")
+    for size, stages in report['results'].items():
+        base_stages = baseline.get('results', {}).get(size, {})
+        for name, current in stages.items():
+            base = base_stages.get(name)
+            if not isinstance(current, dict) or not isinstance(base, dict) \
+                    or 'wall' not in current or 'wall' not in base:
+                continue
+            ratio = current['wall'] / base['wall'] if base['wall'] > 0 else 1.0
+            slower = ratio > threshold and current['wall'] - base['wall'] > MIN_DELTA
+            mark = '  <-- медленнее' if slower else ''
+            print(f"{size:>8} {name:<22} {base['wall']:9.3f} {current['wall']:10.3f} {ratio:6.2f}{mark}")
+            if slower:
+                regressions.append((size, name, 'wall', ratio))
+            base_rss, rss = base.get('rss_growth_kb'), current.get('rss_growth_kb')
+            if base_rss and rss and rss / base_rss > threshold and rss - base_rss > 1024:
+                print(f"{'':>8} {'':<22} память: {base_rss} -> {rss} КБ  <-- больше")
+                regressions.append((size, name, 'rss', rss / base_rss))
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Замеры производительности File Renamer Pro")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="количества файлов через запятую")
+    parser.add_argument('--root', default=default_root(), help="где создавать синтетические папки")
+    parser.add_argument('--layout', choices=('flat', 'tree'), default='flat',
+                        help=f"одна папка или подпапки по {FILES_PER_DIR} файлов")
+    parser.add_argument('--tk', action='store_true', help="замерить и отрисовку Treeview (нужен дисплей)")
+    parser.add_argument('-o', '--output', help="файл для JSON-отчета")
+    parser.add_argument('--compare', metavar='BASELINE', help="базовый JSON-отчет для сравнения")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="во сколько раз медленнее считается регрессией")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.worker is not None:
+        json.dump(run_size(args.worker, args.root, args.layout, args.tk), sys.stdout)
+        return 0
+
+    report = run_all(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    elif not args.output:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
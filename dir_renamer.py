@@ -0,0 +1,113 @@
+"""Переименование по дескриптору папки (renameat / renameat2)"""
+import ctypes
+import errno
+import os
+import sys
+import threading
+
+
+RENAME_NOREPLACE = 1  # linux/fs.h
+
+
+def _load_renameat2():
+    """renameat2 из libc (Linux, glibc 2.28+), иначе None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        func = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    func.restype = ctypes.c_int
+    return func
+
+
+_renameat2 = _load_renameat2()
+
+DIR_FD_SUPPORTED = os.rename in os.supports_dir_fd and os.stat in os.supports_dir_fd
+
+
+class PathRenamer:
+    """Переименование по полным путям (для платформ без dir_fd)"""
+
+    def rename(self, directory, src, dst):
+        src_path = os.path.join(directory, src)
+        dst_path = os.path.join(directory, dst)
+        if os.path.lexists(dst_path) and not _same_name_ignoring_case(src, dst):
+            raise FileExistsError(errno.EEXIST, f"Файл '{dst}' уже существует")
+        os.rename(src_path, dst_path)
+
+    def close(self):
+        pass
+
+
+class DirFdRenamer:
+    """Переименование голыми именами относительно открытой папки
+
+    Каждая папка открывается один раз, дальше ядро не разбирает
+    полный путь на каждую операцию. Если доступен
+    renameat2(RENAME_NOREPLACE), проверка занятости имени и
+    переименование выполняются одним атомарным системным вызовом,
+    иначе - os.stat(dir_fd=) и os.rename(src_dir_fd=, dst_dir_fd=).
+    """
+
+    def __init__(self, use_renameat2=True):
+        self._fds = {}
+        self._lock = threading.Lock()
+        self._renameat2 = _renameat2 if use_renameat2 else None
+        # Папки, чья ФС не поддерживает RENAME_NOREPLACE
+        self._no_renameat2 = set()
+
+    def _dir_fd(self, directory):
+        fd = self._fds.get(directory)
+        if fd is None:
+            with self._lock:
+                fd = self._fds.get(directory)
+                if fd is None:
+                    fd = os.open(directory, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+                    self._fds[directory] = fd
+        return fd
+
+    def rename(self, directory, src, dst):
+        fd = self._dir_fd(directory)
+
+        if self._renameat2 is not None and directory not in self._no_renameat2:
+            result = self._renameat2(fd, os.fsencode(src), fd, os.fsencode(dst), RENAME_NOREPLACE)
+            if result == 0:
+                return
+            code = ctypes.get_errno()
+            if code not in (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP):
+                raise OSError(code, os.strerror(code), dst)
+            # ФС не поддерживает флаг - дальше обычный путь для этой папки
+            self._no_renameat2.add(directory)
+
+        if not _same_name_ignoring_case(src, dst):
+            try:
+                os.stat(dst, dir_fd=fd, follow_symlinks=False)
+            except FileNotFoundError:
+                pass
+            else:
+                raise FileExistsError(errno.EEXIST, f"Файл '{dst}' уже существует")
+        os.rename(src, dst, src_dir_fd=fd, dst_dir_fd=fd)
+
+    def close(self):
+        """Закрытие открытых папок"""
+        with self._lock:
+            for fd in self._fds.values():
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self._fds = {}
+
+
+def _same_name_ignoring_case(src, dst):
+    # Смена только регистра: на нечувствительных к регистру ФС цель "существует"
+    return src != dst and src.casefold() == dst.casefold()
+
+
+def make_renamer():
+    """Самый быстрый доступный способ переименования на этой платформе"""
+    if DIR_FD_SUPPORTED:
+        return DirFdRenamer()
+    return PathRenamer()
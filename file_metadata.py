@@ -0,0 +1,464 @@
+"""Метаданные файлов для шаблонов имен: даты, EXIF, теги аудио, хэш
+
+Разбор EXIF и тегов и хэширование содержимого - работа процессора,
+которую потоки не распараллелят из-за GIL, поэтому извлечение идет в
+пуле процессов. Результаты хранятся в кэше на диске с ключом (путь,
+размер, mtime): повторный предпросмотр и само переименование берут
+значения оттуда и файлы заново не читают.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import struct
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from file_table import read_stats
+from rename_engine import FIELD_GROUPS
+from scan_cache import user_cache_dir
+
+
+MAX_CACHE_ENTRIES = 500000
+COMMIT_EVERY = 500
+LOOKUP_BATCH = 500    # Путей в одном запросе SELECT ... IN
+POOL_THRESHOLD = 32   # Меньше файлов - извлечение без пула процессов
+CHUNK_FILES = 32      # Файлов в одном задании пула
+WAIT_SECONDS = 0.2    # Как часто проверяется, не устарел ли запрос
+
+EXIF_BYTES = 256 * 1024   # Начало TIFF/RAW, в котором ищутся теги
+HASH_BLOCK = 1024 * 1024
+HASH_BYTES = 16           # BLAKE2b-128: 32 шестнадцатеричных знака
+
+_EXIF_POINTER = 0x8769
+_EXIF_MODEL = 0x0110
+_EXIF_DATETIME = 0x0132
+_EXIF_DATETIME_ORIGINAL = 0x9003
+
+_ID3_FRAMES = {'TIT2': 'title', 'TPE1': 'artist', 'TALB': 'album', 'TRCK': 'track',
+               'TT2': 'title', 'TP1': 'artist', 'TAL': 'album', 'TRK': 'track'}  # ID3v2.2
+_ID3_ENCODINGS = ('latin-1', 'utf-16', 'utf-16-be', 'utf-8')
+_VORBIS_FIELDS = {'TITLE': 'title', 'ARTIST': 'artist', 'ALBUM': 'album', 'TRACKNUMBER': 'track'}
+
+# Ошибки разбора поврежденного файла (в отличие от OSError - окончательные)
+_PARSE_ERRORS = (ValueError, LookupError, struct.error)
+
+
+def stat_values(st):
+    """Поля группы 'stat'; ctime - время создания, если ФС его хранит"""
+    return {'size': st.st_size, 'mtime': st.st_mtime,
+            'ctime': getattr(st, 'st_birthtime', st.st_ctime)}
+
+
+def read_exif(path):
+    """Дата съемки ('ГГГГ:ММ:ДД чч:мм:сс') и модель камеры из JPEG или TIFF/RAW"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+        if head in (b'II*\0', b'MM\0*'):
+            tiff = head + f.read(EXIF_BYTES - 4)
+        elif head[:2] == b'\xff\xd8':
+            tiff = _jpeg_exif(f)
+        else:
+            return {}
+    return _parse_tiff(tiff) if tiff else {}
+
+
+def _jpeg_exif(f):
+    # Сегменты JPEG до начала данных изображения; EXIF - в APP1
+    f.seek(2)
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF or marker[1] == 0xDA:
+            return None
+        length = struct.unpack('>H', marker[2:])[0]
+        if marker[1] == 0xE1:
+            data = f.read(length - 2)
+            if data.startswith(b'Exif\0\0'):
+                return data[6:]
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def _parse_tiff(data):
+    if data[:2] == b'II':
+        order = '<'
+    elif data[:2] == b'MM':
+        order = '>'
+    else:
+        return {}
+
+    def read_ifd(offset):
+        # Тег -> (тип, число значений, позиция поля значения)
+        entries = {}
+        count = struct.unpack_from(order + 'H', data, offset)[0]
+        for position in range(offset + 2, min(offset + 2 + 12 * count, len(data) - 11), 12):
+            tag, kind, number = struct.unpack_from(order + 'HHI', data, position)
+            entries[tag] = (kind, number, position + 8)
+        return entries
+
+    def ascii_value(entry):
+        if entry is None or entry[0] != 2:
+            return None
+        kind, number, position = entry
+        if number > 4:
+            position = struct.unpack_from(order + 'I', data, position)[0]
+        text = data[position:position + number].split(b'\0', 1)[0]
+        return text.decode('utf-8', 'replace').strip() or None
+
+    ifd0 = read_ifd(struct.unpack_from(order + 'I', data, 4)[0])
+    taken = None
+    if _EXIF_POINTER in ifd0:
+        exif = read_ifd(struct.unpack_from(order + 'I', data, ifd0[_EXIF_POINTER][2])[0])
+        taken = ascii_value(exif.get(_EXIF_DATETIME_ORIGINAL))
+    values = {}
+    taken = taken or ascii_value(ifd0.get(_EXIF_DATETIME))
+    if taken:
+        values['taken'] = taken
+    camera = ascii_value(ifd0.get(_EXIF_MODEL))
+    if camera:
+        values['camera'] = camera
+    return values
+
+
+def read_audio_tags(path):
+    """Название, исполнитель, альбом, номер дорожки: ID3v2/ID3v1 (MP3) и FLAC"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+        if head == b'fLaC':
+            return _flac_tags(f)
+        tags = {}
+        if head[:3] == b'ID3':
+            f.seek(0)
+            tags = _id3v2_tags(f)
+        if len(tags) < 4 and (head[:3] == b'ID3' or path.lower().endswith('.mp3')):
+            for field, value in _id3v1_tags(f).items():
+                tags.setdefault(field, value)
+        return tags
+
+
+def _syncsafe(data):
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _id3v2_tags(f):
+    header = f.read(10)
+    major, flags = header[3], header[5]
+    data = f.read(_syncsafe(header[6:10]))
+    position = 0
+    if flags & 0x40:
+        # Расширенный заголовок: в v2.4 размер включает себя, в v2.3 - нет
+        position = _syncsafe(data[:4]) if major == 4 else 4 + struct.unpack('>I', data[:4])[0]
+    id_size, header_size = (3, 6) if major == 2 else (4, 10)
+
+    tags = {}
+    while position + header_size <= len(data):
+        frame_id = data[position:position + id_size]
+        if not frame_id.strip(b'\0'):
+            break  # Дополнение нулями до конца тега
+        if major == 2:
+            size = int.from_bytes(data[position + 3:position + 6], 'big')
+        elif major == 4:
+            size = _syncsafe(data[position + 4:position + 8])
+        else:
+            size = struct.unpack('>I', data[position + 4:position + 8])[0]
+        body = data[position + header_size:position + header_size + size]
+        position += header_size + size
+        field = _ID3_FRAMES.get(frame_id.decode('latin-1'))
+        if field and len(body) > 1 and field not in tags:
+            codec = _ID3_ENCODINGS[body[0]] if body[0] < len(_ID3_ENCODINGS) else 'latin-1'
+            # Несколько значений (v2.4) разделены нулем - берется первое
+            text = body[1:].decode(codec, 'replace').split('\0', 1)[0].strip()
+            if text:
+                tags[field] = text
+    return tags
+
+
+def _id3v1_tags(f):
+    if f.seek(0, os.SEEK_END) < 128:
+        return {}
+    f.seek(-128, os.SEEK_END)
+    data = f.read(128)
+    if not data.startswith(b'TAG'):
+        return {}
+    tags = {}
+    for field, start in (('title', 3), ('artist', 33), ('album', 63)):
+        text = data[start:start + 30].split(b'\0', 1)[0].decode('latin-1').strip()
+        if text:
+            tags[field] = text
+    if data[125] == 0 and data[126]:
+        tags['track'] = str(data[126])  # ID3v1.1
+    return tags
+
+
+def _flac_tags(f):
+    # Блоки метаданных после сигнатуры; теги - в блоке VORBIS_COMMENT (4)
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            return {}
+        length = int.from_bytes(header[1:], 'big')
+        if header[0] & 0x7F == 4:
+            return _vorbis_comments(f.read(length))
+        if header[0] & 0x80:
+            return {}
+        f.seek(length, os.SEEK_CUR)
+
+
+def _vorbis_comments(data):
+    position = 4 + struct.unpack_from('<I', data, 0)[0]  # Пропуск строки vendor
+    count = struct.unpack_from('<I', data, position)[0]
+    position += 4
+    tags = {}
+    for _ in range(count):
+        length = struct.unpack_from('<I', data, position)[0]
+        key, _, value = data[position + 4:position + 4 + length].decode('utf-8', 'replace').partition('=')
+        position += 4 + length
+        field = _VORBIS_FIELDS.get(key.upper())
+        if field and value.strip() and field not in tags:
+            tags[field] = value.strip()
+    return tags
+
+
+def hash_file(path):
+    """Хэш содержимого BLAKE2b (шестнадцатеричная строка)"""
+    digest = hashlib.blake2b(digest_size=HASH_BYTES)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return {'hash': digest.hexdigest()}
+
+
+_EXTRACTORS = {'exif': read_exif, 'audio': read_audio_tags, 'hash': hash_file}
+
+
+def extract_metadata(path, groups):
+    """Значения групп для одного файла: {группа: {поле: значение}}
+
+    Поврежденный или чужой формат дает пустую группу (она кэшируется),
+    а ошибка чтения - отсутствие группы: файл будет прочитан снова.
+    """
+    result = {}
+    for group in groups:
+        try:
+            result[group] = _EXTRACTORS[group](path)
+        except OSError:
+            pass
+        except _PARSE_ERRORS:
+            result[group] = {}
+    return result
+
+
+def _extract_chunk(jobs):
+    # Выполняется в процессе пула: jobs - [(номер, путь, группы)]
+    return [(number, extract_metadata(path, groups)) for number, path, groups in jobs]
+
+
+class MetadataCache:
+    """Извлеченные метаданные на диске (SQLite), ключ - путь, размер и mtime
+
+    Изменение содержимого меняет размер или mtime, поэтому совпадение
+    ключа означает те же теги и хэш. Значения хранятся JSON по
+    группам, недостающая группа дочитывается отдельно. При превышении
+    max_entries удаляются записи, к которым дольше всего не
+    обращались (LRU).
+    """
+
+    def __init__(self, path, max_entries=MAX_CACHE_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS files (
+                                path TEXT PRIMARY KEY,
+                                size INTEGER NOT NULL,
+                                mtime_ns INTEGER NOT NULL,
+                                accessed REAL NOT NULL,
+                                data TEXT NOT NULL)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS files_accessed ON files(accessed)')
+
+    @classmethod
+    def open_default(cls):
+        """Кэш в папке кэша пользователя; если недоступен - в памяти"""
+        try:
+            directory = user_cache_dir()
+            os.makedirs(directory, exist_ok=True)
+            return cls(os.path.join(directory, 'metadata_cache.sqlite3'))
+        except (OSError, sqlite3.Error):
+            return cls(':memory:')
+
+    def lookup(self, keys):
+        """{путь: {группа: значения}} для ключей (путь, размер, mtime_ns), совпавших с записью"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            try:
+                for start in range(0, len(keys), LOOKUP_BATCH):
+                    batch = {path: (size, mtime_ns) for path, size, mtime_ns in keys[start:start + LOOKUP_BATCH]}
+                    rows = self._db.execute(
+                        'SELECT path, size, mtime_ns, data FROM files WHERE path IN (%s)'
+                        % ','.join('?' * len(batch)), list(batch)).fetchall()
+                    rows = [(path, data) for path, size, mtime_ns, data in rows if batch[path] == (size, mtime_ns)]
+                    hits = [path for path, _ in rows]
+                    # Один разбор JSON на всю пачку вместо вызова на запись
+                    found.update(zip(hits, json.loads('[' + ','.join(data for _, data in rows) + ']')))
+                    if hits:
+                        self._write('UPDATE files SET accessed = ? WHERE path IN (%s)'
+                                    % ','.join('?' * len(hits)), [now] + hits)
+            except sqlite3.Error:
+                pass
+        return found
+
+    def store(self, records):
+        """Запись [(путь, размер, mtime_ns, {группа: значения})]"""
+        now = time.time()
+        with self._lock:
+            try:
+                for path, size, mtime_ns, data in records:
+                    self._write('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                                (path, size, mtime_ns, now, json.dumps(data, ensure_ascii=False)))
+            except sqlite3.Error:
+                pass
+
+    def flush(self):
+        """Фиксация записей и вытеснение сверх max_entries"""
+        with self._lock:
+            try:
+                self._commit()
+                self._evict()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def _write(self, sql, args):
+        if not self._db.in_transaction:
+            self._db.execute('BEGIN')
+        self._db.execute(sql, args)
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._commit()
+
+    def _commit(self):
+        if self._db.in_transaction:
+            self._db.execute('COMMIT')
+        self._pending = 0
+
+    def _evict(self):
+        excess = self._db.execute('SELECT COUNT(*) FROM files').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._db.execute('DELETE FROM files WHERE path IN '
+                             '(SELECT path FROM files ORDER BY accessed LIMIT ?)', (excess,))
+
+
+class MetadataStore:
+    """Метаданные списка файлов: os.stat, кэш, затем пул процессов
+
+    Предпросмотр и переименование запрашивают значения через один
+    объект, поэтому прочитанное для предпросмотра при переименовании
+    берется из кэша. Пул создается при первом большом извлечении и
+    живет до close(); процессы запускаются через spawn - fork из
+    процесса с потоками и Tk небезопасен.
+    """
+
+    def __init__(self, cache=None, workers=None):
+        self.cache = cache if cache is not None else MetadataCache(':memory:')
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def get(self, paths, fields, is_stale=None, on_progress=None):
+        """Значения полей FIELD_GROUPS для путей: список словарей {поле: значение}
+
+        Для отсутствующего файла - None. Если is_stale() становится
+        истинным, возвращается None; уже извлеченное при этом
+        сохраняется в кэше. on_progress(готово, всего) вызывается
+        по мере извлечения.
+        """
+        groups = sorted({FIELD_GROUPS[field] for field in fields} - {'stat'})
+        stats = read_stats(paths)
+        values = [None if st is None else stat_values(st) for st in stats]
+        if not groups:
+            return values
+
+        keys = [(path, st.st_size, st.st_mtime_ns) for path, st in zip(paths, stats) if st is not None]
+        cached = self.cache.lookup(keys)
+        jobs = []
+        for number, (path, size, mtime_ns) in enumerate(keys):
+            data = cached.setdefault(path, {})
+            missing = [group for group in groups if group not in data]
+            if missing:
+                jobs.append((number, path, missing))
+
+        try:
+            if not self._extract(jobs, keys, cached, is_stale, on_progress):
+                return None
+        finally:
+            self.cache.flush()
+
+        for row, meta in enumerate(values):
+            if meta is not None:
+                for group in cached.get(paths[row], {}).values():
+                    meta.update(group)
+        return values
+
+    def _extract(self, jobs, keys, cached, is_stale, on_progress):
+        # Результаты сразу дописываются в cached и в кэш на диске
+        def accept(results):
+            records = []
+            for number, data in results:
+                path, size, mtime_ns = keys[number]
+                cached[path].update(data)
+                records.append((path, size, mtime_ns, cached[path]))
+            self.cache.store(records)
+
+        if not jobs:
+            return True
+        if len(jobs) < POOL_THRESHOLD or self.workers == 1:
+            for done, job in enumerate(jobs, 1):
+                if is_stale is not None and is_stale():
+                    return False
+                accept(_extract_chunk([job]))
+                if on_progress is not None:
+                    on_progress(done, len(jobs))
+            return True
+
+        pool = self._get_pool()
+        pending = {pool.submit(_extract_chunk, jobs[start:start + CHUNK_FILES])
+                   for start in range(0, len(jobs), CHUNK_FILES)}
+        done_files = 0
+        try:
+            while pending:
+                if is_stale is not None and is_stale():
+                    return False
+                finished, pending = wait(pending, timeout=WAIT_SECONDS, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    results = future.result()
+                    accept(results)
+                    done_files += len(results)
+                if finished and on_progress is not None:
+                    on_progress(done_files, len(jobs))
+            return True
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+        self.cache.close()
@@ -0,0 +1,288 @@
+"""Командная строка File Renamer (без Tk, для серверов и cron)
+
+Примеры:
+  python file_renamer_cli.py --dir photos --mode numbering --format auto
+  python file_renamer_cli.py --glob 'logs/*.log' --mode regex --old '(\\d+)' --new 'day_\\1' --apply
+  find . -name '*.tmp' -print0 | python file_renamer_cli.py --null --mode suffix --suffix _old --apply
+  python file_renamer_cli.py --dir photos --mode template --template '{taken:%Y%m%d}_{camera}_{n}{ext}'
+
+Без --apply выполняется пробный запуск: план выводится как NDJSON
+(по JSON-объекту на строку), файлы не трогаются. С --apply выводятся
+результаты операций. Коды выхода - EXIT_* ниже.
+"""
+import argparse
+import glob
+import json
+import os
+import signal
+import sys
+import threading
+
+from file_scanner import DirectoryScanner, ScanOptions
+from file_table import natural_key
+from rename_engine import (MODES, NUMBER_FORMATS, REGEX_SCOPES, RenameParams, metadata_fields, rename_grouped,
+                           validate_params)
+from rename_executor import DEFAULT_WORKERS, RenameExecutor
+from rename_journal import STATUS_CANCELLED, STATUS_COMPLETED, RenameJournal
+from rename_planner import build_rename_plan, list_names
+from rename_presets import load_preset
+
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1   # часть файлов не переименована (ошибки, конфликты, нет файла)
+EXIT_USAGE = 2     # неверные аргументы или параметры
+EXIT_FAILED = 3    # не выполнено ни одной операции из плана
+EXIT_CANCELLED = 130  # прервано Ctrl+C (начатые цепочки доведены до конца)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='file_renamer_cli',
+        description="Массовое переименование файлов без графического интерфейса")
+
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-d', '--dir', help="все файлы папки (по имени)")
+    source.add_argument('-g', '--glob', help="шаблон путей, '**' - рекурсивно")
+    source.add_argument('-0', '--null', action='store_true',
+                        help="пути из stdin, разделенные NUL (find -print0)")
+
+    tree = parser.add_argument_group("папки (для --dir)")
+    tree.add_argument('-r', '--recursive', action='store_true', help="включая подпапки")
+    tree.add_argument('--max-depth', type=int, default=0, help="глубина подпапок (0 - без ограничения)")
+    tree.add_argument('--include', action='append', default=[], help="шаблон имен файлов (можно несколько)")
+    tree.add_argument('--exclude', action='append', default=[],
+                      help="шаблон имен файлов и папок для пропуска (можно несколько)")
+
+    rules = parser.add_argument_group("правило переименования")
+    rules.add_argument('-m', '--mode', choices=MODES, help="режим переименования")
+    rules.add_argument('--preset', help="цепочка правил из JSON-пресета (вместо --mode)")
+    rules.add_argument('--old', default='', help="заменяемый текст или регулярное выражение")
+    rules.add_argument('--new', default='', help="новый текст или шаблон замены (\\1, \\g<имя>)")
+    rules.add_argument('-i', '--ignore-case', action='store_true', help="без учета регистра")
+    rules.add_argument('--scope', choices=REGEX_SCOPES, default='name',
+                       help="часть имени для regex: name, stem или ext")
+    rules.add_argument('--prefix', default='')
+    rules.add_argument('--suffix', default='', help="суффикс перед расширением")
+    rules.add_argument('--count', type=int, help="сколько символов удалить (для remove_start и remove_end)")
+    rules.add_argument('--start', type=int, default=1, help="начальный номер")
+    rules.add_argument('--step', type=int, default=1, help="шаг нумерации")
+    rules.add_argument('--format', choices=NUMBER_FORMATS, default='01', help="ширина номера")
+    rules.add_argument('--separator', default='_', help="разделитель после номера")
+    rules.add_argument('--template', default='',
+                       help="шаблон имени для --mode template: {name}, {ext}, {n}, {mtime:%%Y%%m%%d}, "
+                            "{ctime}, {size}, {taken}, {camera}, {artist}, {title}, {album}, {track}, {hash}")
+
+    run = parser.add_argument_group("выполнение")
+    run.add_argument('--apply', action='store_true', help="переименовать (по умолчанию - только план)")
+    run.add_argument('-j', '--workers', type=int, default=DEFAULT_WORKERS, help="параллельных переименований")
+    run.add_argument('--no-journal', action='store_true', help="не вести журнал (откат будет невозможен)")
+    return parser
+
+
+def params_from_args(args):
+    """Параметры из аргументов: пресет или одиночный режим"""
+    if args.preset:
+        return load_preset(args.preset)
+    return RenameParams(mode=args.mode,
+                        old_text=args.old,
+                        new_text=args.new,
+                        case_sensitive=not args.ignore_case,
+                        prefix=args.prefix,
+                        suffix=args.suffix,
+                        remove_count=args.count if args.count is not None else 0,
+                        start=args.start,
+                        step=args.step,
+                        fmt=args.format,
+                        separator=args.separator,
+                        regex_scope=args.scope,
+                        template=args.template)
+
+
+def collect_paths(args, stdin=None):
+    """Список путей к файлам в порядке нумерации"""
+    if args.dir is not None:
+        # Для переименования нужны только имена - размеры не читаются
+        options = ScanOptions(recursive=args.recursive, max_depth=max(0, args.max_depth),
+                              include=tuple(args.include), exclude=tuple(args.exclude),
+                              lazy_stat=True)
+        files = [(directory, entry.name)
+                 for directory, entries in DirectoryScanner().scan(args.dir, options)
+                 for entry in entries]
+        # Как в списке программы: по папке, затем по имени (естественный порядок)
+        files.sort(key=lambda item: (natural_key(item[0]), natural_key(item[1])))
+        return [os.path.join(directory, name) for directory, name in files]
+    if args.glob is not None:
+        return sorted(path for path in glob.glob(args.glob, recursive=True) if os.path.isfile(path))
+    data = (stdin if stdin is not None else sys.stdin.buffer).read()
+    return [os.fsdecode(path) for path in data.split(b'\0') if path]
+
+
+def emit(record, out):
+    out.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def plan_files(params, paths, out):
+    """План переименования по свежим листингам папок
+
+    Возвращает (план, число пропущенных путей). Повторы путей
+    отбрасываются, отсутствующие файлы выводятся записями missing,
+    папки и другие не обычные файлы - записями missing с reason.
+    """
+    seen = set()
+    files = []
+    for path in paths:
+        directory, name = os.path.split(os.path.abspath(path))
+        if (directory, name) not in seen:
+            seen.add((directory, name))
+            files.append((directory, name))
+
+    existing = {}
+    for directory in {directory for directory, _ in files}:
+        try:
+            existing[directory] = list_names(directory)
+        except OSError:
+            existing[directory] = set()
+
+    present = []
+    missing = 0
+    for directory, name in files:
+        if name not in existing[directory]:
+            missing += 1
+            emit({'type': 'missing', 'dir': directory, 'src': name}, out)
+        elif not os.path.isfile(os.path.join(directory, name)):
+            # Листинг содержит и папки: переименовываются только файлы
+            missing += 1
+            emit({'type': 'missing', 'dir': directory, 'src': name, 'reason': 'not a file'}, out)
+        else:
+            present.append((directory, name))
+
+    # Метаданные для шаблона - из общего с программой кэша или пула процессов
+    metadata = None
+    fields = metadata_fields(params)
+    if fields:
+        # sqlite3 и пул процессов загружаются, только если шаблону нужны метаданные
+        from file_metadata import MetadataCache, MetadataStore
+        store = MetadataStore(MetadataCache.open_default())
+        try:
+            metadata = store.get([os.path.join(directory, name) for directory, name in present], fields)
+        finally:
+            store.close()
+
+    # Нумерация и проверка коллизий - отдельно в каждой папке
+    new_names = rename_grouped(params, [name for _, name in present],
+                               [directory for directory, _ in present], metadata=metadata)
+    items = [(index, directory, name, new_name)
+             for index, ((directory, name), new_name) in enumerate(zip(present, new_names))]
+    return build_rename_plan(items, existing), missing
+
+
+def emit_plan(plan, out):
+    for chain_number, chain in enumerate(plan.chains):
+        for op in chain:
+            emit({'type': 'op', 'chain': chain_number, 'dir': op.directory,
+                  'src': op.src, 'dst': op.dst, 'temp': op.is_temp}, out)
+
+
+def emit_conflicts(plan, out):
+    for conflict in plan.conflicts:
+        emit({'type': 'conflict', 'dir': conflict.directory, 'src': conflict.old_name,
+              'dst': conflict.new_name, 'reason': conflict.reason}, out)
+
+
+def apply_plan(plan, workers, journal, out):
+    """Выполнение плана с выводом результатов по мере готовности
+
+    journal - созданный RenameJournal или None; закрывается здесь.
+    """
+    lock = threading.Lock()
+
+    def on_result(result):
+        if journal is not None:
+            journal.record(result)
+        record = {'type': 'result', 'dir': result.op.directory, 'src': result.op.src,
+                  'dst': result.op.dst, 'temp': result.op.is_temp,
+                  'status': 'skipped' if result.skipped else 'ok' if result.ok else 'error'}
+        if result.error is not None:
+            record['error'] = result.error
+        with lock:
+            emit(record, out)
+
+    # Ctrl+C останавливает выполнение между операциями, журнал закрывается
+    cancel_event = threading.Event()
+    previous_handler = signal.signal(signal.SIGINT, lambda signum, frame: cancel_event.set())
+    try:
+        _, stats = RenameExecutor(workers).run(plan, on_result, cancel_event)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+        if journal is not None:
+            journal.close(STATUS_CANCELLED if cancel_event.is_set() else STATUS_COMPLETED)
+    return stats
+
+
+def main(argv=None, out=None, stdin=None):
+    out = out if out is not None else sys.stdout
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.preset and not args.mode:
+        parser.error("нужен --mode или --preset")
+    if not args.preset and args.mode in ('remove_start', 'remove_end') and args.count is None:
+        parser.error(f"для --mode {args.mode} нужен --count")
+
+    try:
+        params = params_from_args(args)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка пресета: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    error = validate_params(params)
+    if error:
+        print(f"Ошибка параметров: {error}", file=sys.stderr)
+        return EXIT_USAGE
+
+    try:
+        paths = collect_paths(args, stdin)
+    except OSError as e:
+        print(f"Ошибка чтения списка файлов: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    plan, missing = plan_files(params, paths, out)
+    summary = {'type': 'summary', 'files': len(paths), 'renames': plan.renames,
+               'operations': sum(len(chain) for chain in plan.chains),
+               'conflicts': len(plan.conflicts), 'unchanged': plan.unchanged,
+               'cycles': plan.cycles, 'missing': missing, 'applied': args.apply}
+
+    if not args.apply:
+        emit_plan(plan, out)
+        emit_conflicts(plan, out)
+        emit(summary, out)
+        return EXIT_PARTIAL if plan.conflicts or missing else EXIT_OK
+
+    journal = None
+    if not args.no_journal and plan.chains:
+        description = f"CLI {params.mode}: {args.dir or args.glob or 'stdin'}"
+        try:
+            journal = RenameJournal.create(plan, 'rename', description)
+        except OSError as e:
+            print(f"Не удалось создать журнал: {e} (запуск без журнала: --no-journal)", file=sys.stderr)
+            return EXIT_FAILED
+    try:
+        stats = apply_plan(plan, args.workers, journal, out)
+    except OSError as e:
+        # Например, запись журнала на переполненный диск
+        print(f"Ошибка во время переименования: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    emit_conflicts(plan, out)
+    summary.update({'succeeded': stats.succeeded, 'failed': stats.failed, 'skipped': stats.skipped,
+                    'elapsed': round(stats.elapsed, 6), 'rate': round(stats.rate, 1)})
+    emit(summary, out)
+
+    if stats.cancelled:
+        return EXIT_CANCELLED
+    if stats.total and not stats.succeeded:
+        return EXIT_FAILED
+    if stats.failed or stats.skipped or plan.conflicts or missing:
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""Фоновое сканирование папки через os.scandir"""
+import fnmatch
+import os
+import queue
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+
+DEFAULT_SCAN_WORKERS = 8
+
+# Размер еще не прочитан (ленивый режим) / прочитать не удалось
+UNKNOWN_SIZE = -1
+STAT_FAILED = -2
+
+# Фоновое чтение размеров: пауза после каждой группы stat
+STAT_PASS_GROUP = 1000
+STAT_PASS_PAUSE = 0.005
+
+
+class ScanEntry:
+    """Запись о найденном файле"""
+    __slots__ = ('name', 'size', 'mtime')
+
+    def __init__(self, name, size, mtime):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+
+
+class DirListing:
+    """Обычные файлы (ScanEntry) и имена подпапок одной папки"""
+    __slots__ = ('entries', 'subdirs')
+
+    def __init__(self, entries, subdirs):
+        self.entries = entries
+        self.subdirs = subdirs
+
+
+@dataclass(frozen=True)
+class ScanOptions:
+    """Параметры сканирования
+
+    max_depth - глубина вложенных папок (0 - без ограничения),
+    include - шаблоны имен файлов, которые попадают в список
+    (пусто - все файлы), exclude - шаблоны имен файлов и папок,
+    которые пропускаются. lazy_stat - список строится только по
+    листингу (тип записи из DirEntry), размеры и даты читаются
+    потом фоновым проходом.
+    """
+    recursive: bool = False
+    max_depth: int = 0
+    include: tuple = ()
+    exclude: tuple = ()
+    workers: int = DEFAULT_SCAN_WORKERS
+    lazy_stat: bool = False
+
+
+def compile_globs(patterns):
+    """Один regex для списка шаблонов вида *.jpg (None - шаблонов нет)"""
+    patterns = [p for p in patterns if p]
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(os.path.normcase(p)) for p in patterns))
+
+
+class DirectoryScanner:
+    """Сканер папки в рабочем потоке
+
+    Результаты передаются пачками через очередь сообщений вида
+    (kind, scan_id, payload), где kind - 'batch', 'done' или 'error'
+    (при сканировании с кэшем после 'done' идут 'update' и 'revalidated').
+    Пачка - список пар (папка, записи). Очередь разбирается из потока
+    интерфейса методом poll().
+
+    В рекурсивном режиме подпапки обходятся пулом из options.workers
+    потоков; мелкие папки объединяются в общие пачки, чтобы число
+    сообщений не зависело от числа папок.
+    """
+
+    def __init__(self, batch_size=2000):
+        self.batch_size = batch_size
+        self.messages = queue.Queue()
+        self.scan_id = 0
+        self._cancel_event = None
+        self._thread = None
+
+    def start(self, folder, options=None, cache=None):
+        """Запуск нового сканирования (предыдущее отменяется)
+
+        cache - ScanCache: неизменившиеся папки берутся из него, а
+        размеры и даты перепроверяются в фоне после сообщения 'done'.
+        """
+        self.cancel()
+        self.scan_id += 1
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(self.scan_id, folder, options or ScanOptions(),
+                                              self._cancel_event, cache),
+                                        daemon=True)
+        self._thread.start()
+        return self.scan_id
+
+    def cancel(self):
+        """Отмена текущего сканирования"""
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+            self._cancel_event = None
+
+    def is_running(self):
+        """Идет ли сейчас сканирование"""
+        return self._cancel_event is not None and self._thread is not None and self._thread.is_alive()
+
+    def poll(self, max_messages=10):
+        """Забрать готовые сообщения текущего сканирования без блокировки
+
+        Сообщения отмененных сканирований отбрасываются.
+        """
+        result = []
+        while len(result) < max_messages:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if message[1] == self.scan_id:
+                result.append(message)
+        return result
+
+    def scan(self, folder, options=None):
+        """Синхронное сканирование (без интерфейса): пары (папка, записи)"""
+        scan_id = self.start(folder, options)
+        while True:
+            kind, message_id, payload = self.messages.get()
+            if message_id != scan_id:
+                continue
+            if kind == 'batch':
+                yield from payload
+            elif kind == 'done':
+                # Фоновая перепроверка размеров синхронному вызову не нужна
+                self.cancel()
+                return
+            else:
+                raise OSError(payload)
+
+    def _run(self, scan_id, folder, options, cancel_event, cache):
+        """Рабочий поток: обход папки (или дерева) и отправка пачек"""
+        ctx = _ScanContext(_Batcher(self.messages, scan_id, self.batch_size), options, cancel_event, cache)
+
+        try:
+            subdirs = _scan_dir(ctx, folder, options.recursive)
+        except OSError as e:
+            self.messages.put(('error', scan_id, str(e)))
+            return
+
+        if options.recursive and (options.max_depth == 0 or options.max_depth >= 1):
+            _walk_parallel(ctx, subdirs)
+
+        if cancel_event.is_set():
+            return
+        ctx.batcher.flush()
+        self.messages.put(('done', scan_id, ctx.batcher.total))
+
+        if cache is not None or options.lazy_stat:
+            if cache is not None:
+                cache.flush()
+            _revalidate(ctx, self.messages, scan_id)
+            if cache is not None:
+                cache.flush()
+
+
+class _ScanContext:
+    """Общее состояние одного сканирования для всех потоков обхода"""
+
+    def __init__(self, batcher, options, cancel_event, cache):
+        self.batcher = batcher
+        self.options = options
+        self.include = compile_globs(options.include)
+        self.exclude = compile_globs(options.exclude)
+        self.cancel_event = cancel_event
+        self.cache = cache
+        self.served = []  # (папка, stat папки, DirListing) - для фоновой перепроверки
+
+    def accepts(self, name):
+        name = os.path.normcase(name)
+        return ((self.include is None or self.include.match(name) is not None)
+                and (self.exclude is None or self.exclude.match(name) is None))
+
+    def excludes(self, name):
+        return self.exclude is not None and self.exclude.match(os.path.normcase(name)) is not None
+
+    def add(self, directory, entries):
+        """Передача записей папки пачками не больше batch_size"""
+        size = self.batcher.batch_size
+        for start in range(0, len(entries), size):
+            self.batcher.add(directory, entries[start:start + size])
+
+
+class _Batcher:
+    """Сбор записей из нескольких потоков в общие пачки"""
+
+    def __init__(self, messages, scan_id, batch_size):
+        self.messages = messages
+        self.scan_id = scan_id
+        self.batch_size = batch_size
+        self.total = 0
+        self._groups = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, directory, entries):
+        with self._lock:
+            self._groups.append((directory, entries))
+            self._count += len(entries)
+            self.total += len(entries)
+            if self._count >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self._groups:
+            self.messages.put(('batch', self.scan_id, self._groups))
+            self._groups = []
+            self._count = 0
+
+
+def _list_dir(directory, cancel_event, ctx=None, want_subdirs=True, lazy=False):
+    """Листинг папки: обычные файлы с размером и датой, имена подпапок
+
+    С ctx имена сразу фильтруются шаблонами (лишние файлы не
+    stat-ятся), без него - полный листинг для кэша. С lazy размер и
+    дата не читаются (UNKNOWN_SIZE). None - отменено.
+    """
+    entries = []
+    subdirs = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if cancel_event.is_set():
+                return None
+            if ctx is not None and ctx.excludes(entry.name):
+                continue
+            try:
+                # DirEntry кэширует тип записи, отдельный isfile не нужен
+                if not entry.is_file():
+                    # Ссылки на папки не обходятся - в дереве не будет циклов
+                    if want_subdirs and entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    continue
+                if ctx is not None and not ctx.accepts(entry.name):
+                    continue
+                if lazy:
+                    entries.append(ScanEntry(entry.name, UNKNOWN_SIZE, 0.0))
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append(ScanEntry(entry.name, stat.st_size, stat.st_mtime))
+    return DirListing(entries, subdirs)
+
+
+def _scan_dir(ctx, directory, want_subdirs):
+    """Файлы одной папки (из кэша или с диска); возвращает пути подпапок"""
+    lazy = ctx.options.lazy_stat
+    if ctx.cache is None:
+        listing = _list_dir(directory, ctx.cancel_event, ctx, want_subdirs, lazy)
+        if listing is None:
+            return []
+        if lazy:
+            ctx.served.append((directory, None, listing))
+        ctx.add(directory, listing.entries)
+        return [os.path.join(directory, name) for name in listing.subdirs]
+
+    # mtime папки берется до листинга: изменение во время чтения
+    # даст другой ключ при следующем открытии
+    dir_stat = os.stat(directory)
+    listing = ctx.cache.get(directory, dir_stat)
+    if listing is None:
+        listing = _list_dir(directory, ctx.cancel_event, lazy=lazy)
+        if listing is None:
+            return []
+        ctx.cache.put(directory, dir_stat, listing)
+        if lazy:
+            ctx.served.append((directory, dir_stat, listing))
+    else:
+        ctx.served.append((directory, dir_stat, listing))
+
+    ctx.add(directory, [entry for entry in listing.entries if ctx.accepts(entry.name)])
+    if not want_subdirs:
+        return []
+    return [os.path.join(directory, name) for name in listing.subdirs if not ctx.excludes(name)]
+
+
+def _walk_parallel(ctx, roots):
+    """Обход поддеревьев ограниченным пулом потоков
+
+    Очередь папок общая: поток, прочитавший папку, ставит в очередь ее
+    подпапки. Непрочитанные подпапки (нет прав и т.п.) пропускаются.
+    """
+    options = ctx.options
+    work = queue.Queue()
+    for path in roots:
+        work.put((path, 1))
+
+    def worker():
+        while True:
+            item = work.get()
+            if item is None:
+                work.task_done()
+                return
+            directory, depth = item
+            try:
+                if not ctx.cancel_event.is_set():
+                    descend = options.max_depth == 0 or depth < options.max_depth
+                    for subdir in _scan_dir(ctx, directory, descend):
+                        work.put((subdir, depth + 1))
+            except OSError:
+                pass
+            finally:
+                work.task_done()
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, options.workers))]
+    for thread in threads:
+        thread.start()
+    work.join()
+    for _ in threads:
+        work.put(None)
+    for thread in threads:
+        thread.join()
+
+
+def _revalidate(ctx, messages, scan_id):
+    """Фоновое чтение размеров и дат (низкий приоритет)
+
+    Для папок из кэша набор имен совпадает с диском (mtime папки не
+    менялся), но содержимое файлов могло измениться; в ленивом режиме
+    размеры еще не прочитаны вовсе. Изменившиеся записи отправляются
+    сообщениями 'update' и сохраняются в кэш. После каждой группы stat
+    делается пауза, чтобы проход не мешал интерфейсу и диску.
+    """
+    updated = 0
+    done = 0
+    for directory, dir_stat, listing in ctx.served:
+        changed = []
+        dirty = False
+        for position, entry in enumerate(listing.entries):
+            if ctx.cancel_event.is_set():
+                return
+            done += 1
+            if done % STAT_PASS_GROUP == 0:
+                time.sleep(STAT_PASS_PAUSE)
+            try:
+                st = os.stat(os.path.join(directory, entry.name))
+            except OSError:
+                continue
+            if st.st_size != entry.size or st.st_mtime != entry.mtime:
+                fresh = ScanEntry(entry.name, st.st_size, st.st_mtime)
+                listing.entries[position] = fresh
+                dirty = True
+                if ctx.accepts(entry.name):
+                    changed.append(fresh)
+                    if len(changed) >= ctx.batcher.batch_size:
+                        messages.put(('update', scan_id, [(directory, changed)]))
+                        updated += len(changed)
+                        changed = []
+        if changed:
+            messages.put(('update', scan_id, [(directory, changed)]))
+            updated += len(changed)
+        if dirty and ctx.cache is not None and dir_stat is not None:
+            ctx.cache.put(directory, dir_stat, listing)
+    messages.put(('revalidated', scan_id, updated))
@@ -0,0 +1,312 @@
+"""Компактная колоночная таблица файлов"""
+import os
+import re
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import compress, count, repeat
+from operator import lt
+
+from file_scanner import STAT_FAILED, UNKNOWN_SIZE
+
+
+STAT_WORKERS = 16
+STAT_CHUNK = 256  # Путей в одном задании пула read_stats
+SORT_COLUMNS = ('name', 'size', 'modified')
+
+_DIGITS = re.compile(r'(\d+)')
+_NUMBER_WIDTH = 20  # Числа дополняются нулями до одной ширины
+_LONG_NUMBER = ':'  # Идет после цифр: длинные числа - после дополненных
+_KEY_SEPARATOR = '\0'  # Не встречается в именах файлов
+
+
+def format_size(size_bytes):
+    """Форматирование размера файла"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size_bytes < 1024.0:
+            return f"{size_bytes:.1f} {unit}"
+        size_bytes /= 1024.0
+    return f"{size_bytes:.1f} TB"
+
+
+def format_mtime(mtime):
+    """Форматирование времени изменения"""
+    return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M")
+
+
+def natural_key(text):
+    """Ключ естественной сортировки: без учета регистра, file2 раньше file10"""
+    parts = _DIGITS.split(text.casefold())
+    _pad_numbers(parts)
+    return ''.join(parts)
+
+
+def _pad_numbers(parts):
+    """Замена чисел (нечетные элементы parts) сравнимыми как строки ключами
+
+    Числа до _NUMBER_WIDTH цифр дополняются нулями (map на C). Более
+    длинные (отметки времени со счетчиком, длинные ID) встречаются
+    редко и получают префикс _LONG_NUMBER и длину: такое число больше
+    любого короткого, а между собой длинные сравниваются по длине.
+    """
+    numbers = parts[1::2]
+    parts[1::2] = map(str.zfill, numbers, repeat(_NUMBER_WIDTH))
+    for position in compress(count(1, 2), map(lt, repeat(_NUMBER_WIDTH), map(len, numbers))):
+        digits = parts[position].lstrip('0') or '0'
+        if len(digits) > _NUMBER_WIDTH:
+            parts[position] = f"{_LONG_NUMBER}{len(digits):03d}{digits}"
+        else:
+            parts[position] = digits.zfill(_NUMBER_WIDTH)
+
+
+def natural_keys(texts):
+    """Ключи natural_key для списка строк
+
+    Все строки склеиваются в одну, поэтому разбиение, дополнение чисел
+    и casefold выполняются несколькими вызовами на C, а не по строке.
+    """
+    if not texts:
+        return []
+    parts = _DIGITS.split(_KEY_SEPARATOR.join(texts).casefold())
+    _pad_numbers(parts)
+    return ''.join(parts).split(_KEY_SEPARATOR)
+
+
+def read_stats(paths, workers=STAT_WORKERS):
+    """os.stat для списка путей пулом потоков (None для недоступных)
+
+    stat отпускает GIL, поэтому на сетевых ФС пул скрывает задержку
+    каждого вызова.
+    """
+    paths = list(paths)
+    # Пачками: отправка каждого пути в пул отдельно дороже самого stat на локальном диске
+    size = max(1, min(STAT_CHUNK, len(paths) // (workers * 4)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        chunks = pool.map(_stat_chunk, (paths[i:i + size] for i in range(0, len(paths), size)))
+        return [st for chunk in chunks for st in chunk]
+
+
+class FileTable:
+    """Список файлов в виде набора столбцов (struct-of-arrays)
+
+    Имена хранятся списком строк, размеры и время изменения - в
+    типизированных массивах int64/float64, папка - номером в списке
+    папок. Строки для отображения форматируются только по запросу,
+    то есть лишь для видимых строк списка.
+
+    В ленивом режиме размер равен UNKNOWN_SIZE, пока не прочитан:
+    fetch_stat() читает одну строку (видимую), fetch_stats() - все
+    недостающие разом (например, перед сортировкой по размеру).
+
+    name_keys - ключи естественной сортировки имен, считаются пачкой
+    при добавлении строк. name_ranks - место каждой строки в порядке
+    имен (по папкам, затем по имени); считается по ключам один раз и
+    переставляется вместе со строками, поэтому повторная сортировка -
+    это перестановка номеров без сравнения строк.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.name_keys = []
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.dir_ids = array('I')
+        self.dirs = []
+        self._dir_ids_by_path = {}
+        self._index = None  # (номер папки, имя) -> номер строки, строится по запросу
+        self.name_ranks = None  # array('I') или None, если устарели
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_dir(self, path):
+        """Номер папки в таблице (папка добавляется при первом обращении)"""
+        dir_id = self._dir_ids_by_path.get(path)
+        if dir_id is None:
+            dir_id = len(self.dirs)
+            self.dirs.append(path)
+            self._dir_ids_by_path[path] = dir_id
+        return dir_id
+
+    def append(self, name, size, mtime, dir_id):
+        if self._index is not None:
+            self._index[(dir_id, name)] = len(self.names)
+        self.name_ranks = None
+        self.names.append(name)
+        self.name_keys.append(natural_key(name))
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.dir_ids.append(dir_id)
+
+    def extend(self, entries, dir_id):
+        """Добавление пачки записей сканера из одной папки"""
+        if self._index is not None:
+            start = len(self.names)
+            for offset, entry in enumerate(entries):
+                self._index[(dir_id, entry.name)] = start + offset
+        self.name_ranks = None
+        names = [entry.name for entry in entries]
+        self.names.extend(names)
+        self.name_keys.extend(natural_keys(names))
+        self.sizes.extend(entry.size for entry in entries)
+        self.mtimes.extend(entry.mtime for entry in entries)
+        self.dir_ids.extend([dir_id] * len(entries))
+
+    def snapshot(self):
+        """Копия таблицы для чтения из фонового потока"""
+        copy = FileTable()
+        copy.names = list(self.names)
+        copy.name_keys = list(self.name_keys)
+        copy.sizes = array('q', self.sizes)
+        copy.mtimes = array('d', self.mtimes)
+        copy.dir_ids = array('I', self.dir_ids)
+        copy.dirs = list(self.dirs)
+        copy._dir_ids_by_path = dict(self._dir_ids_by_path)
+        return copy
+
+    def dir_of(self, index):
+        return self.dirs[self.dir_ids[index]]
+
+    def path(self, index):
+        """Полный путь к файлу"""
+        return os.path.join(self.dirs[self.dir_ids[index]], self.names[index])
+
+    def names_by_dir(self):
+        """Множества имен файлов по папкам (для проверки коллизий без диска)"""
+        result = {path: set() for path in self.dirs}
+        for name, dir_id in zip(self.names, self.dir_ids):
+            result[self.dirs[dir_id]].add(name)
+        return result
+
+    def find(self, directory, name):
+        """Номер строки файла или None"""
+        dir_id = self._dir_ids_by_path.get(directory)
+        if dir_id is None:
+            return None
+        if self._index is None:
+            self._index = {key: i for i, key in enumerate(zip(self.dir_ids, self.names))}
+        return self._index.get((dir_id, name))
+
+    def update_stat(self, index, size, mtime):
+        """Новые размер и время изменения файла"""
+        self.sizes[index] = size
+        self.mtimes[index] = mtime
+
+    def remove(self, indices):
+        """Удаление строк; возвращает order для SelectionModel.permute"""
+        indices = set(indices)
+        order = [i for i in range(len(self.names)) if i not in indices]
+        self.permute(order)
+        return order
+
+    def has_stat(self, index):
+        return self.sizes[index] != UNKNOWN_SIZE
+
+    def fetch_stat(self, index):
+        """Чтение размера и даты одного файла, если они еще не известны"""
+        if self.sizes[index] == UNKNOWN_SIZE:
+            self.store_stat(index, _stat_or_none(self.path(index)))
+
+    def missing_stats(self):
+        """Номера строк с еще не прочитанными размером и датой"""
+        return [i for i, size in enumerate(self.sizes) if size == UNKNOWN_SIZE]
+
+    def fetch_stats(self, workers=STAT_WORKERS):
+        """Чтение всех неизвестных размеров и дат параллельно (read_stats)
+
+        Возвращает число прочитанных строк.
+        """
+        missing = self.missing_stats()
+        for index, st in zip(missing, read_stats(map(self.path, missing), workers)):
+            self.store_stat(index, st)
+        return len(missing)
+
+    def store_stat(self, index, st):
+        """Размер и дата из результата os.stat (None - файл недоступен)"""
+        if st is None:
+            self.sizes[index] = STAT_FAILED
+        else:
+            self.sizes[index] = st.st_size
+            self.mtimes[index] = st.st_mtime
+
+    def display_size(self, index):
+        size = self.sizes[index]
+        if size == UNKNOWN_SIZE:
+            return "…"
+        if size == STAT_FAILED:
+            return "?"
+        return format_size(size)
+
+    def display_mtime(self, index):
+        size = self.sizes[index]
+        if size == UNKNOWN_SIZE:
+            return "…"
+        if size == STAT_FAILED:
+            return "?"
+        return format_mtime(self.mtimes[index])
+
+    def rename(self, index, new_name):
+        """Обновление имени после переименования на диске"""
+        if self._index is not None:
+            self._index.pop((self.dir_ids[index], self.names[index]), None)
+            self._index[(self.dir_ids[index], new_name)] = index
+        self.names[index] = new_name
+        self.name_keys[index] = natural_key(new_name)
+        self.name_ranks = None
+
+    def permute(self, order):
+        """Переупорядочивание всех столбцов (order[new] = old)"""
+        self.names = [self.names[i] for i in order]
+        self.name_keys = [self.name_keys[i] for i in order]
+        self.sizes = array('q', map(self.sizes.__getitem__, order))
+        self.mtimes = array('d', map(self.mtimes.__getitem__, order))
+        self.dir_ids = array('I', map(self.dir_ids.__getitem__, order))
+        if self.name_ranks is not None:
+            self.name_ranks = array('I', map(self.name_ranks.__getitem__, order))
+        self._index = None
+
+    def compute_name_ranks(self):
+        """Места строк в естественном порядке: папка, затем имя"""
+        order = sorted(range(len(self.name_keys)), key=self.name_keys.__getitem__)
+        if len(self.dirs) > 1:
+            dir_keys = natural_keys(self.dirs)
+            dir_rank = array('I', bytes(4 * len(self.dirs)))
+            for rank, dir_id in enumerate(sorted(range(len(dir_keys)), key=dir_keys.__getitem__)):
+                dir_rank[dir_id] = rank
+            # Устойчивая сортировка по папке сохраняет порядок имен внутри папки
+            row_dir_rank = array('I', map(dir_rank.__getitem__, self.dir_ids))
+            order.sort(key=row_dir_rank.__getitem__)
+        ranks = array('I', bytes(4 * len(order)))
+        for rank, row in enumerate(order):
+            ranks[row] = rank
+        self.name_ranks = ranks
+
+    def sort_order(self, column='name', reverse=False):
+        """Порядок строк (order[new] = old) для permute по столбцу SORT_COLUMNS
+
+        Размер и дата сортируются устойчиво поверх порядка имен, так что
+        равные значения остаются в естественном порядке имен. Для
+        неизвестных размеров (ленивый режим) их сначала нужно прочитать.
+        """
+        if column not in SORT_COLUMNS:
+            raise ValueError(f"Неизвестный столбец сортировки: {column}")
+        if self.name_ranks is None:
+            self.compute_name_ranks()
+        order = sorted(range(len(self.names)), key=self.name_ranks.__getitem__)
+        if column == 'name':
+            if reverse:
+                order.reverse()
+            return order
+        values = self.sizes if column == 'size' else self.mtimes
+        return sorted(order, key=values.__getitem__, reverse=reverse)
+
+
+def _stat_chunk(paths):
+    return [_stat_or_none(path) for path in paths]
+
+
+def _stat_or_none(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
@@ -0,0 +1,301 @@
+"""Слежение за папками: inotify (Linux) или периодический опрос"""
+import ctypes
+import os
+import queue
+import select
+import stat
+import struct
+import sys
+import threading
+import time
+
+from file_scanner import ScanEntry
+
+
+# linux/inotify.h
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+POLL_INTERVAL = 2.0
+MOVE_PAIR_TIMEOUT = 0.2  # Сколько ждать IN_MOVED_TO к IN_MOVED_FROM из прошлого чтения
+
+
+def _load_inotify():
+    """(inotify_init1, inotify_add_watch) из libc или None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        init1, add_watch = libc.inotify_init1, libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    init1.argtypes = [ctypes.c_int]
+    init1.restype = ctypes.c_int
+    add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    add_watch.restype = ctypes.c_int
+    return init1, add_watch
+
+
+_inotify = _load_inotify()
+
+INOTIFY_SUPPORTED = _inotify is not None
+
+
+def _stat_entry(directory, name):
+    """Запись о файле (None - это не обычный файл или его уже нет)"""
+    try:
+        st = os.stat(os.path.join(directory, name))
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return ScanEntry(name, st.st_size, st.st_mtime)
+
+
+class _Watcher:
+    """Общая часть: поток, очередь событий, фильтр имен
+
+    События - кортежи (kind, directory, name, entry):
+      added    - новый файл, entry - ScanEntry;
+      modified - изменился размер или время, entry - ScanEntry;
+      removed  - файла больше нет, entry - None;
+      renamed  - name переименован в entry.name;
+      rescan   - события потеряны, нужен полный перечитанный список;
+      gone     - наблюдаемая папка удалена или перемещена.
+    accept(name) отсекает имена, не попадающие в список (шаблоны).
+    """
+
+    kind = ''
+
+    def __init__(self, directories, accept=None):
+        self.directories = list(directories)
+        self.accept = accept or (lambda name: True)
+        self.events = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def poll(self, max_events=10000):
+        """Накопившиеся события без блокировки"""
+        result = []
+        while len(result) < max_events:
+            try:
+                result.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return result
+
+    def _emit_file(self, kind, directory, name):
+        if not self.accept(name):
+            return
+        entry = _stat_entry(directory, name)
+        if entry is not None:
+            self.events.put((kind, directory, name, entry))
+
+    def _emit_rename(self, directory, old_name, new_name):
+        entry = _stat_entry(directory, new_name) if self.accept(new_name) else None
+        if entry is None:
+            self.events.put(('removed', directory, old_name, None))
+        else:
+            self.events.put(('renamed', directory, old_name, entry))
+
+    def _run(self):
+        raise NotImplementedError
+
+
+class InotifyWatcher(_Watcher):
+    """Слежение через inotify: события ядра без перечитывания папок
+
+    Переименование внутри папки приходит парой IN_MOVED_FROM/IN_MOVED_TO
+    с общим cookie; пара может разойтись по двум чтениям, поэтому
+    IN_MOVED_FROM ждет пару MOVE_PAIR_TIMEOUT. Непарный IN_MOVED_FROM -
+    файл унесен из папки.
+    Вложенные папки, созданные после запуска, не отслеживаются.
+    """
+
+    kind = 'inotify'
+
+    def __init__(self, directories, accept=None):
+        super().__init__(directories, accept)
+        init1, add_watch = _inotify
+        self._fd = init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self._dirs_by_wd = {}
+        self._moved_from = {}  # cookie -> (папка, имя, срок ожидания пары)
+        try:
+            for directory in self.directories:
+                wd = add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+                if wd < 0:
+                    code = ctypes.get_errno()
+                    raise OSError(code, os.strerror(code), directory)
+                self._dirs_by_wd[wd] = directory
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _run(self):
+        try:
+            while not self._stop_event.is_set():
+                timeout = 0.5
+                if self._moved_from:
+                    deadline = min(deadline for _, _, deadline in self._moved_from.values())
+                    timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+                ready, _, _ = select.select([self._fd], [], [], timeout)
+                if ready:
+                    try:
+                        self._dispatch(os.read(self._fd, 256 * 1024))
+                    except BlockingIOError:
+                        pass
+                self._flush_moves(time.monotonic())
+        finally:
+            os.close(self._fd)
+
+    def _dispatch(self, data):
+        moved_from = self._moved_from
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                self.events.put(('rescan', None, None, None))
+                continue
+            directory = self._dirs_by_wd.get(wd)
+            if directory is None or mask & IN_ISDIR:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self.events.put(('gone', directory, None, None))
+            elif mask & IN_IGNORED:
+                self._dirs_by_wd.pop(wd, None)
+            elif mask & IN_MOVED_FROM:
+                moved_from[cookie] = (directory, name, time.monotonic() + MOVE_PAIR_TIMEOUT)
+            elif mask & IN_MOVED_TO:
+                source = moved_from.pop(cookie, None)
+                if source is not None and source[0] == directory:
+                    self._emit_rename(directory, source[1], name)
+                else:
+                    if source is not None:
+                        self.events.put(('removed', source[0], source[1], None))
+                    self._emit_file('added', directory, name)
+            elif mask & IN_CREATE:
+                self._emit_file('added', directory, name)
+            elif mask & IN_DELETE:
+                self.events.put(('removed', directory, name, None))
+            elif mask & (IN_CLOSE_WRITE | IN_ATTRIB):
+                self._emit_file('modified', directory, name)
+
+    def _flush_moves(self, now):
+        """IN_MOVED_FROM без пары за MOVE_PAIR_TIMEOUT - перемещены за пределы наблюдаемых папок"""
+        for cookie, (directory, name, deadline) in list(self._moved_from.items()):
+            if deadline <= now:
+                del self._moved_from[cookie]
+                self.events.put(('removed', directory, name, None))
+
+
+class PollingWatcher(_Watcher):
+    """Слежение опросом: сравнение листингов папок
+
+    Переименование распознается по совпадению inode у исчезнувшего и
+    появившегося имени. Интервал растет вместе со временем листинга,
+    чтобы опрос больших папок не занимал диск постоянно.
+    """
+
+    kind = 'polling'
+
+    def __init__(self, directories, accept=None, interval=POLL_INTERVAL):
+        super().__init__(directories, accept)
+        self.interval = interval
+        self._listings = {}
+
+    def _list(self, directory):
+        """Имя -> (inode, размер, время в нс) для обычных файлов папки"""
+        listing = {}
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    if not entry.is_file() or not self.accept(entry.name):
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                listing[entry.name] = (st.st_ino, st.st_size, st.st_mtime_ns)
+        return listing
+
+    def _run(self):
+        for directory in self.directories:
+            try:
+                self._listings[directory] = self._list(directory)
+            except OSError:
+                self._listings[directory] = {}
+
+        delay = self.interval
+        while not self._stop_event.wait(delay):
+            started = time.monotonic()
+            for directory in list(self._listings):
+                if self._stop_event.is_set():
+                    return
+                try:
+                    current = self._list(directory)
+                except FileNotFoundError:
+                    self.events.put(('gone', directory, None, None))
+                    del self._listings[directory]
+                    continue
+                except OSError:
+                    continue
+                self._diff(directory, self._listings[directory], current)
+                self._listings[directory] = current
+            delay = max(self.interval, (time.monotonic() - started) * 10)
+
+    def _diff(self, directory, previous, current):
+        removed = {name: previous[name][0] for name in previous.keys() - current.keys()}
+        added = current.keys() - previous.keys()
+        removed_by_inode = {inode: name for name, inode in removed.items()}
+
+        for name in added:
+            inode, size, mtime_ns = current[name]
+            old_name = removed_by_inode.pop(inode, None)
+            if old_name is not None:
+                del removed[old_name]
+                self.events.put(('renamed', directory, old_name, ScanEntry(name, size, mtime_ns / 1e9)))
+            else:
+                self.events.put(('added', directory, name, ScanEntry(name, size, mtime_ns / 1e9)))
+        for name in removed:
+            self.events.put(('removed', directory, name, None))
+        for name in previous.keys() & current.keys():
+            if previous[name] != current[name]:
+                inode, size, mtime_ns = current[name]
+                self.events.put(('modified', directory, name, ScanEntry(name, size, mtime_ns / 1e9)))
+
+
+def make_watcher(directories, accept=None):
+    """inotify, если доступен, иначе опрос"""
+    if INOTIFY_SUPPORTED:
+        try:
+            return InotifyWatcher(directories, accept)
+        except OSError:
+            pass  # Например, исчерпан лимит max_user_watches
+    return PollingWatcher(directories, accept)
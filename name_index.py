@@ -0,0 +1,246 @@
+"""Индекс имен файлов для мгновенного фильтра списка"""
+import fnmatch
+import operator
+import re
+from array import array
+from bisect import bisect_right
+from itertools import compress, repeat
+
+try:
+    from re import _parser as _sre_parse  # Python 3.11+
+except ImportError:
+    try:
+        import sre_parse as _sre_parse
+    except ImportError:
+        _sre_parse = None  # Без разбора выражений - без обязательного литерала
+
+
+FILTER_MODES = ('substring', 'glob', 'regex')
+
+_SEPARATOR = '\0'  # Не встречается в именах файлов
+_SAMPLE_PARTS = 16  # Доля текста для оценки числа совпадений
+_DENSE_SHARE = 32   # Совпадений больше 1/32 имен - проверка подряд
+_GLOB_SPECIALS = re.compile(r'\*|\?|\[[^\]]*\]')
+
+# Проверка имени без регулярного выражения: (имя, подстрока) -> bool
+_CONTAINS = operator.contains
+_STARTSWITH = str.startswith
+_ENDSWITH = str.endswith
+_EQUALS = operator.eq
+
+# Буквы, которые re.IGNORECASE считает равными, хотя lower() у них разный
+# (по re._compiler._EXTRA_CASES); на текущем Python проверяются при импорте
+_CASE_GROUPS = (
+    'iı', 'sſ', 'µμ', '\u0345\u03b9\u1fbe', '\u0390\u1fd3', '\u03b0\u1fe3',
+    'βϐ', 'εϵ', 'θϑ', 'κϰ', 'πϖ', 'ρϱ', 'ςσ', 'φϕ',
+    'в\u1c80', 'д\u1c81', 'о\u1c82', 'с\u1c83', 'т\u1c84\u1c85', 'ъ\u1c86', 'ѣ\u1c87',
+    '\ua64b\u1c88', '\u1e61\u1e9b', '\ufb05\ufb06',
+)
+
+
+def _fold_table():
+    """Буквы, равные для re.IGNORECASE, -> наименьшая буква группы
+
+    re без учета регистра сравнивает символы по lower() и нескольким
+    дополнительным парам (ı и i, ſ и s, ς и σ, ...). Замена таких букв
+    одной делает свертку fold_name согласованной с re.IGNORECASE, в
+    отличие от casefold (ß -> ss). Пара попадает в таблицу, только
+    если re действительно считает ее равной.
+    """
+    table = {}
+    for group in _CASE_GROUPS:
+        canonical = min(group)
+        for char in group:
+            if char != canonical and re.fullmatch(re.escape(canonical), char, re.IGNORECASE):
+                table[char] = canonical
+    return table
+
+
+_FOLD = _fold_table()
+# Замена через re.sub, а не str.translate: translate по не-ASCII тексту
+# перебирает каждый символ, а таких букв в именах почти нет
+_FOLD_CHARS = re.compile('[%s]' % re.escape(''.join(_FOLD))) if _FOLD else None
+
+
+def _fold_char(match):
+    return _FOLD[match.group()]
+
+
+def fold_name(text):
+    """Имя без учета регистра; длина не меняется (позиции совпадают с исходным)"""
+    if text.isascii():
+        return text.lower()
+    if 'İ' in text:
+        text = text.replace('İ', 'i')  # Единственная буква, у которой lower() - два символа
+    text = text.lower()
+    return _FOLD_CHARS.sub(_fold_char, text) if _FOLD_CHARS is not None else text
+
+
+class NameFilter:
+    """Разобранный запрос фильтра (без учета регистра)
+
+    literal - подстрока (в свертке fold_name), которая обязана входить
+    в свернутое подходящее имя (по ней индекс находит кандидатов).
+    Подстрока и шаблон сравниваются со свернутыми именами: простые
+    шаблоны (*.jpg, IMG*, *отчёт*) - строковыми методами, остальные -
+    регулярным выражением. Регулярное выражение пользователя
+    проверяется на исходных именах с re.IGNORECASE. re.error
+    пробрасывается для некорректного выражения.
+    """
+
+    def __init__(self, text, mode='substring'):
+        if mode not in FILTER_MODES:
+            raise ValueError(f"Неизвестный режим фильтра: {mode}")
+        self.text = text
+        self.mode = mode
+        self.pattern = None
+        self.test = None
+        folded = fold_name(text)
+        if mode == 'substring':
+            self.literal, self.test = folded, _CONTAINS
+        elif mode == 'glob':
+            # Шаблон - на все имя, как фильтры сканирования
+            core = folded.strip('*')
+            if _GLOB_SPECIALS.search(core) is None:
+                self.literal = core
+                self.test = {(True, True): _CONTAINS, (False, True): _STARTSWITH,
+                             (True, False): _ENDSWITH, (False, False): _EQUALS}[
+                    (folded.startswith('*'), folded.endswith('*'))]
+            else:
+                self.pattern = re.compile(fnmatch.translate(folded))
+                self.literal = max(_GLOB_SPECIALS.split(folded), key=len)
+        else:
+            # Свертка имен совпадает с re.IGNORECASE, поэтому обязательный
+            # литерал в свертке ищется в свернутых именах без пропусков
+            self.pattern = re.compile(text, re.IGNORECASE)
+            self.literal = fold_name(_required_literal(text))
+
+    def matches(self, folded_name, name):
+        if self.test is not None:
+            return self.test(folded_name, self.literal)
+        if self.mode == 'glob':
+            return self.pattern.match(folded_name) is not None
+        return self.pattern.search(name) is not None
+
+    def select(self, rows, folded_names, names):
+        """Подходящие номера из rows (folded_names[i] и names[i] - имя строки rows[i]) без цикла Python"""
+        if self.test is not None:
+            return compress(rows, map(self.test, folded_names, repeat(self.literal)))
+        if self.mode == 'glob':
+            names, check = folded_names, self.pattern.match
+        else:
+            check = self.pattern.search
+        if self.literal:
+            # Регулярное выражение - только для имен с обязательной подстрокой
+            flags = list(map(_CONTAINS, folded_names, repeat(self.literal)))
+            rows = list(compress(rows, flags))
+            names = list(compress(names, flags))
+        return compress(rows, map(check, names))
+
+
+def _required_literal(pattern):
+    """Самый длинный обязательный фрагмент текста регулярного выражения
+
+    Берутся только подряд идущие литералы верхнего уровня; если их
+    нет (альтернатива, группы) или разбор не удался - пустая строка,
+    и имена проверяются перебором.
+    """
+    if _sre_parse is None:
+        return ''
+    try:
+        parsed = _sre_parse.parse(pattern)
+    except Exception:
+        return ''
+    best, run = '', []
+    for op, value in list(parsed) + [(None, None)]:
+        if op == _sre_parse.LITERAL:
+            run.append(chr(value))
+            continue
+        if len(run) > len(best):
+            best = ''.join(run)
+        run = []
+    return best
+
+
+class _Part:
+    """Часть индекса: имена подряд с base-й строки"""
+    __slots__ = ('base', 'text', 'starts', 'names', 'folded')
+
+    def __init__(self, base, names):
+        self.base = base
+        self.names = names  # Исходные имена - для регулярного выражения
+        # fold_name не меняет длину, поэтому сворачивается сразу вся строка
+        self.text = fold_name(_SEPARATOR.join(names) + _SEPARATOR)
+        # Начала имен в text плюс концевое значение
+        self.starts = array('q', [0])
+        position = 0
+        for name in names:
+            position += len(name) + 1
+            self.starts.append(position)
+        self.folded = None  # Список свернутых имен, создается при первом переборе
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+
+class NameIndex:
+    """Имена файлов без учета регистра (fold_name), склеенные в строки
+
+    Каждая часть индекса - одна строка "имя\\0имя\\0..." и массив
+    начальных позиций имен. Обязательная подстрока запроса ищется
+    str.find по всей части (цикл на C), номер строки по позиции
+    находится двоичным поиском, поэтому стоимость запроса зависит от
+    числа совпадений, а не от числа файлов. Если совпадений много
+    (короткая подстрока, общее расширение) или обязательной подстроки
+    нет, имена проверяются подряд через map - тоже без цикла Python.
+    Новые файлы добавляются отдельной частью без перестройки старых.
+    """
+
+    def __init__(self, names=()):
+        self._parts = []
+        self.count = 0
+        self.extend(names)
+
+    def __len__(self):
+        return self.count
+
+    def extend(self, names):
+        """Добавление имен в конец (номера строк продолжают существующие)"""
+        names = list(names)
+        if names:
+            self._parts.append(_Part(self.count, names))
+            self.count += len(names)
+
+    def search(self, name_filter, start=0):
+        """Номера подходящих строк (с start) по возрастанию, array('I')"""
+        rows = array('I')
+        literal = name_filter.literal
+        for part in self._parts:
+            if part.base + len(part) <= start:
+                continue
+            text = part.text
+            # Оценка числа совпадений по началу текста
+            if literal and text.count(literal, 0, len(text) // _SAMPLE_PARTS) * _SAMPLE_PARTS \
+                    < len(part) // _DENSE_SHARE:
+                self._search_literal(name_filter, part, rows)
+            else:
+                if part.folded is None:
+                    part.folded = text[:-1].split(_SEPARATOR)
+                rows.extend(name_filter.select(range(part.base, part.base + len(part)),
+                                               part.folded, part.names))
+        if start:
+            rows = rows[bisect_right(rows, start - 1):]
+        return rows
+
+    @staticmethod
+    def _search_literal(name_filter, part, rows):
+        literal, text, starts, base = name_filter.literal, part.text, part.starts, part.base
+        find = text.find
+        position = find(literal)
+        while position >= 0:
+            row = bisect_right(starts, position) - 1
+            end = starts[row + 1] - 1
+            if name_filter.matches(text[starts[row]:end], part.names[row]):
+                rows.append(base + row)
+            # Следующий поиск - со следующего имени: строка попадает один раз
+            position = find(literal, end + 1)
@@ -0,0 +1,182 @@
+"""Замеры этапов работы (кольцевой буфер) и профилирование по запросу"""
+import cProfile
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+RING_SIZE = 256
+
+
+def io_syscalls():
+    """Число системных вызовов чтения и записи процесса
+
+    Счетчики syscr/syscw из /proc/self/io (Linux); на других
+    платформах - None. Вызовы stat, rename и листинга папок ядро
+    здесь не считает, для них показатель - число элементов этапа.
+    """
+    try:
+        with open('/proc/self/io', 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    counts = dict(line.split(b':', 1) for line in data.splitlines() if b':' in line)
+    try:
+        return int(counts[b'syscr']) + int(counts[b'syscw'])
+    except (KeyError, ValueError):
+        return None
+
+
+def _self_cost():
+    first = io_syscalls()
+    return 0 if first is None else io_syscalls() - first
+
+
+_SELF_COST = _self_cost()  # Вызовы, которые делает само чтение /proc/self/io
+
+
+class PhaseRecord:
+    """Один завершенный этап"""
+    __slots__ = ('name', 'started', 'seconds', 'items', 'syscalls', 'thread')
+
+    def __init__(self, name, started, seconds, items, syscalls, thread):
+        self.name = name
+        self.started = started  # time.time() начала
+        self.seconds = seconds
+        self.items = items
+        self.syscalls = syscalls  # Только вызовы чтения/записи (syscr + syscw); None - счетчик недоступен
+        self.thread = thread
+
+
+class Phase:
+    """Начатый этап; items можно уточнить до завершения"""
+    __slots__ = ('name', 'items', 'started', 'perf', 'syscalls', 'thread')
+
+    def __init__(self, name, items):
+        self.name = name
+        self.items = items
+        self.started = time.time()
+        self.perf = time.perf_counter()
+        self.syscalls = io_syscalls()
+        self.thread = threading.current_thread().name
+
+
+class PhaseTimer:
+    """Длительности этапов в кольцевом буфере последних RING_SIZE записей
+
+    Синхронный этап замеряется блоком with measure(...), а этап,
+    который начинается в одном обработчике и заканчивается в другом
+    (фоновое сканирование, предпросмотр, выполнение плана), - парой
+    begin()/end(). Незавершенный этап (отменен, вытеснен новым) просто
+    не попадает в буфер.
+    """
+
+    def __init__(self, size=RING_SIZE):
+        self.records = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def begin(self, name, items=0):
+        return Phase(name, items)
+
+    def end(self, phase, items=None):
+        """Завершение этапа и запись в буфер"""
+        seconds = time.perf_counter() - phase.perf
+        syscalls = io_syscalls()
+        if syscalls is not None and phase.syscalls is not None:
+            syscalls = max(0, syscalls - phase.syscalls - _SELF_COST)
+        else:
+            syscalls = None
+        record = PhaseRecord(phase.name, phase.started, seconds,
+                             phase.items if items is None else items, syscalls, phase.thread)
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def measure(self, name, items=0):
+        """Контекстный менеджер для синхронного этапа"""
+        return _Measure(self, name, items)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.records)
+
+    def summary(self):
+        """Имя этапа -> (число, последняя запись, среднее, максимум), в порядке первого появления"""
+        by_name = {}
+        for record in self.snapshot():
+            by_name.setdefault(record.name, []).append(record)
+        return {name: (len(records), records[-1],
+                       sum(r.seconds for r in records) / len(records),
+                       max(r.seconds for r in records))
+                for name, records in by_name.items()}
+
+    def summary_lines(self):
+        """Строки для окна статистики"""
+        lines = []
+        for name, (count, last, mean, peak) in self.summary().items():
+            details = f"{last.items} эл."
+            if last.syscalls is not None:
+                details += f", {last.syscalls} выз. read/write"
+            lines.append(f"{name}: {count} раз, последний {last.seconds:.3f} с ({details}), "
+                         f"среднее {mean:.3f} с, макс. {peak:.3f} с")
+        return lines
+
+    def export_trace(self, path):
+        """Запись буфера в формате Chrome Trace Event (chrome://tracing, Perfetto)"""
+        pid = os.getpid()
+        records = self.snapshot()
+        # Номера потоков для формата и их имена отдельными записями
+        tids = {}
+        for record in records:
+            tids.setdefault(record.thread, len(tids) + 1)
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread}}
+                  for thread, tid in tids.items()]
+        events.extend({'name': r.name, 'ph': 'X', 'pid': pid, 'tid': tids[r.thread],
+                       'ts': round(r.started * 1e6), 'dur': round(r.seconds * 1e6),
+                       'args': {'items': r.items, 'read_write_syscalls': r.syscalls}}
+                      for r in records)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+
+class _Measure:
+    def __init__(self, timer, name, items):
+        self.timer = timer
+        self.phase = timer.begin(name, items)
+
+    def __enter__(self):
+        return self.phase
+
+    def __exit__(self, *exc_info):
+        self.timer.end(self.phase)
+        return False
+
+
+class ProfileCapture:
+    """Профиль cProfile потока интерфейса, включаемый пользователем
+
+    Зависание окна - это всегда занятый поток Tk, поэтому профилируется
+    он; фоновые этапы видны во временной шкале PhaseTimer.export_trace.
+    Результат сохраняется в формате pstats (python -m pstats, snakeviz).
+    """
+
+    def __init__(self):
+        self.profile = None
+        self.running = False
+
+    def start(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self.running = True
+
+    def stop(self):
+        if self.running:
+            self.profile.disable()
+            self.running = False
+
+    def export(self, path):
+        """Сохранение собранного профиля (сбор при этом останавливается)"""
+        self.stop()
+        self.profile.dump_stats(path)
@@ -0,0 +1,147 @@
+"""Фоновый расчет предпросмотра переименования"""
+import queue
+import threading
+
+from rename_engine import metadata_fields, rename_grouped
+from rename_planner import build_rename_plan
+
+
+# Состояние строки предпросмотра
+ROW_CHANGED = 0
+ROW_UNCHANGED = 1
+ROW_CONFLICT = 2
+
+CHUNK_SIZE = 20000
+
+
+class PreviewResult:
+    """Старые и новые имена всего выбора, состояние строк и план"""
+
+    def __init__(self, old_names, new_names, directories, states, reasons, plan):
+        self.old_names = old_names
+        self.new_names = new_names
+        self.directories = directories
+        self.states = states
+        self.reasons = reasons  # строка -> причина конфликта
+        self.plan = plan
+
+    def __len__(self):
+        return len(self.old_names)
+
+
+def compute_preview(params, selected_indices, table, is_stale=lambda: False, existing_by_dir=None,
+                    metadata_store=None, on_progress=None):
+    """Расчет предпросмотра по снимку таблицы файлов
+
+    Нумерация, проверка коллизий и план строятся отдельно для каждой
+    папки. Имена считаются частями, между частями проверяется, не
+    устарел ли запрос, - при быстром наборе текста лишняя работа
+    прерывается. Метаданные для шаблона имени берутся из
+    metadata_store (MetadataStore). Возвращает PreviewResult или None,
+    если запрос устарел.
+    """
+    names, dir_ids = table.names, table.dir_ids
+    old_names = [names[i] for i in selected_indices]
+    total = len(old_names)
+
+    metadata = None
+    fields = metadata_fields(params)
+    if fields and metadata_store is not None:
+        metadata = metadata_store.get([table.path(i) for i in selected_indices], fields,
+                                      is_stale, on_progress)
+        if metadata is None:
+            return None
+
+    new_names = rename_grouped(params, old_names, [dir_ids[i] for i in selected_indices],
+                               is_stale, CHUNK_SIZE, metadata)
+    if new_names is None or is_stale():
+        return None
+    directories = [table.dir_of(i) for i in selected_indices]
+    items = [(file_index, directory, old, new)
+             for file_index, directory, old, new in zip(selected_indices, directories, old_names, new_names)]
+    if existing_by_dir is None:
+        existing_by_dir = table.names_by_dir()
+    plan = build_rename_plan(items, existing_by_dir)
+
+    states = bytearray(total)
+    position = {file_index: row for row, file_index in enumerate(selected_indices)}
+    for row in range(total):
+        if old_names[row] == new_names[row]:
+            states[row] = ROW_UNCHANGED
+    reasons = {}
+    for conflict in plan.conflicts:
+        row = position[conflict.index]
+        states[row] = ROW_CONFLICT
+        reasons[row] = conflict.reason
+
+    return PreviewResult(old_names, new_names, directories, states, reasons, plan)
+
+
+class PreviewWorker:
+    """Рабочий поток, выполняющий только последний запрос
+
+    Новый запрос вытесняет ожидающий, а выполняемый сейчас
+    прерывается на ближайшей проверке is_stale. Готовые результаты
+    забираются из потока интерфейса методом poll(), а progress -
+    (готово, всего) при извлечении метаданных текущего запроса.
+    """
+
+    def __init__(self, metadata_store=None):
+        self.metadata_store = metadata_store
+        self.progress = None
+        self.results = queue.Queue()
+        self.generation = 0
+        self._pending = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, params, selected_indices, table):
+        """Новый запрос; возвращает его номер"""
+        with self._condition:
+            self.generation += 1
+            self._pending = (self.generation, params, selected_indices, table)
+            self._condition.notify()
+            return self.generation
+
+    def cancel(self):
+        """Отказ от текущего запроса (его результат не будет выдан)"""
+        with self._condition:
+            self.generation += 1
+            self._pending = None
+
+    def poll(self):
+        """Последний готовый результат актуального запроса (или None)"""
+        latest = None
+        while True:
+            try:
+                generation, result = self.results.get_nowait()
+            except queue.Empty:
+                return latest
+            if generation == self.generation:
+                latest = result
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                generation, params, selected_indices, table = self._pending
+                self._pending = None
+
+            def is_stale():
+                return generation != self.generation
+
+            def on_progress(done, total):
+                if not is_stale():
+                    self.progress = (done, total)
+
+            self.progress = None
+            try:
+                result = compute_preview(params, selected_indices, table, is_stale,
+                                         metadata_store=self.metadata_store, on_progress=on_progress)
+            except Exception as e:
+                result = e
+            self.progress = None
+            if result is not None:
+                self.results.put((generation, result))
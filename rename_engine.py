@@ -0,0 +1,383 @@
+"""Движок переименования файлов (без зависимости от Tk)"""
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+
+
+MODES = ('replace', 'prefix', 'suffix', 'remove_start', 'remove_end', 'numbering', 'regex', 'template')
+
+# Часть имени, к которой применяется регулярное выражение
+REGEX_SCOPES = ('name', 'stem', 'ext')
+
+PATTERN_CACHE_SIZE = 64
+
+# Формат нумерации с шириной по последнему номеру
+AUTO_WIDTH = 'auto'
+NUMBER_FORMATS = ('1', '01', '001', '0001', AUTO_WIDTH)
+
+# Поле шаблона -> группа извлечения (file_metadata); 'stat' берется из os.stat
+# без чтения файла
+FIELD_GROUPS = {
+    'mtime': 'stat',
+    'ctime': 'stat',
+    'size': 'stat',
+    'taken': 'exif',
+    'camera': 'exif',
+    'artist': 'audio',
+    'title': 'audio',
+    'album': 'audio',
+    'track': 'audio',
+    'hash': 'hash',
+}
+
+# Шаблон имени: {поле} или {поле:формат}; name, ext и n - из имени и
+# позиции, остальные поля - метаданные файла (FIELD_GROUPS)
+TEMPLATE_TOKENS = ('name', 'ext', 'n') + tuple(FIELD_GROUPS)
+DATE_FIELDS = ('mtime', 'ctime', 'taken')
+WIDTH_FIELDS = ('n', 'hash', 'track')  # Формат - число знаков
+DEFAULT_DATE_FORMAT = '%Y-%m-%d'
+DEFAULT_HASH_LENGTH = 8
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+_TOKEN = re.compile(r'\{(\w+)(?::([^{}]*))?\}')
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')  # Недопустимо в именах (Windows и POSIX)
+
+
+@dataclass(frozen=True)
+class RenameParams:
+    """Неизменяемый набор параметров переименования"""
+    mode: str = 'replace'
+    old_text: str = ''
+    new_text: str = ''
+    case_sensitive: bool = True
+    prefix: str = ''
+    suffix: str = ''
+    remove_count: int = 0
+    start: int = 1
+    step: int = 1
+    fmt: str = '01'
+    separator: str = '_'
+    regex_scope: str = 'name'
+    template: str = ''
+
+
+@dataclass(frozen=True)
+class RenamePipeline:
+    """Цепочка правил (RenameParams), применяемых к имени по порядку
+
+    Цепочка компилируется в одно преобразование, поэтому файлы
+    обрабатываются за один проход, а на диск уходит один план.
+    """
+    rules: tuple = ()
+
+    mode = 'pipeline'
+
+
+class PatternError(ValueError):
+    """Некорректное регулярное выражение или шаблон замены"""
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern, flags=0):
+    """Скомпилированное регулярное выражение (LRU-кэш по шаблону и флагам)
+
+    Предпросмотр пересчитывается на каждое изменение параметров, а
+    повторные запуски используют те же шаблоны - кэш исключает
+    повторную компиляцию.
+    """
+    try:
+        return re.compile(pattern, flags)
+    except re.error as e:
+        raise PatternError(f"Некорректное регулярное выражение: {e}") from None
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def _check_template(template, groups, group_names):
+    # Пустой шаблон с теми же группами совпадает с пустой строкой,
+    # подстановка проверяет ссылки \1, \g<name> до обработки файлов
+    numbered = {number: name for name, number in group_names}
+    dummy = ''.join(f"(?P<{numbered[i]}>)" if i in numbered else "()" for i in range(1, groups + 1))
+    try:
+        re.compile(dummy).sub(template, '')
+    except (re.error, IndexError) as e:
+        raise PatternError(f"Некорректный шаблон замены: {e}") from None
+
+
+def compile_regex(params):
+    """Регулярное выражение режима regex с проверенным шаблоном замены"""
+    if params.regex_scope not in REGEX_SCOPES:
+        raise ValueError(f"Неизвестная область применения: {params.regex_scope}")
+    flags = 0 if params.case_sensitive else re.IGNORECASE
+    pattern = compile_pattern(params.old_text, flags)
+    _check_template(params.new_text, pattern.groups, tuple(sorted(pattern.groupindex.items())))
+    return pattern
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_template(template):
+    """Разбор шаблона имени: кортеж из строк и пар (поле, формат)"""
+    parts = []
+    position = 0
+    for match in _TOKEN.finditer(template):
+        parts.append(template[position:match.start()])
+        field, spec = match.group(1), match.group(2) or ''
+        if field not in TEMPLATE_TOKENS:
+            raise PatternError(f"Неизвестное поле шаблона: {{{field}}}")
+        if spec and field in WIDTH_FIELDS and not spec.isdigit():
+            raise PatternError(f"Формат поля {{{field}}} - число знаков: {spec}")
+        if spec and field not in WIDTH_FIELDS + DATE_FIELDS:
+            raise PatternError(f"У поля {{{field}}} нет формата")
+        parts.append((field, spec))
+        position = match.end()
+    parts.append(template[position:])
+    if any(isinstance(part, str) and ('{' in part or '}' in part) for part in parts):
+        raise PatternError("Непарная фигурная скобка в шаблоне")
+    return tuple(part for part in parts if part != '')
+
+
+def metadata_fields(params):
+    """Поля метаданных, нужные шаблонам параметров (пустое множество - не нужны)"""
+    if isinstance(params, RenamePipeline):
+        return frozenset().union(*map(metadata_fields, params.rules))
+    if params.mode != 'template':
+        return frozenset()
+    return frozenset(part[0] for part in compile_template(params.template)
+                     if not isinstance(part, str) and part[0] in FIELD_GROUPS)
+
+
+def format_field(field, spec, meta):
+    """Значение поля метаданных для имени файла ('' - значения нет)"""
+    value = meta.get(field) if meta is not None else None
+    if value is None:
+        return ''
+    try:
+        if field in ('mtime', 'ctime'):
+            text = datetime.fromtimestamp(value).strftime(spec or DEFAULT_DATE_FORMAT)
+        elif field == 'taken':
+            text = datetime.strptime(value, EXIF_DATE_FORMAT).strftime(spec or DEFAULT_DATE_FORMAT)
+        elif field == 'hash':
+            text = value[:int(spec) if spec else DEFAULT_HASH_LENGTH]
+        elif field == 'track':
+            # "3/12" -> "3", с форматом 2 -> "03"
+            text = value.split('/', 1)[0].strip()
+            text = text.zfill(int(spec)) if spec else text
+        else:
+            text = str(value)
+    except (ValueError, OverflowError, OSError):
+        return ''  # Дата вне диапазона или испорченная дата EXIF
+    return _UNSAFE_CHARS.sub('_', text)
+
+
+def validate_params(params):
+    """Текст ошибки в параметрах или None"""
+    if isinstance(params, RenamePipeline):
+        if not params.rules:
+            return "Цепочка правил пуста"
+        for number, rule in enumerate(params.rules, 1):
+            error = validate_params(rule)
+            if error:
+                return f"Правило {number}: {error}"
+        return None
+    if params.mode not in MODES:
+        return f"Неизвестный режим: {params.mode}"
+    if params.mode in ('remove_start', 'remove_end') and params.remove_count < 1:
+        return "Число удаляемых символов должно быть не меньше 1"
+    if params.mode in ('numbering', 'template') and params.fmt not in NUMBER_FORMATS:
+        return f"Неизвестный формат номера: {params.fmt}"
+    if params.mode == 'regex':
+        if not params.old_text:
+            return "Не указано регулярное выражение"
+        try:
+            compile_regex(params)
+        except ValueError as e:
+            return str(e)
+    if params.mode == 'template':
+        if not params.template:
+            return "Не указан шаблон имени"
+        try:
+            compile_template(params.template)
+        except PatternError as e:
+            return str(e)
+    return None
+
+
+def numbering_width(params, count):
+    """Ширина номера с ведущими нулями
+
+    Формат "01" означает два знака, "001" - три и т.д.
+    При формате "auto" ширина берется по последнему номеру.
+    """
+    if params.fmt == AUTO_WIDTH:
+        last = params.start + max(count - 1, 0) * params.step
+        return len(str(last))
+    return max(len(params.fmt), 1)
+
+
+def compile_transform(params, total=0, metadata=None):
+    """Компиляция параметров в функцию transform(filename, index) -> новое имя
+
+    Все параметры читаются и регулярные выражения строятся один раз,
+    дальше функция применяется к любому количеству имен.
+    total - общее число файлов (нужно для автоматической ширины номера).
+    metadata[index] - словарь метаданных файла для шаблона (или None).
+    Для RenamePipeline правила компилируются по отдельности и
+    объединяются в одну функцию.
+    """
+    if isinstance(params, RenamePipeline):
+        return _compile_pipeline(params, total, metadata)
+
+    mode = params.mode
+
+    if mode == 'replace':
+        old, new = params.old_text, params.new_text
+        if not old:
+            return lambda filename, index: filename
+        if params.case_sensitive:
+            return lambda filename, index: filename.replace(old, new)
+        # Без учета регистра: шаблон компилируется один раз
+        pattern = re.compile(re.escape(old), re.IGNORECASE)
+        return lambda filename, index: pattern.sub(lambda m: new, filename)
+
+    if mode == 'prefix':
+        prefix = params.prefix
+        return lambda filename, index: prefix + filename
+
+    if mode == 'suffix':
+        suffix = params.suffix
+
+        def transform(filename, index):
+            name, ext = os.path.splitext(filename)
+            return name + suffix + ext
+        return transform
+
+    if mode == 'remove_start':
+        count = params.remove_count
+        if count <= 0:
+            return lambda filename, index: filename
+
+        def transform(filename, index):
+            if count < len(filename):
+                return filename[count:]
+            ext = os.path.splitext(filename)[1]
+            return ext if ext else filename
+        return transform
+
+    if mode == 'remove_end':
+        count = params.remove_count
+        if count <= 0:
+            return lambda filename, index: filename
+
+        def transform(filename, index):
+            name, ext = os.path.splitext(filename)
+            if count < len(name):
+                return name[:-count] + ext
+            return ext
+        return transform
+
+    if mode == 'numbering':
+        start, step = params.start, params.step
+        width, sep = numbering_width(params, total), params.separator
+
+        def transform(filename, index):
+            # index - позиция файла среди выбранных: дубликаты имен
+            # получают разные номера без поиска имени в списке
+            return f"{start + index * step:0{width}d}{sep}{filename}"
+        return transform
+
+    if mode == 'regex':
+        # Шаблон замены: \1, \g<1>, \g<name> - группы выражения
+        pattern, template = compile_regex(params), params.new_text
+        if params.regex_scope == 'stem':
+            def transform(filename, index):
+                name, ext = os.path.splitext(filename)
+                return pattern.sub(template, name) + ext
+        elif params.regex_scope == 'ext':
+            def transform(filename, index):
+                name, ext = os.path.splitext(filename)
+                new_ext = pattern.sub(template, ext[1:])
+                return name + '.' + new_ext if new_ext else name
+        else:
+            def transform(filename, index):
+                return pattern.sub(template, filename)
+        return transform
+
+    if mode == 'template':
+        parts = compile_template(params.template)
+        start, step, width = params.start, params.step, numbering_width(params, total)
+
+        def transform(filename, index):
+            stem, ext = os.path.splitext(filename)
+            meta = metadata[index] if metadata is not None else None
+            pieces = []
+            for part in parts:
+                if isinstance(part, str):
+                    pieces.append(part)
+                    continue
+                field, spec = part
+                if field == 'name':
+                    pieces.append(stem)
+                elif field == 'ext':
+                    pieces.append(ext)
+                elif field == 'n':
+                    pieces.append(f"{start + index * step:0{int(spec) if spec else width}d}")
+                else:
+                    pieces.append(format_field(field, spec, meta))
+            return ''.join(pieces)
+        return transform
+
+    raise ValueError(f"Неизвестный режим: {mode}")
+
+
+def _compile_pipeline(pipeline, total, metadata):
+    transforms = [compile_transform(rule, total, metadata) for rule in pipeline.rules]
+    if not transforms:
+        return lambda filename, index: filename
+    if len(transforms) == 1:
+        return transforms[0]
+
+    def transform(filename, index):
+        # Номер позиции общий для всех правил цепочки
+        for step in transforms:
+            filename = step(filename, index)
+        return filename
+    return transform
+
+
+def apply_transform(transform, names):
+    """Применение скомпилированного преобразования к списку имен"""
+    return [transform(name, i) for i, name in enumerate(names)]
+
+
+def rename_grouped(params, names, groups, is_stale=None, chunk_size=20000, metadata=None):
+    """Новые имена с нумерацией внутри каждой группы (папки)
+
+    groups[i] - ключ группы имени names[i], metadata[i] - его
+    метаданные для шаблона. Номер и автоматическая ширина номера
+    считаются по позиции файла в его группе. Если is_stale()
+    становится истинным (проверяется каждые chunk_size имен),
+    возвращается None.
+    """
+    rows_by_group = {}
+    for row, group in enumerate(groups):
+        rows_by_group.setdefault(group, []).append(row)
+
+    new_names = [None] * len(names)
+    for rows in rows_by_group.values():
+        group_metadata = None if metadata is None else [metadata[row] for row in rows]
+        transform = compile_transform(params, len(rows), group_metadata)
+        for start in range(0, len(rows), chunk_size):
+            if is_stale is not None and is_stale():
+                return None
+            for position, row in enumerate(rows[start:start + chunk_size], start):
+                new_names[row] = transform(names[row], position)
+    return new_names
+
+
+def rename_names(params, names, total=None, metadata=None):
+    """Новые имена для списка файлов по набору параметров
+
+    total - полный размер выбора, если names - только его начало.
+    """
+    return apply_transform(compile_transform(params, len(names) if total is None else total, metadata), names)
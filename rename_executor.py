@@ -0,0 +1,125 @@
+"""Параллельное выполнение плана переименования"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dir_renamer import make_renamer
+
+
+DEFAULT_WORKERS = 8
+
+
+class OpResult:
+    """Результат одной операции плана"""
+    __slots__ = ('op', 'error', 'seconds', 'skipped')
+
+    def __init__(self, op, error=None, seconds=0.0, skipped=False):
+        self.op = op
+        self.error = error
+        self.seconds = seconds
+        self.skipped = skipped
+
+    @property
+    def ok(self):
+        return self.error is None and not self.skipped
+
+    def __str__(self):
+        if self.skipped:
+            return f"{self.op.src}: Пропущено из-за ошибки в цепочке"
+        return f"{self.op.src}: {self.error}"
+
+
+class ExecutionStats:
+    """Пропускная способность и задержки выполнения"""
+
+    def __init__(self, results, elapsed):
+        latencies = sorted(r.seconds for r in results if not r.skipped)
+        self.total = len(results)
+        self.succeeded = sum(1 for r in results if r.ok)
+        self.failed = sum(1 for r in results if r.error is not None)
+        self.skipped = sum(1 for r in results if r.skipped)
+        self.elapsed = elapsed
+        self.rate = len(latencies) / elapsed if elapsed > 0 else 0.0
+        self.p50 = _percentile(latencies, 0.50)
+        self.p99 = _percentile(latencies, 0.99)
+        self.cancelled = False
+
+    def summary(self):
+        return (f"{self.rate:.0f} переим./с, задержка p50 {self.p50 * 1000:.1f} мс, "
+                f"p99 {self.p99 * 1000:.1f} мс, время {self.elapsed:.2f} с")
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(fraction * (len(sorted_values) - 1))]
+
+
+class RenameExecutor:
+    """Выполнение плана на пуле потоков
+
+    Цепочки плана независимы и выполняются параллельно, операции
+    внутри цепочки - последовательно (каждая освобождает имя для
+    следующей). На сетевых ФС это скрывает задержку каждого rename.
+    on_result(result) вызывается из рабочих потоков по мере готовности.
+
+    При установке cancel_event новые операции не запускаются. Цепочка,
+    уже переместившая файл во временное имя, доводится до конца, чтобы
+    после отмены в папке не оставалось временных имен.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, renamer=None):
+        self.workers = max(1, workers)
+        self.renamer = renamer
+
+    def run(self, plan, on_result=None, cancel_event=None):
+        """Выполнение плана; возвращает (результаты, статистика)"""
+        if cancel_event is None:
+            cancel_event = threading.Event()
+        results = []
+        lock = threading.Lock()
+
+        def report(result):
+            with lock:
+                results.append(result)
+            if on_result is not None:
+                on_result(result)
+
+        # Папки открываются один раз на всё задание
+        renamer = self.renamer if self.renamer is not None else make_renamer()
+        started = time.perf_counter()
+        try:
+            if self.workers == 1 or len(plan.chains) <= 1:
+                for chain in plan.chains:
+                    self._run_chain(renamer, chain, report, cancel_event)
+            else:
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    futures = [pool.submit(self._run_chain, renamer, chain, report, cancel_event)
+                               for chain in plan.chains]
+                    for future in futures:
+                        future.result()
+        finally:
+            if self.renamer is None:
+                renamer.close()
+        elapsed = time.perf_counter() - started
+
+        stats = ExecutionStats(results, elapsed)
+        stats.cancelled = cancel_event.is_set()
+        return results, stats
+
+    def _run_chain(self, renamer, chain, report, cancel_event):
+        """Последовательное выполнение одной цепочки"""
+        for step, op in enumerate(chain):
+            # Отмена между операциями, но не посреди разрыва цикла
+            if cancel_event.is_set() and not (step > 0 and chain[0].is_temp):
+                return
+            started = time.perf_counter()
+            try:
+                renamer.rename(op.directory, op.src, op.dst)
+            except OSError as e:
+                report(OpResult(op, error=str(e), seconds=time.perf_counter() - started))
+                # Следующие шаги цепочки ждут освобождения этого имени
+                for skipped in chain[step + 1:]:
+                    report(OpResult(skipped, skipped=True))
+                return
+            report(OpResult(op, seconds=time.perf_counter() - started))
@@ -0,0 +1,327 @@
+"""Журнал переименований (write-ahead) с откатом и возобновлением"""
+import json
+import os
+import threading
+import time
+import uuid
+
+from rename_planner import RenameOp, RenamePlan, build_rename_plan, list_names
+
+
+JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.file_renamer_pro', 'journal')
+JOURNAL_SUFFIX = '.jsonl'
+MAX_JOURNALS = 50
+
+# Статусы завершения задания
+STATUS_COMPLETED = 'completed'
+STATUS_CANCELLED = 'cancelled'
+
+
+class RenameJournal:
+    """Журнал одного задания переименования (только дозапись)
+
+    Формат - JSON по строке на запись:
+      begin  - заголовок задания (вид, описание, время);
+      dir    - папка и ее номер;
+      op     - запланированная операция (номер, цепочка, имена);
+      ok/err - операция выполнена / завершилась ошибкой;
+      end    - задание завершено (completed или cancelled);
+      undone/resumed - задание откачено или продолжено другим заданием.
+
+    Весь план записывается и сбрасывается на диск (fsync) до первого
+    переименования. Отметки о выполнении копятся и сбрасываются
+    группами, поэтому fsync не делается на каждый файл.
+    """
+
+    def __init__(self, path, batch_size=256, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._file = open(path, 'a', encoding='utf-8')
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._op_numbers = {}
+
+    @classmethod
+    def create(cls, plan, kind='rename', description='', parent=None, journal_dir=JOURNAL_DIR):
+        """Новый журнал с полностью записанным планом"""
+        os.makedirs(journal_dir, exist_ok=True)
+        # Имя сортируется по времени создания (до наносекунд)
+        now = time.time_ns()
+        name = (time.strftime('%Y%m%d-%H%M%S', time.localtime(now // 10**9))
+                + f"-{now % 10**9:09d}-{uuid.uuid4().hex[:4]}{JOURNAL_SUFFIX}")
+        journal = cls(os.path.join(journal_dir, name))
+
+        records = [{'t': 'begin', 'kind': kind, 'description': description,
+                    'parent': parent, 'time': time.time()}]
+        dir_numbers = {}
+        number = 0
+        for chain_number, chain in enumerate(plan.chains):
+            for op in chain:
+                if op.directory not in dir_numbers:
+                    dir_numbers[op.directory] = len(dir_numbers)
+                    records.append({'t': 'dir', 'id': dir_numbers[op.directory], 'path': op.directory})
+                record = {'t': 'op', 'n': number, 'c': chain_number,
+                          'd': dir_numbers[op.directory], 's': op.src, 'o': op.dst}
+                if op.is_temp:
+                    record['tmp'] = True
+                records.append(record)
+                journal._op_numbers[id(op)] = number
+                number += 1
+
+        journal._write(records, sync=True)
+        prune_journals(journal_dir)
+        return journal
+
+    def record(self, result):
+        """Отметка о результате операции (можно вызывать из рабочих потоков)"""
+        number = self._op_numbers.get(id(result.op))
+        if number is None or result.skipped:
+            return
+        if result.ok:
+            record = {'t': 'ok', 'n': number}
+        else:
+            record = {'t': 'err', 'n': number, 'e': result.error}
+
+        with self._lock:
+            self._pending.append(record)
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_pending()
+
+    def close(self, status):
+        """Сброс оставшихся отметок и запись о завершении"""
+        with self._lock:
+            self._pending.append({'t': 'end', 'status': status, 'time': time.time()})
+            self._flush_pending()
+            self._file.close()
+
+    def _flush_pending(self):
+        self._write(self._pending, sync=True)
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def _write(self, records, sync):
+        self._file.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+
+def append_marker(path, kind, by):
+    """Отметка в старом журнале, что он откачен или продолжен"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'t': kind, 'by': by, 'time': time.time()}, ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class JournalState:
+    """Прочитанный журнал: план, отметки и статус"""
+
+    def __init__(self, path):
+        self.path = path
+        self.kind = 'rename'
+        self.description = ''
+        self.created = 0.0
+        self.status = None  # None - задание прервано (нет записи end)
+        self.undone = False
+        self.resumed = False
+        self.chains = []  # списки записей op в порядке выполнения
+        self.done = set()
+        self.failed = {}
+
+    @property
+    def interrupted(self):
+        return self.status != STATUS_COMPLETED and not self.resumed
+
+    def executed_prefix(self, chain):
+        """Выполненное начало цепочки
+
+        Операции с отметкой ok считаются выполненными. Для операций без
+        отметки (сбой до сброса группы) число выполненных операций
+        подбирается по диску: для каждого k вычисляется, какие имена
+        цепочки существуют после первых k операций, и берется k, лучше
+        всего совпадающее с диском. Одна проверка "исходного имени нет,
+        целевое есть" не годится: у последней операции цикла
+        (временное имя -> имя) она верна и до начала цепочки. Состояния
+        до и после полного цикла на диске одинаковы - тогда выбирается
+        меньшее k (цепочка не выполнялась).
+        """
+        start = 0
+        while start < len(chain) and chain[start]['n'] in self.done:
+            start += 1
+
+        stop = start
+        while stop < len(chain) and chain[stop]['n'] not in self.failed:
+            stop += 1
+        if start == stop:
+            return chain[:start]
+
+        # До цепочки существуют имена, впервые встречающиеся как исходные
+        expected = {}
+        for op in chain:
+            expected.setdefault(op['s'], True)
+            expected.setdefault(op['o'], False)
+        directory = chain[0]['path']
+        actual = {name: os.path.lexists(os.path.join(directory, name)) for name in expected}
+        mismatches = sum(expected[name] != actual[name] for name in expected)
+
+        best, best_mismatches = start, None
+        for k in range(stop + 1):
+            if k >= start and (best_mismatches is None or mismatches < best_mismatches):
+                best, best_mismatches = k, mismatches
+            if k == stop:
+                break
+            # Операция k: исходное имя освобождается, целевое занимается
+            op = chain[k]
+            for name, exists in ((op['s'], False), (op['o'], True)):
+                if expected[name] != exists:
+                    mismatches += 1 if expected[name] == actual[name] else -1
+                    expected[name] = exists
+        return chain[:best]
+
+
+def load_journal(path):
+    """Чтение журнала (обрезанная последняя строка после сбоя пропускается)"""
+    state = JournalState(path)
+    dirs = {}
+    chains = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            kind = record.get('t')
+            if kind == 'op':
+                record['path'] = dirs[record['d']]
+                chains.setdefault(record['c'], []).append(record)
+            elif kind == 'ok':
+                state.done.add(record['n'])
+            elif kind == 'err':
+                state.failed[record['n']] = record.get('e', '')
+            elif kind == 'dir':
+                dirs[record['id']] = record['path']
+            else:
+                _apply_status_record(state, record)
+    state.chains = [chains[number] for number in sorted(chains)]
+    return state
+
+
+def peek_journal(path, tail_size=4096):
+    """Быстрое чтение только заголовка и статуса журнала (без операций)
+
+    Записи end/undone/resumed всегда дописываются в конец файла,
+    поэтому достаточно первой строки и небольшого хвоста.
+    """
+    state = JournalState(path)
+    with open(path, 'rb') as f:
+        lines = [f.readline()]
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - tail_size))
+        lines.extend(f.read().splitlines())
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        _apply_status_record(state, record)
+    return state
+
+
+def _apply_status_record(state, record):
+    kind = record.get('t')
+    if kind == 'begin':
+        state.kind = record.get('kind', 'rename')
+        state.description = record.get('description', '')
+        state.created = record.get('time', 0.0)
+    elif kind == 'end':
+        state.status = record.get('status')
+    elif kind == 'undone':
+        state.undone = True
+    elif kind == 'resumed':
+        state.resumed = True
+
+
+def list_journals(journal_dir=JOURNAL_DIR):
+    """Пути журналов, новые первыми"""
+    try:
+        names = [n for n in os.listdir(journal_dir) if n.endswith(JOURNAL_SUFFIX)]
+    except OSError:
+        return []
+    return [os.path.join(journal_dir, n) for n in sorted(names, reverse=True)]
+
+
+def prune_journals(journal_dir=JOURNAL_DIR, keep=MAX_JOURNALS):
+    """Удаление самых старых журналов сверх лимита"""
+    for path in list_journals(journal_dir)[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def find_undo_candidate(journal_dir=JOURNAL_DIR):
+    """Последнее не откаченное задание (откаты сами не откатываются)"""
+    for path in list_journals(journal_dir):
+        try:
+            state = peek_journal(path)
+        except OSError:
+            continue
+        if state.kind != 'undo' and not state.undone:
+            return load_journal(path)
+    return None
+
+
+def find_resume_candidate(journal_dir=JOURNAL_DIR):
+    """Последнее прерванное или отмененное задание"""
+    for path in list_journals(journal_dir):
+        try:
+            state = peek_journal(path)
+        except OSError:
+            continue
+        if state.interrupted and not state.undone:
+            return load_journal(path)
+    return None
+
+
+def build_undo_plan(state):
+    """План отката: возврат каждого файла к исходному имени
+
+    По выполненным операциям вычисляется итоговое отображение
+    "текущее имя -> исходное" (временные имена схлопываются), после чего
+    обратные переименования планируются заново по свежему листингу
+    папки - с проверкой коллизий и разрывом циклов.
+    """
+    items = []
+    existing = {}
+    for chain in state.chains:
+        where = {}
+        for op in state.executed_prefix(chain):
+            origin = where.pop(op['s'], op['s'])
+            where[op['o']] = origin
+        directory = chain[0]['path']
+        for current, origin in where.items():
+            if current != origin:
+                items.append((None, directory, current, origin))
+        if directory not in existing:
+            try:
+                existing[directory] = list_names(directory)
+            except OSError:
+                existing[directory] = set()
+    return build_rename_plan(items, existing)
+
+
+def build_resume_plan(state):
+    """План продолжения: невыполненные хвосты цепочек в исходном порядке"""
+    plan = RenamePlan()
+    for chain in state.chains:
+        executed = len(state.executed_prefix(chain))
+        remaining = [RenameOp(None, op['path'], op['s'], op['o'], op.get('tmp', False))
+                     for op in chain[executed:]]
+        if remaining:
+            plan.chains.append(remaining)
+            plan.renames += sum(1 for op in remaining if not op.is_temp)
+    return plan
@@ -0,0 +1,191 @@
+"""Планирование переименования с учетом коллизий, обменов и циклов"""
+import os
+from collections import defaultdict
+
+
+TEMP_MARKER = '.renametmp'
+
+
+class RenameOp:
+    """Одна операция переименования в папке directory
+
+    index - номер файла в списке (для временных шагов тоже номер
+    файла, которому принадлежит временное имя).
+    """
+    __slots__ = ('index', 'directory', 'src', 'dst', 'is_temp')
+
+    def __init__(self, index, directory, src, dst, is_temp=False):
+        self.index = index
+        self.directory = directory
+        self.src = src
+        self.dst = dst
+        self.is_temp = is_temp
+
+    def __repr__(self):
+        return f"RenameOp({self.src!r} -> {self.dst!r})"
+
+
+class RenameConflict:
+    """Переименование, исключенное из плана"""
+    __slots__ = ('index', 'directory', 'old_name', 'new_name', 'reason')
+
+    def __init__(self, index, directory, old_name, new_name, reason):
+        self.index = index
+        self.directory = directory
+        self.old_name = old_name
+        self.new_name = new_name
+        self.reason = reason
+
+    def __str__(self):
+        return f"{self.old_name}: {self.reason}"
+
+
+class RenamePlan:
+    """Упорядоченный план переименования
+
+    chains - список цепочек операций. Операции внутри цепочки
+    выполняются строго по порядку (каждая освобождает имя для
+    следующей), разные цепочки друг от друга не зависят.
+    """
+
+    def __init__(self):
+        self.chains = []
+        self.conflicts = []
+        self.unchanged = 0
+        self.cycles = 0
+        self.renames = 0
+
+    @property
+    def ops(self):
+        """Все операции в порядке выполнения"""
+        return [op for chain in self.chains for op in chain]
+
+    def summary_lines(self, limit=10):
+        """Текстовое описание плана для предпросмотра"""
+        lines = [f"Переименований: {self.renames}, операций: {sum(len(c) for c in self.chains)}"]
+        if self.unchanged:
+            lines.append(f"Имя не изменится: {self.unchanged}")
+        if self.cycles:
+            lines.append(f"Циклов и обменов (через временные имена): {self.cycles}")
+        if self.conflicts:
+            lines.append(f"Конфликтов (будут пропущены): {len(self.conflicts)}")
+            for conflict in self.conflicts[:limit]:
+                lines.append(f"  ! {conflict}")
+            if len(self.conflicts) > limit:
+                lines.append(f"  ... и еще {len(self.conflicts) - limit}")
+        return lines
+
+
+def list_names(directory):
+    """Имена всех записей папки одним листингом (для проверки коллизий)"""
+    return set(os.listdir(directory))
+
+
+def build_rename_plan(items, existing_by_dir):
+    """Построение плана по списку (index, directory, old_name, new_name)
+
+    existing_by_dir - словарь папка -> множество имен, которые в ней
+    уже есть (файлы вне пакета, подпапки и сами переименовываемые файлы).
+    Все проверки выполняются хэшированием за O(n).
+    """
+    plan = RenamePlan()
+    by_dir = defaultdict(list)
+    for item in items:
+        by_dir[item[1]].append(item)
+
+    for directory, dir_items in by_dir.items():
+        _plan_directory(plan, directory, dir_items, existing_by_dir.get(directory, set()))
+    return plan
+
+
+def _plan_directory(plan, directory, items, existing):
+    """Планирование переименований внутри одной папки"""
+    moves = {}  # src -> (index, dst)
+    targets = defaultdict(list)
+    for index, _, old_name, new_name in items:
+        if old_name == new_name:
+            plan.unchanged += 1
+            continue
+        if not new_name or new_name in ('.', '..') or os.sep in new_name or (os.altsep and os.altsep in new_name):
+            plan.conflicts.append(RenameConflict(index, directory, old_name, new_name,
+                                                 f"Недопустимое имя '{new_name}'"))
+            continue
+        moves[old_name] = (index, new_name)
+        targets[new_name].append(old_name)
+
+    # Одинаковые новые имена у нескольких файлов
+    for new_name, sources in targets.items():
+        if len(sources) > 1:
+            for src in sources:
+                index, _ = moves.pop(src)
+                plan.conflicts.append(RenameConflict(index, directory, src, new_name,
+                                                     f"Имя '{new_name}' будет дублироваться"))
+
+    # Цель занята файлом, который не переименовывается. Исключенный файл
+    # остается на месте и сам занимает имя, поэтому проверка повторяется
+    # для файлов, целящихся в его имя (очередь, каждый файл - один раз).
+    dst_to_src = {dst: src for src, (_, dst) in moves.items()}
+    queue = [src for src, (_, dst) in moves.items() if dst in existing and dst not in moves]
+    while queue:
+        src = queue.pop()
+        if src not in moves:
+            continue
+        index, dst = moves.pop(src)
+        del dst_to_src[dst]
+        plan.conflicts.append(RenameConflict(index, directory, src, dst,
+                                             f"Файл '{dst}' уже существует"))
+        blocked = dst_to_src.get(src)
+        if blocked is not None:
+            queue.append(blocked)
+
+    plan.renames += len(moves)
+
+    # Цепочки: начинаются с файла, в имя которого никто не переименовывается.
+    # Выполняются с конца, чтобы каждое имя освобождалось до занятия.
+    visited = set()
+    for head in moves:
+        if head in dst_to_src:
+            continue
+        chain = []
+        src = head
+        while src in moves:
+            visited.add(src)
+            index, dst = moves[src]
+            chain.append(RenameOp(index, directory, src, dst))
+            src = dst
+        chain.reverse()
+        plan.chains.append(chain)
+
+    # Оставшиеся файлы образуют циклы (a->b, b->a): один файл
+    # уходит во временное имя, остальные сдвигаются, затем он занимает цель.
+    used_names = existing | set(moves) | set(dst_to_src)
+    for start in moves:
+        if start in visited:
+            continue
+        cycle = []
+        src = start
+        while src not in visited:
+            visited.add(src)
+            index, dst = moves[src]
+            cycle.append((index, src, dst))
+            src = dst
+
+        index, first_src, first_dst = cycle[0]
+        temp = _temp_name(first_src, used_names)
+        used_names.add(temp)
+        chain = [RenameOp(index, directory, first_src, temp, is_temp=True)]
+        for index, src, dst in reversed(cycle[1:]):
+            chain.append(RenameOp(index, directory, src, dst))
+        chain.append(RenameOp(cycle[0][0], directory, temp, first_dst))
+        plan.chains.append(chain)
+        plan.cycles += 1
+
+
+def _temp_name(name, used_names):
+    """Уникальное временное имя в папке"""
+    counter = 0
+    while True:
+        temp = f"{name}{TEMP_MARKER}{counter}"
+        if temp not in used_names:
+            return temp
+        counter += 1
@@ -0,0 +1,63 @@
+"""Сохранение цепочек правил в JSON (пресеты)"""
+import json
+import os
+from dataclasses import asdict, fields
+
+from rename_engine import RenameParams, RenamePipeline, validate_params
+
+
+PRESET_DIR = os.path.join(os.path.expanduser('~'), '.file_renamer_pro', 'presets')
+PRESET_SUFFIX = '.json'
+PRESET_VERSION = 1
+
+# Поле -> тип значения по умолчанию (bool отдельно от int)
+_PARAM_TYPES = {f.name: type(f.default) for f in fields(RenameParams)}
+
+
+def pipeline_to_dict(pipeline):
+    """Цепочка в виде словаря для JSON"""
+    return {'version': PRESET_VERSION, 'rules': [asdict(rule) for rule in pipeline.rules]}
+
+
+def pipeline_from_dict(data):
+    """Цепочка из словаря с проверкой полей, типов и параметров правил
+
+    Любая ошибка - ValueError с номером правила.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('rules'), list):
+        raise ValueError("Файл не является пресетом цепочки правил")
+    rules = []
+    for number, rule in enumerate(data['rules'], 1):
+        if not isinstance(rule, dict) or 'mode' not in rule:
+            raise ValueError(f"Правило {number}: ожидается объект с полем 'mode'")
+        for key, value in rule.items():
+            expected = _PARAM_TYPES.get(key)
+            if expected is None:
+                raise ValueError(f"Правило {number}: неизвестное поле {key!r}")
+            if type(value) is not expected:
+                raise ValueError(f"Правило {number}: поле {key!r} должно быть типа {expected.__name__}")
+        rules.append(RenameParams(**rule))
+    pipeline = RenamePipeline(tuple(rules))
+    error = validate_params(pipeline)
+    if error:
+        raise ValueError(error)
+    return pipeline
+
+
+def save_preset(pipeline, path):
+    """Запись пресета в файл"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(pipeline_to_dict(pipeline), f, ensure_ascii=False, indent=2)
+
+
+def load_preset(path):
+    """Чтение пресета из файла"""
+    with open(path, encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"Некорректный JSON: {e}") from None
+    return pipeline_from_dict(data)
@@ -0,0 +1,164 @@
+"""Кэш результатов сканирования папок (SQLite)"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+
+from file_scanner import DirListing, ScanEntry
+
+
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+COMMIT_EVERY = 200  # Записей на транзакцию при обходе дерева
+
+
+def user_cache_dir():
+    """Папка кэша пользователя для текущей платформы"""
+    if sys.platform.startswith('win'):
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+    elif sys.platform == 'darwin':
+        base = os.path.join(os.path.expanduser('~'), 'Library', 'Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'file_renamer_pro')
+
+
+def _join_names(names):
+    return b'\0'.join(os.fsencode(name) for name in names)
+
+
+def _split_names(blob):
+    return [os.fsdecode(name) for name in blob.split(b'\0')] if blob else []
+
+
+class ScanCache:
+    """Листинги папок на диске, ключ - путь плюс mtime и inode папки
+
+    Добавление, удаление и переименование файла меняют mtime папки,
+    поэтому совпадение ключа означает тот же набор имен. Размеры и
+    даты файлов при этом могут устареть - их перепроверяет сканер в
+    фоне после показа списка. Записи хранятся компактно: имена одной
+    строкой через NUL, размеры и даты - двоичными массивами. При
+    превышении max_bytes удаляются давно не открывавшиеся папки.
+    """
+
+    def __init__(self, path, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS dirs (
+                                path TEXT PRIMARY KEY,
+                                mtime_ns INTEGER NOT NULL,
+                                inode INTEGER NOT NULL,
+                                accessed REAL NOT NULL,
+                                bytes INTEGER NOT NULL,
+                                names BLOB NOT NULL,
+                                sizes BLOB NOT NULL,
+                                mtimes BLOB NOT NULL,
+                                subdirs BLOB NOT NULL)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS dirs_accessed ON dirs(accessed)')
+
+    @classmethod
+    def open_default(cls):
+        """Кэш в папке кэша пользователя (None, если недоступен)"""
+        directory = user_cache_dir()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            return cls(os.path.join(directory, 'scan_cache.sqlite3'))
+        except (OSError, sqlite3.Error):
+            return None
+
+    def get(self, directory, dir_stat):
+        """DirListing, если папка не менялась с момента записи, иначе None"""
+        with self._lock:
+            try:
+                row = self._db.execute('SELECT mtime_ns, inode, names, sizes, mtimes, subdirs '
+                                       'FROM dirs WHERE path = ?', (directory,)).fetchone()
+                if row is None:
+                    return None
+                mtime_ns, inode, names, sizes, mtimes, subdirs = row
+                if mtime_ns != dir_stat.st_mtime_ns or inode != dir_stat.st_ino:
+                    return None
+                self._write('UPDATE dirs SET accessed = ? WHERE path = ?', (time.time(), directory))
+            except sqlite3.Error:
+                return None
+
+        size_array = array('q')
+        size_array.frombytes(sizes)
+        mtime_array = array('d')
+        mtime_array.frombytes(mtimes)
+        entries = [ScanEntry(name, size, mtime)
+                   for name, size, mtime in zip(_split_names(names), size_array, mtime_array)]
+        return DirListing(entries, _split_names(subdirs))
+
+    def put(self, directory, dir_stat, listing):
+        """Запись листинга папки"""
+        entries = listing.entries
+        names = _join_names(entry.name for entry in entries)
+        sizes = array('q', (entry.size for entry in entries)).tobytes()
+        mtimes = array('d', (entry.mtime for entry in entries)).tobytes()
+        subdirs = _join_names(listing.subdirs)
+        total = len(names) + len(sizes) + len(mtimes) + len(subdirs)
+        with self._lock:
+            try:
+                self._write('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (directory, dir_stat.st_mtime_ns, dir_stat.st_ino, time.time(), total,
+                             names, sizes, mtimes, subdirs))
+            except sqlite3.Error:
+                pass
+
+    def invalidate(self, directories):
+        """Удаление записей папок (после собственных переименований)"""
+        with self._lock:
+            try:
+                for directory in directories:
+                    self._write('DELETE FROM dirs WHERE path = ?', (directory,))
+                self._commit()
+            except sqlite3.Error:
+                pass
+
+    def flush(self):
+        """Фиксация записей и вытеснение сверх лимита размера"""
+        with self._lock:
+            try:
+                self._commit()
+                self._evict()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def _write(self, sql, args):
+        # Записи группируются в транзакции, а не фиксируются по одной
+        if not self._db.in_transaction:
+            self._db.execute('BEGIN')
+        self._db.execute(sql, args)
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._commit()
+
+    def _commit(self):
+        if self._db.in_transaction:
+            self._db.execute('COMMIT')
+        self._pending = 0
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(bytes), 0) FROM dirs').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute('SELECT path, bytes FROM dirs ORDER BY accessed').fetchall()
+        self._db.execute('BEGIN')
+        for path, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM dirs WHERE path = ?', (path,))
+            total -= size
+        self._db.execute('COMMIT')
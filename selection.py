@@ -0,0 +1,184 @@
+"""Модель выбора файлов на основе компактного битового массива"""
+from itertools import compress
+
+
+# Таблица для инверсии байтов 0/1 одной операцией translate
+_INVERT_TABLE = bytes([1, 0]) + bytes(254)
+
+
+class Bitset:
+    """Массив флагов 0/1 в bytearray (по байту на файл)
+
+    Массовые операции выполняются встроенными методами bytearray
+    и не содержат циклов на уровне Python.
+    """
+    __slots__ = ('bits',)
+
+    def __init__(self, size=0):
+        self.bits = bytearray(size)
+
+    def __len__(self):
+        return len(self.bits)
+
+    def __getitem__(self, index):
+        return self.bits[index]
+
+    def __setitem__(self, index, value):
+        self.bits[index] = 1 if value else 0
+
+    def resize(self, size):
+        """Изменение размера (новые флаги сброшены)"""
+        if size < len(self.bits):
+            del self.bits[size:]
+        else:
+            self.bits.extend(bytes(size - len(self.bits)))
+
+    def fill(self, value):
+        """Установка всех флагов"""
+        self.bits = bytearray(b'\x01' * len(self.bits)) if value else bytearray(len(self.bits))
+
+    def set_range(self, start, stop, value):
+        """Установка флагов в диапазоне [start, stop)"""
+        start, stop = max(start, 0), min(stop, len(self.bits))
+        if stop > start:
+            self.bits[start:stop] = (b'\x01' if value else b'\x00') * (stop - start)
+
+    def invert(self):
+        self.bits = self.bits.translate(_INVERT_TABLE)
+
+    def and_mask(self, mask):
+        """Пересечение с маской той же длины"""
+        self.bits = self._combine(mask, int.__and__)
+
+    def or_mask(self, mask):
+        """Объединение с маской той же длины"""
+        self.bits = self._combine(mask, int.__or__)
+
+    def andnot_mask(self, mask):
+        """Сброс флагов, отмеченных в маске"""
+        inverted = bytes(mask).translate(_INVERT_TABLE)
+        self.bits = self._combine(inverted, int.__and__)
+
+    def _combine(self, mask, op):
+        # Байты 0/1 побитово объединяются как одно большое целое
+        size = len(self.bits)
+        if len(mask) != size:
+            raise ValueError("Размер маски не совпадает с размером выбора")
+        value = op(int.from_bytes(self.bits, 'little'), int.from_bytes(mask, 'little'))
+        return bytearray(value.to_bytes(size, 'little'))
+
+    def popcount(self):
+        """Количество установленных флагов"""
+        return self.bits.count(1)
+
+    def iter_set(self):
+        """Индексы установленных флагов по возрастанию"""
+        return compress(range(len(self.bits)), self.bits)
+
+    def permute(self, order):
+        """Переупорядочивание (order[new] = old)"""
+        self.bits = bytearray(map(self.bits.__getitem__, order))
+
+
+class SelectionModel:
+    """Состояние выбора файлов, индексированное как список файлов
+
+    Хранит счетчик выбранных (обновляется за O(1) при одиночных
+    изменениях и через popcount при массовых) и множество индексов,
+    состояние которых изменилось с последнего take_changes().
+    Массовые операции помечают изменение всех строк.
+    """
+
+    def __init__(self, size=0):
+        self.bits = Bitset(size)
+        self.count = 0
+        self.changed = set()
+        self.all_changed = False
+
+    def __len__(self):
+        return len(self.bits)
+
+    def _bulk_changed(self):
+        self.count = self.bits.popcount()
+        self.all_changed = True
+
+    def resize(self, size):
+        """Изменение размера (новые элементы не выбраны)"""
+        self.bits.resize(size)
+        self._bulk_changed()
+
+    def reset(self, size=0):
+        """Сброс выбора и установка нового размера"""
+        self.bits = Bitset(size)
+        self._bulk_changed()
+
+    def is_selected(self, index):
+        return self.bits[index] == 1
+
+    def set(self, index, value):
+        """Установка состояния одного файла"""
+        value = 1 if value else 0
+        if self.bits[index] != value:
+            self.bits[index] = value
+            self.count += 1 if value else -1
+            self.changed.add(index)
+
+    def select_all(self):
+        self.bits.fill(True)
+        self._bulk_changed()
+
+    def deselect_all(self):
+        self.bits.fill(False)
+        self._bulk_changed()
+
+    def invert(self):
+        self.bits.invert()
+        self._bulk_changed()
+
+    def select_range(self, start, stop, value=True):
+        """Выбрать (или снять выбор) диапазон [start, stop)"""
+        self.bits.set_range(start, stop, value)
+        self._bulk_changed()
+
+    def apply_mask(self, mask, how='set'):
+        """Применение маски: 'set' - заменить, 'add' - добавить, 'remove' - убрать, 'keep' - пересечь"""
+        if how == 'set':
+            if len(mask) != len(self.bits):
+                raise ValueError("Размер маски не совпадает с размером выбора")
+            self.bits.bits = bytearray(mask)
+        elif how == 'add':
+            self.bits.or_mask(mask)
+        elif how == 'remove':
+            self.bits.andnot_mask(mask)
+        elif how == 'keep':
+            self.bits.and_mask(mask)
+        else:
+            raise ValueError(f"Неизвестная операция с маской: {how}")
+        self._bulk_changed()
+
+    def set_only(self, indices):
+        """Выбрать ровно указанные индексы"""
+        indices = set(indices)
+        for index in list(self.iter_selected()):
+            if index not in indices:
+                self.set(index, False)
+        for index in indices:
+            self.set(index, True)
+
+    def permute(self, order):
+        """Переупорядочивание вслед за списком файлов (order[new] = old)"""
+        self.bits.permute(order)
+        # order может быть короче списка (удаленные файлы)
+        self.count = self.bits.popcount()
+        self.all_changed = True
+
+    def iter_selected(self):
+        """Индексы выбранных файлов по возрастанию"""
+        return self.bits.iter_set()
+
+    def take_changes(self):
+        """Забрать изменившиеся индексы (None - изменилось все)"""
+        changes = None if self.all_changed else self.changed
+        self.changed = set()
+        self.all_changed = False
+        return changes
@@ -0,0 +1,30 @@
+"""Ключи естественной сортировки"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_table import natural_key, natural_keys  # noqa: E402
+
+
+class NaturalKeyTest(unittest.TestCase):
+
+    def test_numbers_in_numeric_order(self):
+        names = ['file10', 'File2', 'file1']
+        self.assertEqual(sorted(names, key=natural_key), ['file1', 'File2', 'file10'])
+
+    def test_numbers_longer_than_padding(self):
+        # Отметка времени со счетчиком - больше 20 цифр
+        names = ['log_20240101120000123456789', 'log_999999999999999999999', 'log_7', 'log_0000000000000000000000008']
+        self.assertEqual(sorted(names, key=natural_key),
+                         ['log_7', 'log_0000000000000000000000008', 'log_999999999999999999999',
+                          'log_20240101120000123456789'])
+
+    def test_batch_keys_match_single(self):
+        names = ['a1', 'b' + '9' * 25, 'c0' * 15, '']
+        self.assertEqual(natural_keys(names), [natural_key(name) for name in names])
+
+
+if __name__ == '__main__':
+    unittest.main()
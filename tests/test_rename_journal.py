@@ -0,0 +1,117 @@
+"""Откат и возобновление по журналу после сбоя посреди задания"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rename_journal import RenameJournal, build_resume_plan, build_undo_plan, load_journal  # noqa: E402
+from rename_planner import build_rename_plan, list_names  # noqa: E402
+
+
+class InterruptedJournalTest(unittest.TestCase):
+    """Сбой до сброса отметок ok: выполненная часть определяется по диску"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.dir = os.path.join(self.root, 'files')
+        self.journal_dir = os.path.join(self.root, 'journal')
+        os.mkdir(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make_files(self, names):
+        # Содержимое - исходное имя, чтобы проверять, какой файл где оказался
+        for name in names:
+            with open(os.path.join(self.dir, name), 'w') as f:
+                f.write(name)
+
+    def contents(self):
+        result = {}
+        for name in os.listdir(self.dir):
+            with open(os.path.join(self.dir, name)) as f:
+                result[name] = f.read()
+        return result
+
+    def plan(self, renames):
+        items = [(i, self.dir, old, new) for i, (old, new) in enumerate(renames)]
+        plan = build_rename_plan(items, {self.dir: list_names(self.dir)})
+        self.assertFalse(plan.conflicts)
+        return plan
+
+    def crash_after(self, plan, ops):
+        """Журнал с планом и выполненные ops без отметок ok (как при сбое)"""
+        journal = RenameJournal.create(plan, journal_dir=self.journal_dir)
+        journal._file.close()
+        for op in ops:
+            os.rename(os.path.join(self.dir, op.src), os.path.join(self.dir, op.dst))
+        return load_journal(journal.path)
+
+    def run_plan(self, plan):
+        for op in plan.ops:
+            os.rename(os.path.join(op.directory, op.src), os.path.join(op.directory, op.dst))
+
+    def chain_of(self, plan, src):
+        return next(chain for chain in plan.chains if any(op.src == src for op in chain))
+
+    def test_crash_before_cycle(self):
+        self.make_files(['a', 'b', 'c'])
+        plan = self.plan([('a', 'b'), ('b', 'a'), ('c', 'e')])
+        state = self.crash_after(plan, self.chain_of(plan, 'c'))
+
+        resume = build_resume_plan(state)
+        self.assertEqual([[(op.src, op.dst) for op in chain] for chain in resume.chains],
+                         [[(op.src, op.dst) for op in self.chain_of(plan, 'a')]])
+        self.run_plan(build_undo_plan(state))
+        self.assertEqual(self.contents(), {'a': 'a', 'b': 'b', 'c': 'c'})
+
+    def test_crash_before_cycle_resume(self):
+        self.make_files(['a', 'b', 'c'])
+        plan = self.plan([('a', 'b'), ('b', 'a'), ('c', 'e')])
+        state = self.crash_after(plan, self.chain_of(plan, 'c'))
+        self.run_plan(build_resume_plan(state))
+        self.assertEqual(self.contents(), {'a': 'b', 'b': 'a', 'e': 'c'})
+
+    def test_crash_mid_cycle(self):
+        self.make_files(['a', 'b'])
+        plan = self.plan([('a', 'b'), ('b', 'a')])
+        cycle = self.chain_of(plan, 'a')
+        self.assertEqual(len(cycle), 3)
+        state = self.crash_after(plan, cycle[:2])
+
+        self.assertEqual(len(state.executed_prefix(state.chains[0])), 2)
+        self.run_plan(build_undo_plan(state))
+        self.assertEqual(self.contents(), {'a': 'a', 'b': 'b'})
+
+    def test_crash_mid_cycle_resume(self):
+        self.make_files(['a', 'b'])
+        plan = self.plan([('a', 'b'), ('b', 'a')])
+        state = self.crash_after(plan, self.chain_of(plan, 'a')[:2])
+        self.run_plan(build_resume_plan(state))
+        self.assertEqual(self.contents(), {'a': 'b', 'b': 'a'})
+
+    def test_crash_mid_shift(self):
+        self.make_files(['x1', 'x2'])
+        plan = self.plan([('x1', 'x2'), ('x2', 'x3')])
+        shift = self.chain_of(plan, 'x1')
+        self.assertEqual([(op.src, op.dst) for op in shift], [('x2', 'x3'), ('x1', 'x2')])
+        state = self.crash_after(plan, shift[:1])
+
+        resume = build_resume_plan(state)
+        self.assertEqual([(op.src, op.dst) for op in resume.ops], [('x1', 'x2')])
+        self.run_plan(build_undo_plan(state))
+        self.assertEqual(self.contents(), {'x1': 'x1', 'x2': 'x2'})
+
+    def test_crash_mid_shift_resume(self):
+        self.make_files(['x1', 'x2'])
+        plan = self.plan([('x1', 'x2'), ('x2', 'x3')])
+        state = self.crash_after(plan, self.chain_of(plan, 'x1')[:1])
+        self.run_plan(build_resume_plan(state))
+        self.assertEqual(self.contents(), {'x2': 'x1', 'x3': 'x2'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""События слежения не сдвигают строки, пока план или задание держат их номера"""
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from File_rename_Pro import FileRenamerApp  # noqa: E402
+
+
+class _Watcher:
+    def __init__(self, events):
+        self.events = list(events)
+
+    def poll(self):
+        events, self.events = self.events, []
+        return events
+
+
+class _Root:
+    def after(self, delay, callback, *args):
+        return 'timer'
+
+
+class WatchGuardTest(unittest.TestCase):
+    """poll_watch без окна: только состояние, которое он читает"""
+
+    def make_app(self, events):
+        app = FileRenamerApp.__new__(FileRenamerApp)
+        app.root = _Root()
+        app.watcher = _Watcher(events)
+        app.watch_poll_id = None
+        app.watch_backlog = []
+        app.rename_cancel_event = None
+        app.plan_pending = False
+        app.applied = []
+        app.apply_watch_events = app.applied.extend
+        return app
+
+    def test_events_wait_for_pending_plan(self):
+        app = self.make_app([('added', '/d', 'x', None)])
+        app.plan_pending = True
+        app.poll_watch()
+        self.assertEqual(app.applied, [])
+        self.assertEqual(len(app.watch_backlog), 1)
+
+        app.plan_pending = False
+        app.poll_watch()
+        self.assertEqual(app.applied, [('added', '/d', 'x', None)])
+        self.assertEqual(app.watch_backlog, [])
+
+    def test_events_wait_for_running_job(self):
+        app = self.make_app([('removed', '/d', 'x', None)])
+        app.rename_cancel_event = threading.Event()
+        app.poll_watch()
+        self.assertEqual(app.applied, [])
+
+        app.rename_cancel_event = None
+        app.poll_watch()
+        self.assertEqual(app.applied, [('removed', '/d', 'x', None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
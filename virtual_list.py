@@ -0,0 +1,249 @@
+"""Виртуальный список: отрисовываются только видимые строки"""
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualList(ttk.Frame):
+    """Список на базе Treeview с фиксированным пулом строк
+
+    Данные хранятся в Python, а в Treeview существует только столько
+    элементов, сколько помещается на экране (плюс небольшой запас).
+    При прокрутке строки пула переиспользуются, поэтому стоимость
+    прокрутки не зависит от общего количества строк.
+
+    row_getter(index) должен возвращать (text, values, tags).
+    Выделение (клик, Ctrl+клик, Shift+клик) тоже хранится в Python,
+    при изменении генерируется событие <<VirtualListSelect>>.
+    """
+
+    OVERSCAN = 1  # Дополнительная строка для частично видимой последней строки
+
+    def __init__(self, master, columns, row_getter, **kwargs):
+        super().__init__(master, **kwargs)
+        self.row_getter = row_getter
+        self.count = 0
+        self.top = 0
+        self.visible = 1
+        self.pool = []
+        self.selected = set()
+        self.anchor = None  # Начало диапазона для Shift
+        self.cursor = None  # Текущая строка для клавиатуры
+
+        self.tree = ttk.Treeview(self, columns=columns, show='tree headings', selectmode='none')
+        self.v_scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.h_scrollbar = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscrollcommand=self.h_scrollbar.set)
+
+        self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.v_scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.h_scrollbar.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.tree.tag_configure('highlight', background='#cce8ff')
+
+        self.tree.bind('<Configure>', self.on_configure)
+        self.tree.bind('<Button-1>', self.on_click)
+        self.tree.bind('<Control-Button-1>', lambda e: self.on_click(e, toggle=True))
+        self.tree.bind('<Shift-Button-1>', lambda e: self.on_click(e, extend=True))
+        self.tree.bind('<MouseWheel>', lambda e: self.scroll_units(-3 if e.delta > 0 else 3))
+        self.tree.bind('<Button-4>', lambda e: self.scroll_units(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_units(3))
+        self.tree.bind('<Up>', lambda e: self.move_cursor(-1, e))
+        self.tree.bind('<Down>', lambda e: self.move_cursor(1, e))
+        self.tree.bind('<Prior>', lambda e: self.scroll_units(-self.visible))
+        self.tree.bind('<Next>', lambda e: self.scroll_units(self.visible))
+        self.tree.bind('<Home>', lambda e: self.scroll_to(0))
+        self.tree.bind('<End>', lambda e: self.scroll_to(self.count))
+
+    # Проброс настроек колонок во внутренний Treeview
+    def heading(self, column, **kwargs):
+        return self.tree.heading(column, **kwargs)
+
+    def column(self, column, **kwargs):
+        return self.tree.column(column, **kwargs)
+
+    def tag_configure(self, tag, **kwargs):
+        return self.tree.tag_configure(tag, **kwargs)
+
+    def set_count(self, count):
+        """Установка количества строк и перерисовка"""
+        self.count = count
+        if self.anchor is not None and self.anchor >= count:
+            self.anchor = self.cursor = None
+        self.selected = {i for i in self.selected if i < count}
+        self.top = max(0, min(self.top, count - self.visible))
+        had_rows = bool(self.pool)
+        self.render()
+        if not had_rows and self.pool:
+            # Высота строки известна только после появления первой строки
+            self.after_idle(self.on_configure)
+
+    def refresh(self):
+        """Перерисовка видимых строк"""
+        self.render()
+
+    def refresh_rows(self, indices):
+        """Перерисовка только тех видимых строк, чьи индексы изменились
+
+        indices=None означает, что изменилось все - перерисовываются
+        все видимые строки (их количество не зависит от размера списка).
+        """
+        if indices is None:
+            self.render()
+            return
+        for slot, item_id in enumerate(self.pool):
+            if self.top + slot in indices:
+                self.render_slot(slot, item_id)
+
+    def render(self):
+        """Заполнение пула строк данными с позиции top"""
+        needed = max(0, min(self.visible + self.OVERSCAN, self.count - self.top))
+
+        # Пул растет или сокращается только при изменении размера окна
+        while len(self.pool) < needed:
+            self.pool.append(self.tree.insert('', 'end'))
+        while len(self.pool) > needed:
+            self.tree.delete(self.pool.pop())
+
+        for slot, item_id in enumerate(self.pool):
+            self.render_slot(slot, item_id)
+
+        self.update_scrollbar()
+
+    def render_slot(self, slot, item_id):
+        """Заполнение одной строки пула"""
+        index = self.top + slot
+        text, values, tags = self.row_getter(index)
+        if index in self.selected:
+            tags = ('highlight',)
+        self.tree.item(item_id, text=text, values=values, tags=tags)
+
+    def update_scrollbar(self):
+        """Синхронизация вертикальной полосы прокрутки"""
+        if self.count <= 0:
+            self.v_scrollbar.set(0.0, 1.0)
+            return
+        first = self.top / self.count
+        last = min(1.0, (self.top + self.visible) / self.count)
+        self.v_scrollbar.set(first, last)
+
+    def on_configure(self, event=None):
+        """Пересчет количества видимых строк при изменении размера"""
+        visible = self.visible
+        if self.pool:
+            bbox = self.tree.bbox(self.pool[0])
+            if bbox:
+                _, y, _, row_height = bbox
+                if row_height > 0:
+                    visible = max(1, (self.tree.winfo_height() - y) // row_height)
+        else:
+            # Пока строк нет, считаем по высоте шрифта
+            visible = max(1, self.tree.winfo_height() // 20)
+
+        if visible != self.visible:
+            self.visible = visible
+            self.top = max(0, min(self.top, self.count - self.visible))
+            self.render()
+
+    def yview(self, *args):
+        """Обработчик полосы прокрутки (moveto / scroll)"""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * self.count))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.visible
+            self.scroll_units(amount)
+
+    def yview_scroll(self, number, what):
+        """Совместимость с общим обработчиком колесика мыши"""
+        self.yview('scroll', number, what)
+
+    def scroll_units(self, amount):
+        self.scroll_to(self.top + amount)
+        return "break"
+
+    def scroll_to(self, top):
+        """Прокрутка так, чтобы строка top была первой видимой"""
+        top = max(0, min(top, self.count - self.visible))
+        if top != self.top:
+            self.top = top
+            self.render()
+        return "break"
+
+    def see(self, index):
+        """Прокрутка к строке index, если она не видна"""
+        if index < self.top:
+            self.scroll_to(index)
+        elif index >= self.top + self.visible:
+            self.scroll_to(index - self.visible + 1)
+
+    def index_at(self, y):
+        """Индекс строки данных под координатой y (или None)"""
+        item_id = self.tree.identify_row(y)
+        if not item_id or item_id not in self.pool:
+            return None
+        index = self.top + self.pool.index(item_id)
+        return index if index < self.count else None
+
+    def on_click(self, event, toggle=False, extend=False):
+        """Выделение кликом с поддержкой Ctrl и Shift"""
+        region = self.tree.identify_region(event.x, event.y)
+        if region in ('heading', 'separator'):
+            return None
+
+        self.tree.focus_set()
+        index = self.index_at(event.y)
+        if index is None:
+            return "break"
+
+        if extend and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.selected = set(range(low, high + 1))
+        elif toggle:
+            self.selected ^= {index}
+            self.anchor = index
+        else:
+            self.selected = {index}
+            self.anchor = index
+        self.cursor = index
+
+        self.render()
+        self.event_generate('<<VirtualListSelect>>')
+        return "break"
+
+    def move_cursor(self, delta, event):
+        """Перемещение выделения стрелками (Shift - расширение)"""
+        if self.count == 0:
+            return "break"
+        current = self.cursor if self.cursor is not None else self.top
+        index = max(0, min(self.count - 1, current + delta))
+        if event.state & 0x0001 and self.anchor is not None:
+            low, high = sorted((self.anchor, index))
+            self.selected = set(range(low, high + 1))
+        else:
+            self.selected = {index}
+            self.anchor = index
+        self.cursor = index
+        self.see(index)
+        self.render()
+        self.event_generate('<<VirtualListSelect>>')
+        return "break"
+
+    def visible_range(self):
+        """Индексы строк, отрисованных сейчас"""
+        return range(self.top, self.top + len(self.pool))
+
+    def selection(self):
+        """Отсортированные индексы выделенных строк"""
+        return sorted(self.selected)
+
+    def selection_clear(self):
+        """Снять выделение строк"""
+        if self.selected:
+            self.selected = set()
+            self.render()
+            self.event_generate('<<VirtualListSelect>>')